@@ -1,19 +1,39 @@
 import datetime
+import errno
+import os
+import re
+import sqlite3
+import time
 from pathlib import Path
 from typing import List, Optional
 
 from pythonping import ping
 
+try:
+    from .shell import deltree, find, index, listing, pager, tree, xcopy
+except ImportError:
+    from shell import (  # type: ignore[no-redef]
+        deltree,
+        find,
+        index,
+        listing,
+        pager,
+        tree,
+        xcopy,
+    )
+
 
 class Commands:
     """Commands for the Repl"""
 
     def __init__(self, current_path: Path):
         self.current_path = current_path
+        self.dir_cache = listing.DirCache()
         self.alias = [
             "CD",
             "CLEAR",
             "CLS",
+            "COPY",
             "CWD",
             "DATE",
             "DEL",
@@ -24,6 +44,8 @@ class Commands:
             "EXIT",
             "FIND",
             "IMGVIEW",
+            "INDEX",
+            "MORE",
             "MOVE",
             "PATH",
             "PING",
@@ -34,6 +56,7 @@ class Commands:
             "TIME",
             "TREE",
             "TYPE",
+            "XCOPY",
         ]
 
     def change_dir(self, path: str) -> Path:
@@ -52,64 +75,107 @@ class Commands:
             self.current_path = dir_path.resolve()
         return self.current_path
 
-    def list_dir(self, path: str = "") -> None:
+    def list_dir(
+        self, path: str = "", order: Optional[str] = None, bare: bool = False
+    ) -> None:
         """
-        Lists all the files and directories in the path
+        Lists all the files and directories in the path with their size and
+        time of change, and the totals
 
-        if None then use the current working dir as path
+        if None then use the current working dir as path. Directories are
+        cached until they change, see DirCache.
 
         Args:
             path: path of the specified directory
+            order: letters of the keys to sort by, see sort_entries. Defaults
+                to the order of the directory.
+            bare: only list the names
         """
         if path == "":
             dir_path = self.current_path
         else:
             dir_path = self.current_path.joinpath(path).resolve()
 
-        for dir in dir_path.iterdir():
-            print(dir.name)
+        try:
+            entries = self.dir_cache.list(str(dir_path))
+        except OSError as error:
+            print(f"{path} cannot be listed: {error.strerror}")
+            return
+        if order is not None:
+            entries = listing.sort_entries(entries, order)
+        if bare:
+            for name, _, _, _ in entries:
+                print(name)
+            return
 
-    def tree(self, path: Path, level: int = 0, infix: str = "├──") -> None:
+        print(f" Directory of {dir_path}\n")
+        files = dirs = total = 0
+        for name, is_dir, size, mtime in entries:
+            date = datetime.datetime.fromtimestamp(mtime).strftime("%d-%m-%Y  %H:%M")
+            if is_dir:
+                dirs += 1
+                print(f"{date}    <DIR>          {name}")
+            else:
+                files += 1
+                total += size
+                print(f"{date}    {size:>14,} {name}")
+        print(f"{files:>16} File(s) {total:>14,} bytes")
+        print(f"{dirs:>16} Dir(s)")
+
+    def dir_cache_stats(self) -> None:
+        """Prints how often DIR was served from the directory cache"""
+        cache = self.dir_cache
+        watching = "inotify" if cache.inotify is not None else "time of change"
+        print(
+            f"Directory cache: {cache.hits} hits, {cache.misses} misses,"
+            f" {len(cache.dirs)} directories cached, changes found by {watching}"
+        )
+
+    def tree(
+        self,
+        path: str = "",
+        depth: Optional[int] = None,
+        files_only: bool = False,
+        sizes: bool = False,
+    ) -> None:
         """
         Makes a tree view of all files and directories
 
+        Lines are printed as the directories are read, so large trees start
+        showing right away.
+
         Args:
-            path: path of the specified directory
+            path: path of the specified directory, the current directory if empty
+            depth: levels of subdirectories to show, all if None
+            files_only: only list the files, with their path from the directory
+            sizes: show the size of every file
         """
-        path = self.current_path.joinpath(path).resolve()
-        if path.is_dir():
-            if level == 0:
-                print("{}{}{}".format("", "└──", str(path.name)))
-            else:
-                print(
-                    "{}{}{}".format(
-                        "    " + (level - 1) * "│   ", "├──", str(path.name)
-                    )
-                )
-            childs = [child for child in path.glob("*")]
-            if childs == []:
-                level -= 1
-                return
-            last_child = childs.pop()
-            for child in childs:
-                level += 1
-                self.tree(child, level)
-                level -= 1
-            self.tree(last_child, level + 1, infix="└──")
-        else:
-            print("{}{}{}".format("    " + (level - 1) * "│   ", infix, str(path.name)))
-        level -= 1
+        root = self.current_path.joinpath(path).resolve()
+        if not root.exists():
+            print(f"{path} does not exist")
+            return
+        for line in tree.tree_lines(root, depth, files_only, sizes):
+            print(line)
 
-    def show_file_content(self, path: str) -> None:
+    def show_file_content(self, path: str, paged: bool = False) -> None:
         """
         Get the file content and show it in the REPL
 
+        The file is read and printed in chunks, so files of any size can be
+        shown. Bytes that are no UTF-8 and control characters are replaced.
+
         Args:
             path: path of the specified file
+            paged: show the file a screen at a time, see Pager
         """
         path_obj = self.current_path.joinpath(path).resolve()
-        with path_obj.open("r") as f:
-            print(f.read())
+        if not path_obj.is_file():
+            print(f"{path} is not a file")
+            return
+        if paged:
+            pager.page_file(path_obj)
+        else:
+            pager.print_file(path_obj)
 
     def delete_file(self, file_paths: List[str]) -> None:
         """
@@ -125,20 +191,24 @@ class Commands:
             else:
                 print(f"{str(path)} is not a file")
 
-    def del_tree(self, dir_path: str) -> None:
+    def del_tree(self, dir_path: str, workers: int = deltree.DELETE_WORKERS) -> None:
         """
-        Delete directory and its files recursively
+        Delete directory and its files recursively, see TreeDeleter
+
+        Symbolic links are deleted, never followed.
 
         Args:
-            path: path of directory
+            dir_path: path of directory
+            workers: number of threads deleting
         """
-        path = self.current_path.joinpath(dir_path).resolve()
-        for child in path.glob("*"):
-            if child.is_file():
-                child.unlink()
-            else:
-                self.del_tree(str(child))
-        path.rmdir()
+        path = Path(os.path.abspath(self.current_path.joinpath(dir_path)))
+        if path.is_symlink() or not path.is_dir():
+            print(f"{dir_path} is not a directory")
+            return
+        try:
+            deltree.TreeDeleter(workers).delete(path)
+        except OSError as error:
+            print(f"{dir_path} cannot be deleted: {error.strerror}")
 
     def remove_dir(self, dir: str) -> None:
         """
@@ -210,7 +280,7 @@ class Commands:
                     "The file exists do you want to replace it? (y/n): "
                 ).lower()
                 if reply == "y":
-                    src_path_obj.replace(dest_path_obj)
+                    self.replace_file(src_path_obj, dest_path_obj)
                     break
                 elif reply == "n":
                     print(end="")
@@ -218,7 +288,70 @@ class Commands:
                 else:
                     print("Invalid option please enter the correct option")
         else:
-            src_path_obj.replace(dest_path_obj)
+            self.replace_file(src_path_obj, dest_path_obj)
+
+    def replace_file(self, src: Path, dest: Path) -> None:
+        """
+        Moves a file, copying it and deleting the original if it is moved to
+        another file system
+
+        Args:
+            src: file to move
+            dest: new path of the file
+        """
+        try:
+            src.replace(dest)
+        except OSError as error:
+            if error.errno != errno.EXDEV:
+                raise
+            xcopy.copy_file(src, dest)
+            src.unlink()
+
+    def copy(
+        self,
+        src_path: str,
+        dest_path: str,
+        recursive: bool = False,
+        workers: int = xcopy.COPY_WORKERS,
+    ) -> None:
+        """
+        Copies a file, or the files in a directory, and reports the throughput
+
+        Files are copied inside the kernel where possible, with their
+        permissions and times. Existing files are replaced.
+
+        Args:
+            src_path: file or directory to copy
+            dest_path: the copy, or the directory to copy a file into
+            recursive: also copy the subdirectories of a directory
+            workers: number of threads copying the files of a directory
+        """
+        src = self.current_path.joinpath(src_path).resolve()
+        # Not resolved, so that a link in place of the copy is replaced
+        dest = Path(os.path.abspath(self.current_path.joinpath(dest_path)))
+        if not src.exists():
+            print(f"{src_path} does not exist")
+            return
+        started = time.perf_counter()
+        if src.is_dir():
+            if dest.resolve() == src or src in dest.resolve().parents:
+                print(f"{src_path} cannot be copied into itself")
+                return
+            files, copied, errors = xcopy.copy_tree(src, dest, recursive, workers)
+        else:
+            if dest.is_dir():
+                dest = dest.joinpath(src.name)
+            try:
+                files, copied, errors = 1, xcopy.copy_file(src, dest), 0
+            except OSError as error:
+                print(f"{src_path} cannot be copied: {error.strerror}")
+                return
+        seconds = time.perf_counter() - started
+        speed = copied / max(seconds, 1e-6) / 1024 / 1024
+        line = f"Copied {files:,} files, {copied:,} bytes in {seconds:.1f}s ({speed:,.1f} MB/s)"
+        if errors:
+            line += f", {errors:,} errors"
+        print(line)
 
     def ping_addr(self, addr: str) -> None:
         """
@@ -262,24 +395,87 @@ class Commands:
             if len(exe_files) < 1:
                 print("No .exe files were found!")
 
-    def find_text(self, filename: str, text: str) -> None:
+    def find_text(
+        self,
+        text: str,
+        path: str = "",
+        recursive: bool = False,
+        ignore_case: bool = False,
+        is_regex: bool = False,
+        count: bool = False,
+        workers: Optional[int] = None,
+    ) -> None:
         """
-        Finds specific string in a given file
+        Finds the lines containing a text in a file or in the files of a directory
+
+        The files are searched in a pool of processes and the results are
+        printed in file order as soon as they are found. Binary files are
+        skipped. In a directory with a content index only the files the index
+        lists for the text and the files changed since are searched.
+
+        Args:
+            text: text or regular expression to search for
+            path: file or directory to search, the current directory if empty
+            recursive: also search the subdirectories of a directory
+            ignore_case: match upper and lower case letters alike
+            is_regex: the text is a regular expression
+            count: only print the number of matching lines of every file
+            workers: number of processes to search with, defaults to the
+                number of CPUs
+        """
+        root = self.current_path.joinpath(path).resolve()
+        if not root.exists():
+            print(f"The file {path} does not exist!")
+            return
+        try:
+            regex = find.compile_pattern(text, ignore_case, is_regex)
+        except re.error as error:
+            print(f"Invalid regular expression: {error}")
+            return
+
+        files = index.files_to_search(root, regex, text, is_regex, recursive)
+        found = False
+        for file_path, result in find.map_files(
+            find.search_file, files, regex, count, workers=workers
+        ):
+            if result is None:
+                continue
+            matches, lines = result
+            try:
+                name = str(file_path.relative_to(self.current_path))
+            except ValueError:
+                name = str(file_path)
+            if count:
+                print(f"---------- {name}: {matches}")
+            elif matches:
+                print(f"---------- {name}")
+                for line_no, line in lines:
+                    print(f"[{line_no}]{line}")
+            found = found or matches > 0
+        if not found and not count:
+            print(f"String {text} was not found!")
+
+    def index_dir(self, path: str = "", workers: Optional[int] = None) -> None:
+        """
+        Builds or updates the content index of a directory that FIND uses
 
         Args:
-            text: The string you want to search for.
-            filename: The filename to search the string
+            path: directory to index, the current directory if empty
+            workers: number of processes to read the files with, defaults to
+                the number of CPUs
         """
-        ln_no = 1
-        flag = 0
+        root = self.current_path.joinpath(path).resolve()
+        if not root.is_dir():
+            print(f"{path} is not a directory")
+            return
+        started = time.perf_counter()
         try:
-            with open(filename, "r") as f:
-                for line in f:
-                    if text in line:
-                        ln_no += 1
-                        flag = 1
-                        print(f"String {text} found in line {ln_no}.")
-        except FileNotFoundError:
-            print(f"The file {filename} does not exist!")
-        if flag == 0:
-            print(f"String {text} was not found in the file!")
+            read, removed, total = index.ContentIndex(root).update(workers)
+        except sqlite3.Error as error:
+            print(f"The index could not be updated: {error}")
+            return
+        seconds = time.perf_counter() - started
+        print(
+            f"Indexed {read} files and removed {removed} in {seconds:.1f}s,"
+            f" {total} files in the index"
+        )
@@ -0,0 +1,142 @@
+import argparse
+import contextlib
+import json
+import os
+import platform
+import subprocess
+import tempfile
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+# This module is imported as main.common by the tests and as common when
+# main.py runs, so the packages import it both ways
+
+# Bump when the layout of the benchmark results changes
+RESULTS_VERSION = 1
+
+Results = Dict[str, Any]
+
+
+def default_cache_dir(name: str) -> Path:
+    """
+    Returns the directory a part of BoxOS keeps its cache in
+
+    Args:
+        name: name of the directory in the BoxOS cache, e.g. photos
+    """
+    cache_home = os.environ.get("XDG_CACHE_HOME")
+    if cache_home:
+        return Path(cache_home).joinpath("boxos", name)
+    return Path.home().joinpath(".cache", "boxos", name)
+
+
+def write_atomic(path: Path, text: str) -> None:
+    """
+    Writes a file to a temporary file and renames it over the file, so that
+    it is never seen half written
+
+    Args:
+        path: file to write
+        text: contents of the file
+
+    Raises:
+        OSError: the file could not be written, the temporary file is removed
+    """
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_name, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.unlink(tmp_name)
+        raise
+
+
+def git_commit() -> Optional[str]:
+    """Returns the commit the code is checked out at, if it is a git repository"""
+    try:
+        output = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=Path(__file__).parent,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return output.stdout.strip()
+
+
+def environment(**versions: str) -> Results:
+    """
+    Returns the start of benchmark results, what the results were measured on
+
+    Args:
+        versions: versions of the libraries the benchmark depends on
+    """
+    return {
+        "version": RESULTS_VERSION,
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        **versions,
+        "platform": platform.platform(),
+    }
+
+
+def change(label: str, before: float, after: float) -> str:
+    """
+    Returns a line comparing a time of two benchmark runs
+
+    Args:
+        label: what was measured
+        before: seconds of the earlier run
+        after: seconds of the later run
+    """
+    return "{} {:>9.2f} ms -> {:>9.2f} ms {:>+7.1%}".format(
+        label, before * 1000, after * 1000, after / before - 1
+    )
+
+
+def benchmark_parser(
+    description: str, repeat: int, unit: str = "case"
+) -> argparse.ArgumentParser:
+    """
+    Returns the parser of the options every benchmark takes
+
+    Args:
+        description: what the benchmark measures
+        repeat: default number of runs
+        unit: what every run is repeated for, shown in the help
+    """
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("-o", "--output", type=Path, help="write the results as JSON")
+    parser.add_argument("-c", "--compare", type=Path, help="earlier JSON results")
+    parser.add_argument(
+        "-r", "--repeat", type=int, default=repeat, help="runs per " + unit
+    )
+    return parser
+
+
+def show_results(
+    results: Results,
+    args: argparse.Namespace,
+    report: Callable[[Results], List[str]],
+    compare: Callable[[Results, Results], List[str]],
+) -> None:
+    """
+    Prints the results, saves them and compares them to earlier results as the
+    options of benchmark_parser ask
+
+    Args:
+        results: results of the benchmark
+        args: parsed options
+        report: returns the results as lines of a table
+        compare: returns the changes from earlier results as lines
+    """
+    print("\n".join(report(results)))
+    if args.output is not None:
+        args.output.write_text(json.dumps(results, indent=2))
+    if args.compare is not None:
+        print()
+        print("\n".join(compare(json.loads(args.compare.read_text()), results)))
@@ -1,15 +1,17 @@
 import sys
 from pathlib import Path
-from typing import List
+from typing import List, Optional, Set
 
 import pyfiglet
 from commands import Commands
 from notepad.notepad import NotepadApp
+from photos.gallery import Gallery
 from photos.photos import ImageViewer
 from prompt_toolkit import PromptSession
 from prompt_toolkit.completion import WordCompleter
 from prompt_toolkit.shortcuts import clear
 from prompt_toolkit.styles.style import _MergedStyle
+from shell.args import split_args
 from styles.styles import AppStyles
 
 
@@ -43,14 +45,7 @@ class Repl:
         Returns:
             List[str]: arguments as a list of strings
         """
-        if '"' in input_text:
-            args_list = input_text.strip().split('"')
-            args_list = [i for i in args_list if i != "" and i != " "]
-            args_list = [i.strip() for i in args_list]
-        else:
-            args_list = input_text.strip().split()
-
-        return args_list
+        return split_args(input_text)
 
     def call_commands(self, input_text: str) -> None:
         """
@@ -86,12 +81,27 @@ class Repl:
         elif command == "imgview":
             if command_input:
                 path = self.current_path.joinpath(command_input[0]).resolve()
-                if len(command_input) == 2:
+                if len(command_input) >= 2:
                     mode = command_input[1]
                 else:
                     mode = "ANSI"
+                tolerance = 0
+                dither = False
+                if len(command_input) == 3:
+                    if command_input[2].isdigit():
+                        tolerance = int(command_input[2])
+                    elif command_input[2].upper() == "DITHER":
+                        dither = True
                 if path.exists() and path.is_file():
-                    ImageViewer(path=path, mode=mode, style=style).run_app()
+                    ImageViewer(
+                        path=path,
+                        mode=mode,
+                        style=style,
+                        tolerance=tolerance,
+                        dither=dither,
+                    ).run_app()
+                elif path.is_dir():
+                    Gallery(path=path, style=style, tolerance=tolerance).run_app()
 
         elif command == "cd":
             if command_input:
@@ -101,22 +111,67 @@ class Repl:
             print(self.current_path)
 
         elif command == "dir":
-            if command_input:
-                self.commands.list_dir(command_input[0])
+            args: List[str] = []
+            order = None
+            bare = False
+            stats = False
+            for arg in command_input:
+                option = arg.upper()
+                if option.startswith("/O"):
+                    # /O alone lists directories first, then by name
+                    order = option[2:].lstrip(":") or "GN"
+                elif option == "/B":
+                    bare = True
+                elif option == "/STATS":
+                    stats = True
+                else:
+                    args.append(arg)
+            if stats:
+                self.commands.dir_cache_stats()
+            elif len(args) <= 1:
+                self.commands.list_dir(args[0] if args else "", order, bare)
             else:
-                self.commands.list_dir()
+                print("Usage: DIR [/O[order]] [/B] [/STATS] Optional[path]")
 
         elif command == "tree":
-            if command_input:
-                self.commands.tree(Path(command_input[0]))
+            args = []
+            options: Set[str] = set()
+            depth: Optional[int] = None
+            valid = True
+            remaining = iter(command_input)
+            for arg in remaining:
+                if arg.upper() == "/L":
+                    level = next(remaining, "")
+                    valid = valid and level.isdigit()
+                    depth = int(level) if level.isdigit() else None
+                elif arg.upper() in ["/F", "/S"]:
+                    options.add(arg.upper())
+                else:
+                    args.append(arg)
+            if valid and len(args) <= 1:
+                self.commands.tree(
+                    args[0] if args else "",
+                    depth=depth,
+                    files_only="/F" in options,
+                    sizes="/S" in options,
+                )
             else:
-                self.commands.tree(self.current_path)
+                print("Usage: TREE [/L depth] [/F] [/S] Optional[path]")
 
         elif command == "type":
-            if command_input:
-                self.commands.show_file_content(command_input[0])
+            paged = [arg.upper() for arg in command_input[-2:]] == ["|", "MORE"]
+            if paged:
+                command_input = command_input[:-2]
+            if len(command_input) == 1:
+                self.commands.show_file_content(command_input[0], paged=paged)
             else:
-                print("Usage: TYPE file_name")
+                print("Usage: TYPE file_name Optional[| MORE]")
+
+        elif command == "more":
+            if len(command_input) == 1:
+                self.commands.show_file_content(command_input[0], paged=True)
+            else:
+                print("Usage: MORE file_name")
 
         elif command == "del":
             if command_input:
@@ -136,6 +191,16 @@ class Repl:
             else:
                 print("Usage: MOVE source_path destination_path")
 
+        elif command in ["copy", "xcopy"]:
+            recursive = any(arg.upper() == "/S" for arg in command_input)
+            args = [arg for arg in command_input if arg.upper() != "/S"]
+            if len(args) == 2 and (command == "xcopy" or not recursive):
+                self.commands.copy(args[0], args[1], recursive=recursive)
+            elif command == "xcopy":
+                print("Usage: XCOPY [/S] source_path destination_path")
+            else:
+                print("Usage: COPY source_path destination_path")
+
         elif command == "ping":
             if command_input:
                 self.commands.ping_addr(command_input[0])
@@ -179,10 +244,26 @@ class Repl:
                 print("Usage: TIME Optional[format]")
 
         elif command == "find":
-            if len(command_input) == 2:
-                self.commands.find_text(command_input[0], command_input[1])
+            switches = {"/S", "/I", "/R", "/C"}
+            options = {arg.upper() for arg in command_input if arg.upper() in switches}
+            args = [arg for arg in command_input if arg.upper() not in switches]
+            if 1 <= len(args) <= 2:
+                self.commands.find_text(
+                    args[0],
+                    args[1] if len(args) == 2 else "",
+                    recursive="/S" in options,
+                    ignore_case="/I" in options,
+                    is_regex="/R" in options,
+                    count="/C" in options,
+                )
+            else:
+                print("Usage: FIND [/S] [/I] [/R] [/C] text Optional[path]")
+
+        elif command == "index":
+            if len(command_input) <= 1:
+                self.commands.index_dir(*command_input)
             else:
-                print("Usage: FIND text path_to_file")
+                print("Usage: INDEX Optional[path]")
 
         elif command in ["cls", "clear"]:
             clear()
@@ -0,0 +1,218 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+# Taken before anything else is imported, the child's open time counts from here
+STARTED = time.perf_counter()
+
+try:
+    from ..common import benchmark_parser, change, environment, show_results
+except ImportError:
+    from common import (  # type: ignore[no-redef]
+        benchmark_parser,
+        change,
+        environment,
+        show_results,
+    )
+
+# Size of the generated file, large but below the read-only threshold
+FILE_SIZE = 64 * 1024 * 1024
+
+# Seconds a single open may take before it is given up
+OPEN_TIMEOUT = 120
+
+SOURCE = '''def fibonacci(n: int) -> int:
+    """Returns the n-th Fibonacci number"""
+    a, b = 0, 1
+    for _ in range(n):
+        a, b = b, a + b  # {}
+    return a
+
+'''
+
+
+def write_file(path: Path, size: int) -> None:
+    """
+    Writes a Python file of about the given size, the same on every run
+
+    Args:
+        path: file to write
+        size: size in bytes
+    """
+    with path.open("w") as f:
+        written = 0
+        block = 0
+        while written < size:
+            text = SOURCE.format(block)
+            f.write(text)
+            written += len(text)
+            block += 1
+
+
+def open_file(path: Path) -> Dict[str, float]:
+    """
+    Opens a file in Notepad and closes it once it is highlighted, runs in the child
+
+    Args:
+        path: file to open
+
+    Returns:
+        Dict[str, float]: seconds from the start of the process to the first
+        frame and to the first highlighted frame
+    """
+    from prompt_toolkit.application import Application, create_app_session
+    from prompt_toolkit.input import create_pipe_input
+    from prompt_toolkit.output import DummyOutput
+
+    from .notepad import NotepadApp
+
+    times: Dict[str, float] = {}
+
+    def on_render(app: Application) -> None:
+        """Records the first frame and exits once the text is highlighted"""
+        now = time.perf_counter() - STARTED
+        times.setdefault("first_frame", now)
+        if "highlighted" in times:
+            return
+        if not notepad.lexer_pending:
+            times["highlighted"] = now
+            app.exit()
+
+    with create_pipe_input() as pipe_input:
+        with create_app_session(input=pipe_input, output=DummyOutput()):
+            notepad = NotepadApp(current_path=path.parent, file_name=path)
+            notepad.application.after_render += on_render
+            notepad.run()
+    return times
+
+
+def time_open(path: Path, cache_home: Path) -> Dict[str, float]:
+    """
+    Opens a file in Notepad in a new process
+
+    Args:
+        path: file to open
+        cache_home: cache directory of the process, where the lexer index is kept
+
+    Returns:
+        Dict[str, float]: the times from open_file and the seconds the whole
+        process took
+    """
+    env = dict(os.environ, XDG_CACHE_HOME=str(cache_home))
+    start = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, "-m", "notepad.benchmark", "--open", str(path)],
+        cwd=Path(__file__).parent.parent,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+        timeout=OPEN_TIMEOUT,
+    )
+    times = json.loads(output.stdout.strip().splitlines()[-1])
+    times["process"] = time.perf_counter() - start
+    return times
+
+
+def best(runs: List[Dict[str, float]]) -> Dict[str, float]:
+    """
+    Returns the fastest time of every measurement
+
+    Args:
+        runs: times of the runs
+    """
+    return {key: min(run[key] for run in runs) for key in runs[0]}
+
+
+def run_benchmarks(size: int = FILE_SIZE, repeat: int = 3) -> Dict[str, Any]:
+    """
+    Benchmarks opening a large file, cold without a lexer index and warm with one
+
+    Args:
+        size: size of the generated file in bytes
+        repeat: number of runs of every case, the fastest is reported
+
+    Returns:
+        Dict[str, Any]: the environment and the times of every case
+    """
+    import pygments
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = Path(directory).joinpath("large.py")
+        write_file(path, size)
+        cold = []
+        for run in range(repeat):
+            # Every cold run starts with an empty cache
+            cold.append(time_open(path, Path(directory).joinpath("cold{}".format(run))))
+        warm_cache = Path(directory).joinpath("warm")
+        time_open(path, warm_cache)
+        warm = [time_open(path, warm_cache) for _ in range(repeat)]
+        file_bytes = path.stat().st_size
+
+    return {
+        **environment(pygments=pygments.__version__),
+        "file_bytes": file_bytes,
+        "repeat": repeat,
+        "cases": [
+            dict(best(cold), name="cold"),
+            dict(best(warm), name="warm"),
+        ],
+    }
+
+
+def compare(old: Dict[str, Any], new: Dict[str, Any]) -> List[str]:
+    """
+    Returns a line for every case found in both results with the change in time
+
+    Args:
+        old: results of the earlier run
+        new: results of the later run
+    """
+    old_cases = {case["name"]: case for case in old["cases"]}
+    lines = []
+    for case in new["cases"]:
+        before = old_cases.get(case["name"])
+        if before:
+            for key in ("first_frame", "highlighted"):
+                label = "{:<6} {:<12}".format(case["name"], key)
+                lines.append(change(label, before[key], case[key]))
+    return lines
+
+
+def report(results: Dict[str, Any]) -> List[str]:
+    """
+    Returns the results as lines of a table
+
+    Args:
+        results: results from run_benchmarks
+    """
+    return [
+        "{:<6} first frame {:>9.2f} ms, highlighted {:>9.2f} ms, process {:>9.2f} ms".format(
+            case["name"],
+            case["first_frame"] * 1000,
+            case["highlighted"] * 1000,
+            case["process"] * 1000,
+        )
+        for case in results["cases"]
+    ]
+
+
+if __name__ == "__main__":
+    parser = benchmark_parser("Benchmark opening a file in Notepad", 3)
+    parser.add_argument(
+        "-s", "--size", type=int, default=FILE_SIZE, help="file size in bytes"
+    )
+    parser.add_argument("--open", type=Path, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.open is not None:
+        print(json.dumps(open_file(args.open)))
+        sys.exit()
+
+    show_results(run_benchmarks(args.size, args.repeat), args, report, compare)
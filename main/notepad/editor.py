@@ -0,0 +1,674 @@
+import re
+from functools import lru_cache, partial
+from typing import Callable, List, Optional, Protocol, Tuple
+
+from prompt_toolkit.application.current import get_app
+from prompt_toolkit.data_structures import Point
+from prompt_toolkit.filters import Condition
+from prompt_toolkit.formatted_text import StyleAndTextTuples
+from prompt_toolkit.key_binding import KeyBindings
+from prompt_toolkit.key_binding.key_processor import KeyPressEvent
+from prompt_toolkit.keys import Keys
+from prompt_toolkit.layout.containers import Window
+from prompt_toolkit.layout.controls import UIContent, UIControl
+from prompt_toolkit.layout.margins import NumberedMargin, ScrollbarMargin
+from prompt_toolkit.mouse_events import MouseEvent, MouseEventType
+from pygments.lexer import Lexer
+
+from .highlight import LONG_LINE, Highlighter, lex_line, slice_fragments
+from .piece_table import PieceTable
+from .search import Search, mark_matches
+from .undo import UNDO_BUDGET, Edit, History
+
+# Inserted when Tab is pressed
+INDENT = "    "
+
+# Called after every change with the offset, the removed and the inserted text
+EditHandler = Callable[[int, str, str], None]
+
+# Lexed lines kept in memory
+LINE_CACHE_SIZE = 1024
+
+# Start of a word, where Ctrl + Left and Ctrl + Right move the cursor to
+WORD = re.compile(r"\b\w")
+
+# Line and column in the text
+Position = Tuple[int, int]
+
+
+class Lines(Protocol):
+    """Text the editor can show, a PieceTable or a MappedText"""
+
+    @property
+    def line_count(self) -> int:
+        """Number of lines"""
+
+    def line(self, row: int) -> str:
+        """Returns a line without its newline"""
+
+    def line_length(self, row: int) -> int:
+        """Returns the length of a line without its newline"""
+
+    def line_part(self, row: int, start: int, end: int) -> str:
+        """Returns a range of columns of a line"""
+
+
+class EditorControl(UIControl):
+    """Control that shows the visible lines of an Editor"""
+
+    def __init__(self, editor: "Editor"):
+        """
+        Constructor for class EditorControl
+
+        Args:
+            editor: editor to show
+        """
+        self.editor = editor
+
+    def is_focusable(self) -> bool:
+        """The editor can be focused"""
+        return True
+
+    def create_content(self, width: int, height: int) -> UIContent:
+        """Returns the lines of the text, they are only built when they are shown"""
+        editor = self.editor
+        editor.check_long_lines(height)
+        if editor.long_lines:
+            editor.scroll_to_cursor(width)
+        if editor.highlighter is not None:
+            last_row = max(editor.window.vertical_scroll, editor.row) + height
+            editor.highlighter.update(last_row)
+        if editor.search is not None:
+            editor.search.update()
+        return UIContent(
+            get_line=editor.line_fragments,
+            line_count=editor.lines.line_count,
+            cursor_position=Point(x=editor.col - editor.scroll_col, y=editor.row),
+            show_cursor=True,
+        )
+
+    def mouse_handler(self, mouse_event: MouseEvent) -> object:
+        """Moves the cursor to where the text was clicked"""
+        if mouse_event.event_type != MouseEventType.MOUSE_UP:
+            return NotImplemented
+        editor = self.editor
+        editor.move_to(
+            mouse_event.position.y, mouse_event.position.x + editor.scroll_col
+        )
+        return None
+
+    def get_key_bindings(self) -> KeyBindings:
+        """Returns the key bindings for editing the text"""
+        return self.editor.key_bindings
+
+
+class Editor:
+    """
+    Text editor widget that keeps its text in a PieceTable
+
+    Unlike a TextArea no full copy of the text is made on a change: edits go
+    to the piece table and only the lines that are on the screen are read
+    from it when the editor is drawn. Given other lines, e.g. a MappedText,
+    the editor only shows them and can not change them.
+    """
+
+    def __init__(
+        self,
+        text: str = "",
+        lexer: Optional[Lexer] = None,
+        lines: Optional[Lines] = None,
+        on_change: Optional[Callable[[], None]] = None,
+        undo_budget: int = UNDO_BUDGET,
+    ):
+        """
+        Constructor for class Editor
+
+        Args:
+            text: text to edit
+            lexer: pygments lexer to highlight the lines with
+            lines: read-only lines to show instead of text
+            on_change: called from other threads when the editor has to be redrawn
+            undo_budget: approximate bytes the undo history may use
+        """
+        self.buffer = PieceTable(text)
+        self.lines: Lines = self.buffer if lines is None else lines
+        self.read_only = lines is not None
+        self.edit_handlers: List[EditHandler] = []
+        self.lexer = lexer
+        self.row = 0
+        self.col = 0
+        # Other end of the selection from the cursor, None if nothing is selected
+        self.anchor: Optional[Position] = None
+        # Column the cursor goes back to when moving up and down over short lines
+        self.preferred_col: Optional[int] = None
+        # Lines are not wrapped but scrolled horizontally once a long line is shown
+        self.long_lines = False
+        # First column shown and number of columns shown when lines are not wrapped
+        self.scroll_col = 0
+        self.width = 80
+        # Read-only lines are highlighted on their own as they are shown, the
+        # text is highlighted in the background
+        self.lex_line: Callable[[str], StyleAndTextTuples] = lru_cache(
+            maxsize=LINE_CACHE_SIZE
+        )(self.tokenize)
+        self.highlighter: Optional[Highlighter] = None
+        self.search: Optional[Search] = None
+        self.history: Optional[History] = None
+        if not self.read_only:
+            self.highlighter = Highlighter(self.buffer, lexer, on_change)
+            self.search = Search(self.buffer, on_change)
+            self.history = History(undo_budget)
+            self.edit_handlers.extend(
+                [self.highlighter.edit, self.search.edit, self.history.record]
+            )
+        self.key_bindings = self.make_key_bindings()
+        self.control = EditorControl(self)
+        self.window = Window(
+            content=self.control,
+            left_margins=[NumberedMargin()],
+            right_margins=[ScrollbarMargin(display_arrows=True)],
+            style="class:text-area",
+            wrap_lines=Condition(lambda: not self.long_lines),
+        )
+
+    def __pt_container__(self) -> Window:
+        """Returns the window of the editor"""
+        return self.window
+
+    @property
+    def text(self) -> str:
+        """Whole text of the editor"""
+        return self.buffer.text()
+
+    @property
+    def cursor_offset(self) -> int:
+        """Offset of the cursor in the text"""
+        return self.buffer.offset(self.row, self.col)
+
+    def set_lexer(self, lexer: Optional[Lexer]) -> None:
+        """
+        Highlights the lines with another lexer
+
+        Args:
+            lexer: pygments lexer to highlight the lines with
+        """
+        self.lexer = lexer
+        self.lex_line = lru_cache(maxsize=LINE_CACHE_SIZE)(self.tokenize)
+        if self.highlighter is not None:
+            self.highlighter.set_lexer(lexer)
+
+    def tokenize(self, line: str) -> StyleAndTextTuples:
+        """
+        Returns a line as formatted text highlighted by the lexer
+
+        Args:
+            line: line without its newline
+        """
+        if self.lexer is None:
+            return [("", line)]
+        return lex_line(self.lexer, line)[0]
+
+    def check_long_lines(self, height: int) -> None:
+        """
+        Stops wrapping lines once a line around the cursor or on the screen is
+        so long that laying it out would make drawing slow
+
+        Args:
+            height: number of lines shown
+        """
+        if self.long_lines:
+            return
+        line_count = self.lines.line_count
+        top = self.window.vertical_scroll
+        rows = set(range(max(0, self.row - height), min(self.row + height, line_count)))
+        rows.update(range(top, min(top + height, line_count)))
+        self.long_lines = any(self.lines.line_length(row) > LONG_LINE for row in rows)
+
+    def scroll_to_cursor(self, width: int) -> None:
+        """
+        Scrolls horizontally so that the cursor is shown
+
+        Args:
+            width: number of columns shown
+        """
+        self.width = max(1, width)
+        if self.col < self.scroll_col:
+            self.scroll_col = self.col
+        elif self.col >= self.scroll_col + self.width:
+            self.scroll_col = self.col - self.width + 1
+
+    def line_fragments(self, row: int) -> StyleAndTextTuples:
+        """
+        Returns a line as formatted text, only the columns shown when lines
+        are scrolled horizontally
+
+        Args:
+            row: line number, counting from 0
+        """
+        start, end = 0, -1
+        if self.long_lines:
+            start, end = self.scroll_col, self.scroll_col + self.width
+            if self.lines.line_length(row) > LONG_LINE:
+                # Only the columns shown are read and highlighted
+                fragments = self.lex_line(self.lines.line_part(row, start, end))
+                return self.mark_matches(fragments, row, start, end)
+
+        if self.highlighter is None:
+            fragments = self.lex_line(self.lines.line(row))
+        else:
+            fragments = self.highlighter.line(row) or [("", self.lines.line(row))]
+        if self.long_lines:
+            fragments = slice_fragments(fragments, start, end)
+        return self.mark_matches(fragments, row, start, end)
+
+    def mark_matches(
+        self, fragments: StyleAndTextTuples, row: int, start: int, end: int
+    ) -> StyleAndTextTuples:
+        """
+        Returns a line with the matches of the search and the selection marked
+
+        Args:
+            fragments: columns start to end of the line as formatted text
+            row: line number, counting from 0
+            start, end: range of columns, end is -1 for the whole line
+        """
+        if self.search is not None:
+            spans = self.clip_spans(self.search.line(row), start, end)
+            if spans:
+                current = self.col - start if row == self.row else None
+                fragments = mark_matches(fragments, spans, current)
+        selection = self.selection()
+        if selection is not None and selection[0][0] <= row <= selection[1][0]:
+            (first_row, first_col), (last_row, last_col) = selection
+            span_start = first_col if row == first_row else 0
+            span_end = last_col if row == last_row else self.lines.line_length(row)
+            spans = self.clip_spans([(span_start, span_end)], start, end)
+            if spans and spans[0][0] < spans[0][1]:
+                fragments = mark_matches(fragments, spans, mark="class:selected")
+        return fragments
+
+    @staticmethod
+    def clip_spans(
+        spans: List[Tuple[int, int]], start: int, end: int
+    ) -> List[Tuple[int, int]]:
+        """
+        Returns the parts of spans of columns that are in a range of columns,
+        relative to its start
+
+        Args:
+            spans: ranges of columns of a line
+            start, end: range of columns, end is -1 for the whole line
+        """
+        if end < 0:
+            return spans
+        return [
+            (max(span_start, start) - start, min(span_end, end) - start)
+            for span_start, span_end in spans
+            if span_end > start and span_start < end
+        ]
+
+    def move_to(self, row: int, col: int, keep_preferred: bool = False) -> None:
+        """
+        Moves the cursor, keeping it inside the text, and ends the selection
+
+        Args:
+            row: line number
+            col: column
+            keep_preferred: keep the column to return to on longer lines
+        """
+        self.row = max(0, min(row, self.lines.line_count - 1))
+        self.col = max(0, min(col, self.lines.line_length(self.row)))
+        self.anchor = None
+        if not keep_preferred:
+            self.preferred_col = None
+
+    def move_to_offset(self, offset: int) -> None:
+        """
+        Moves the cursor to an offset in the text
+
+        Args:
+            offset: offset in the text
+        """
+        self.move_to(*self.buffer.position(offset))
+
+    def move_vertically(self, lines: int) -> None:
+        """
+        Moves the cursor up or down, staying in the same column where possible
+
+        Args:
+            lines: number of lines, negative to move up
+        """
+        if self.preferred_col is None:
+            self.preferred_col = self.col
+        self.move_to(self.row + lines, self.preferred_col, keep_preferred=True)
+
+    def page_size(self) -> int:
+        """Returns the number of lines shown in the window"""
+        render_info = self.window.render_info
+        if render_info is None:
+            return 1
+        return max(1, render_info.window_height - 1)
+
+    def replace(self, offset: int, length: int, text: str) -> str:
+        """
+        Replaces a range of the text, every change to the text goes through here
+
+        Args:
+            offset: start of the range
+            length: length of the range
+            text: new text
+
+        Returns:
+            str: the replaced text
+        """
+        self.anchor = None
+        removed = self.buffer.replace(offset, length, text)
+        for handler in self.edit_handlers:
+            handler(offset, removed, text)
+        return removed
+
+    def insert_text(self, text: str) -> None:
+        """
+        Inserts text at the cursor, in place of the selected text, and moves the
+        cursor after it
+
+        Args:
+            text: text to insert
+        """
+        self.delete_selection()
+        offset = self.cursor_offset
+        self.replace(offset, 0, text)
+        self.move_to_offset(offset + len(text))
+
+    def delete_before_cursor(self) -> None:
+        """Deletes the selected text or the character before the cursor"""
+        if self.delete_selection():
+            return
+        offset = self.cursor_offset
+        if offset > 0:
+            self.replace(offset - 1, 1, "")
+            self.move_to_offset(offset - 1)
+
+    def delete_at_cursor(self) -> None:
+        """Deletes the selected text or the character under the cursor"""
+        if not self.delete_selection():
+            self.replace(self.cursor_offset, 1, "")
+
+    def selection(self) -> Optional[Tuple[Position, Position]]:
+        """Returns the start and the end of the selected text, None if there is none"""
+        if self.anchor is None or self.anchor == (self.row, self.col):
+            return None
+        cursor = (self.row, self.col)
+        return (self.anchor, cursor) if self.anchor < cursor else (cursor, self.anchor)
+
+    def selected_text(self) -> Optional[str]:
+        """Returns the selected text, None if there is none"""
+        selection = self.selection()
+        if selection is None:
+            return None
+        (first_row, first_col), (last_row, last_col) = selection
+        if first_row == last_row:
+            return self.lines.line_part(first_row, first_col, last_col)
+        first_length = self.lines.line_length(first_row)
+        parts = [self.lines.line_part(first_row, first_col, first_length)]
+        parts.extend(self.lines.line(row) for row in range(first_row + 1, last_row))
+        parts.append(self.lines.line_part(last_row, 0, last_col))
+        return "\n".join(parts)
+
+    def delete_selection(self) -> bool:
+        """
+        Deletes the selected text
+
+        Returns:
+            bool: True if text was selected
+        """
+        selection = self.selection()
+        if selection is None or self.read_only:
+            return False
+        start = self.buffer.offset(*selection[0])
+        end = self.buffer.offset(*selection[1])
+        self.replace(start, end - start, "")
+        self.move_to_offset(start)
+        return True
+
+    def select(self, move: Callable[[], None]) -> None:
+        """
+        Moves the cursor and selects the text it moves over
+
+        Args:
+            move: function moving the cursor
+        """
+        anchor = (self.row, self.col) if self.anchor is None else self.anchor
+        move()
+        self.anchor = anchor
+
+    def cut(self) -> None:
+        """Moves the selected text to the clipboard"""
+        text = self.selected_text()
+        if text is not None and not self.read_only:
+            get_app().clipboard.set_text(text)
+            self.delete_selection()
+
+    def copy(self) -> None:
+        """Copies the selected text to the clipboard"""
+        text = self.selected_text()
+        if text is not None:
+            get_app().clipboard.set_text(text)
+
+    def paste(self) -> None:
+        """Inserts the text of the clipboard in place of the selected text"""
+        text = get_app().clipboard.get_data().text
+        if text and not self.read_only:
+            self.insert_text(text)
+
+    def make_key_bindings(self) -> KeyBindings:
+        """
+        Creates the key bindings for moving the cursor and editing the text
+
+        Returns:
+            KeyBindings: Returns the key bindings
+        """
+        kb = KeyBindings()
+        moves: Tuple[Tuple[str, Callable[[], None]], ...] = (
+            ("left", self.move_left),
+            ("right", self.move_right),
+            ("up", lambda: self.move_vertically(-1)),
+            ("down", lambda: self.move_vertically(1)),
+            ("pageup", lambda: self.move_vertically(-self.page_size())),
+            ("pagedown", lambda: self.move_vertically(self.page_size())),
+            ("home", lambda: self.move_to(self.row, 0)),
+            ("end", lambda: self.move_to(self.row, self.lines.line_length(self.row))),
+            ("c-home", lambda: self.move_to(0, 0)),
+            ("c-end", self.move_to_end),
+            ("c-left", lambda: self.move_word(forward=False)),
+            ("c-right", lambda: self.move_word(forward=True)),
+        )
+        for key, move in moves:
+            kb.add(key)(self.make_handler(move))
+            # The same move with Shift selects the text
+            kb.add(key.replace("c-", "c-s-") if key.startswith("c-") else "s-" + key)(
+                self.make_handler(partial(self.select, move))
+            )
+        kb.add("escape", "b")(self.make_handler(lambda: self.move_word(forward=False)))
+        kb.add("escape", "f")(self.make_handler(lambda: self.move_word(forward=True)))
+        kb.add("escape", "w")(self.make_handler(self.copy))
+
+        editable = Condition(lambda: not self.read_only)
+
+        @kb.add(Keys.Any, filter=editable)
+        def _insert(event: KeyPressEvent) -> None:
+            """
+            Inserts a typed character
+
+            Args:
+                event: Takes an KeyPress event
+            """
+            if event.data.isprintable():
+                self.insert_text(event.data * event.arg)
+
+        @kb.add(Keys.BracketedPaste, filter=editable)
+        def _paste(event: KeyPressEvent) -> None:
+            """
+            Inserts pasted text
+
+            Args:
+                event: Takes an KeyPress event
+            """
+            self.insert_text(event.data.replace("\r\n", "\n").replace("\r", "\n"))
+
+        edits: Tuple[Tuple[str, Callable[[], None]], ...] = (
+            ("enter", lambda: self.insert_text("\n")),
+            ("tab", lambda: self.insert_text(INDENT)),
+            ("backspace", self.delete_before_cursor),
+            ("delete", self.delete_at_cursor),
+            ("c-z", self.undo),
+            ("c-y", self.redo),
+            ("c-x", self.cut),
+            ("s-delete", self.cut),
+            ("c-w", self.cut),
+            ("c-v", self.paste),
+        )
+        for key, edit in edits:
+            kb.add(key, filter=editable)(self.make_handler(edit))
+        return kb
+
+    @staticmethod
+    def make_handler(action: Callable[[], None]) -> Callable[[KeyPressEvent], None]:
+        """
+        Returns a key handler that runs an action
+
+        Args:
+            action: function to run when the key is pressed
+        """
+
+        def handler(event: KeyPressEvent) -> None:
+            """
+            Runs the action
+
+            Args:
+                event: Takes an KeyPress event
+            """
+            action()
+
+        return handler
+
+    def move_to_end(self) -> None:
+        """Moves the cursor to the end of the text"""
+        last = self.lines.line_count - 1
+        self.move_to(last, self.lines.line_length(last))
+
+    def move_left(self) -> None:
+        """Moves the cursor one character to the left, to the previous line at the start"""
+        if self.col > 0:
+            self.move_to(self.row, self.col - 1)
+        elif self.row > 0:
+            self.move_to(self.row - 1, self.lines.line_length(self.row - 1))
+
+    def move_right(self) -> None:
+        """Moves the cursor one character to the right, to the next line at the end"""
+        if self.col < self.lines.line_length(self.row):
+            self.move_to(self.row, self.col + 1)
+        elif self.row < self.lines.line_count - 1:
+            self.move_to(self.row + 1, 0)
+
+    def move_word(self, forward: bool) -> None:
+        """
+        Moves the cursor to the start of the next or the previous word, to the
+        end of the line or the next line where there is none
+
+        Args:
+            forward: move to the next word, else to the previous one
+        """
+        line = self.lines.line(self.row)
+        if forward:
+            match = WORD.search(line, self.col + 1)
+            if match is not None:
+                self.move_to(self.row, match.start())
+            elif self.col < len(line):
+                self.move_to(self.row, len(line))
+            elif self.row < self.lines.line_count - 1:
+                self.move_to(self.row + 1, 0)
+        else:
+            starts = [match.start() for match in WORD.finditer(line, 0, self.col)]
+            if starts:
+                self.move_to(self.row, starts[-1])
+            elif self.col > 0:
+                self.move_to(self.row, 0)
+            elif self.row > 0:
+                self.move_to(self.row - 1, self.lines.line_length(self.row - 1))
+
+    def apply_history(self, edit: Optional[Edit]) -> None:
+        """
+        Makes an edit from the undo history without recording it again
+
+        Args:
+            edit: offset, text to remove and text to insert
+        """
+        if edit is None or self.history is None:
+            return
+        offset, removed, inserted = edit
+        self.history.applying = True
+        try:
+            self.replace(offset, len(removed), inserted)
+        finally:
+            self.history.applying = False
+        self.move_to_offset(offset + len(inserted))
+
+    def undo(self) -> None:
+        """Reverts the last edit"""
+        if self.history is not None:
+            self.apply_history(self.history.undo())
+
+    def redo(self) -> None:
+        """Makes the last reverted edit again"""
+        if self.history is not None:
+            self.apply_history(self.history.redo())
+
+    def find(self, forward: bool = True) -> bool:
+        """
+        Moves the cursor to the next match of the search
+
+        Args:
+            forward: find the next match, else the previous one
+
+        Returns:
+            bool: True if a match was found
+        """
+        if self.search is None:
+            return False
+        col = self.col + 1 if forward else self.col
+        match = self.search.find(self.row, col, forward)
+        if match is None:
+            return False
+        row, (start, _) = match
+        self.move_to(row, start)
+        return True
+
+    def replace_all(self, replacement: str) -> int:
+        """
+        Replaces every match of the search in a single edit
+
+        Args:
+            replacement: new text, with group references like \\1 for a
+                regular expression
+
+        Returns:
+            int: number of replaced matches
+        """
+        if self.search is None:
+            return 0
+        edit = self.search.replace_all(replacement)
+        if edit is None:
+            return 0
+        offset, length, text, count = edit
+        row, col = self.row, self.col
+        self.replace(offset, length, text)
+        self.move_to(row, col)
+        return count
+
+    def close(self) -> None:
+        """Stops highlighting and searching in the background"""
+        if self.highlighter is not None:
+            self.highlighter.close()
+        if self.search is not None:
+            self.search.close()
@@ -0,0 +1,383 @@
+import threading
+from functools import lru_cache
+from typing import Callable, List, Optional, Tuple
+
+from prompt_toolkit.formatted_text import StyleAndTextTuples
+from prompt_toolkit.lexers.pygments import pygments_token_to_classname
+from pygments.lexer import Lexer, RegexLexer
+from pygments.token import Error, Whitespace, _TokenType
+
+from .piece_table import PieceTable
+
+# Most lines handed to the highlighting thread at once
+JOB_LINES = 256
+
+# Lines longer than this are only highlighted where they are shown, on their own
+LONG_LINE = 10000
+
+# Stack of lexer states at the end of a line, None for lexers without states
+State = Optional[Tuple[str, ...]]
+
+# The state of the first line
+ROOT = ("root",)
+
+# Marks a line that has no highlighting to compare the state with
+UNKNOWN = object()
+
+# Generation of the lexer, the lexer, first line, its state, the lines and the
+# state the line after each of them was highlighted with, or UNKNOWN
+Job = Tuple[int, Lexer, int, State, List[str], List[object]]
+
+# Generation of the lexer, first line and the highlighted lines with their end state
+Result = Tuple[int, int, List[Tuple[StyleAndTextTuples, State]]]
+
+
+@lru_cache(maxsize=None)
+def style_class(token: _TokenType) -> str:
+    """
+    Returns the prompt_toolkit style class of a pygments token
+
+    Args:
+        token: pygments token type
+    """
+    return "class:" + pygments_token_to_classname(token)
+
+
+def has_states(lexer: Lexer) -> bool:
+    """
+    Returns True if a line can be lexed starting from the state the line
+    before ended in
+
+    Args:
+        lexer: pygments lexer
+    """
+    return (
+        isinstance(lexer, RegexLexer)
+        and type(lexer).get_tokens_unprocessed is RegexLexer.get_tokens_unprocessed
+    )
+
+
+def lex_states(
+    lexer: RegexLexer, text: str, stack: Tuple[str, ...]
+) -> Tuple[List[Tuple[_TokenType, str]], Tuple[str, ...]]:
+    """
+    Lexes text like RegexLexer.get_tokens_unprocessed, but also returns the
+    stack of states at the end
+
+    Args:
+        lexer: pygments lexer
+        text: text to lex
+        stack: stack of states to start with
+
+    Returns:
+        Tuple[List[Tuple[_TokenType, str]], Tuple[str, ...]]: the tokens and
+        the stack of states at the end of the text
+    """
+    tokens: List[Tuple[_TokenType, str]] = []
+    pos = 0
+    tokendefs = lexer._tokens
+    statestack = list(stack)
+    statetokens = tokendefs[statestack[-1]]
+    while True:
+        for rexmatch, action, new_state in statetokens:
+            m = rexmatch(text, pos)
+            if m:
+                if action is not None:
+                    if type(action) is _TokenType:
+                        tokens.append((action, m.group()))
+                    else:
+                        tokens.extend(
+                            (token, value) for _, token, value in action(lexer, m)
+                        )
+                pos = m.end()
+                if new_state is not None:
+                    if isinstance(new_state, tuple):
+                        for state in new_state:
+                            if state == "#pop":
+                                if len(statestack) > 1:
+                                    statestack.pop()
+                            elif state == "#push":
+                                statestack.append(statestack[-1])
+                            else:
+                                statestack.append(state)
+                    elif isinstance(new_state, int):
+                        if abs(new_state) >= len(statestack):
+                            del statestack[1:]
+                        else:
+                            del statestack[new_state:]
+                    elif new_state == "#push":
+                        statestack.append(statestack[-1])
+                    statetokens = tokendefs[statestack[-1]]
+                break
+        else:
+            if pos >= len(text):
+                break
+            if text[pos] == "\n":
+                # At the end of a line without a match the lexer starts again
+                statestack = ["root"]
+                statetokens = tokendefs["root"]
+                tokens.append((Whitespace, "\n"))
+            else:
+                tokens.append((Error, text[pos]))
+            pos += 1
+    return tokens, tuple(statestack)
+
+
+def lex_line(
+    lexer: Lexer, line: str, state: State = None
+) -> Tuple[StyleAndTextTuples, State]:
+    """
+    Returns a line as formatted text highlighted by a lexer
+
+    Args:
+        lexer: pygments lexer
+        line: line without its newline
+        state: state the line before ended in, None to lex the line on its own
+
+    Returns:
+        Tuple[StyleAndTextTuples, State]: the formatted text and the state the
+        line ends in
+    """
+    if state is None:
+        tokens = list(lexer.get_tokens(line))
+    else:
+        tokens, state = lex_states(lexer, line + "\n", state)
+    fragments: StyleAndTextTuples = [
+        (style_class(token), value) for token, value in tokens
+    ]
+    # The lexed text always ends with a newline
+    if fragments and fragments[-1][1].endswith("\n"):
+        last = fragments.pop()
+        if last[1] != "\n":
+            fragments.append((last[0], last[1][:-1]))
+    return fragments, state
+
+
+def slice_fragments(
+    fragments: StyleAndTextTuples, start: int, end: int
+) -> StyleAndTextTuples:
+    """
+    Returns a range of columns of a line given as formatted text
+
+    Args:
+        fragments: the line as formatted text
+        start, end: range of columns
+    """
+    sliced: StyleAndTextTuples = []
+    position = 0
+    for fragment in fragments:
+        style, text = fragment[0], fragment[1]
+        fragment_end = position + len(text)
+        if fragment_end > start and position < end:
+            before, after = max(start - position, 0), min(end, fragment_end) - position
+            sliced.append((style, text[before:after]))
+        position = fragment_end
+        if position >= end:
+            break
+    return sliced
+
+
+class Highlighter:
+    """
+    Highlights the lines of a PieceTable on a background thread
+
+    The state of the lexer at the start of every line is kept, so after an
+    edit the lines are lexed again from the first changed line only until the
+    lexer is back in the state the following lines were highlighted with.
+    Lines are only highlighted up to the end of the window, and lines that are
+    not highlighted yet are shown plain.
+    """
+
+    def __init__(
+        self,
+        buffer: PieceTable,
+        lexer: Optional[Lexer] = None,
+        on_change: Optional[Callable[[], None]] = None,
+    ):
+        """
+        Constructor for class Highlighter
+
+        Args:
+            buffer: text to highlight
+            lexer: pygments lexer to highlight the lines with
+            on_change: called from the highlighting thread when lines were highlighted
+        """
+        self.buffer = buffer
+        self.on_change = on_change
+        self.generation = 0
+        self.pending: Optional[Job] = None
+        self.result: Optional[Result] = None
+        self.busy = False
+        self.closed = False
+        self.condition = threading.Condition()
+        self.thread: Optional[threading.Thread] = None
+        self.set_lexer(lexer)
+
+    def set_lexer(self, lexer: Optional[Lexer]) -> None:
+        """
+        Highlights the lines with another lexer, from the start
+
+        Args:
+            lexer: pygments lexer to highlight the lines with
+        """
+        self.lexer = lexer
+        line_count = self.buffer.line_count
+        # Highlighted lines, None where a line is not highlighted or was changed
+        self.tokens: List[Optional[StyleAndTextTuples]] = [None] * line_count
+        # State the lexer is in at the start of every line
+        self.states: List[State] = [None] * line_count
+        if lexer is not None and has_states(lexer):
+            self.states[0] = ROOT
+        # Lines before the frontier are highlighted from the right state
+        self.frontier = 0
+        # Lines of the running job from here on were changed
+        self.limit = 0
+        with self.condition:
+            # Results of the old lexer are thrown away
+            self.generation += 1
+
+    def line(self, row: int) -> Optional[StyleAndTextTuples]:
+        """
+        Returns a highlighted line, None if it is not highlighted yet
+
+        Args:
+            row: line number, counting from 0
+        """
+        if row < len(self.tokens):
+            return self.tokens[row]
+        return None
+
+    def edit(self, offset: int, removed: str, inserted: str) -> None:
+        """
+        Marks the changed lines, an edit handler of the Editor
+
+        Args:
+            offset: offset of the edit
+            removed: removed text
+            inserted: inserted text
+        """
+        row = self.buffer.position(offset)[0]
+        end = row + removed.count("\n") + 1
+        added = inserted.count("\n")
+        self.tokens[row:end] = [None] * (added + 1)
+        # The state at the start of the first changed line stays the same
+        first = row + 1
+        self.states[first:end] = [None] * added
+        self.frontier = min(self.frontier, row)
+        self.limit = min(self.limit, row)
+
+    def update(self, last_row: int) -> None:
+        """
+        Takes in the lines highlighted so far and hands the next lines to the
+        highlighting thread, called before the editor is drawn
+
+        Args:
+            last_row: last line that may be shown
+        """
+        with self.condition:
+            result, self.result = self.result, None
+            idle = self.pending is None and not self.busy and not self.closed
+        if result is not None:
+            self.apply(*result)
+        line_count = len(self.tokens)
+        start = self.frontier
+        lexer = self.lexer
+        if lexer is None or not idle or start >= line_count or start > last_row:
+            return
+
+        end = min(start + JOB_LINES, line_count)
+        # Long lines are highlighted as they are shown and left out here
+        lines = [
+            self.buffer.line(row) if self.buffer.line_length(row) <= LONG_LINE else ""
+            for row in range(start, end)
+        ]
+        stops = [
+            UNKNOWN if self.tokens[row] is None else self.states[row]
+            for row in range(start + 1, end)
+        ]
+        stops.append(UNKNOWN)
+        self.limit = end
+        with self.condition:
+            self.pending = (
+                self.generation,
+                lexer,
+                start,
+                self.states[start],
+                lines,
+                stops,
+            )
+            self.condition.notify()
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+
+    def apply(
+        self,
+        generation: int,
+        start: int,
+        lines: List[Tuple[StyleAndTextTuples, State]],
+    ) -> None:
+        """
+        Stores highlighted lines that were not changed since they were handed out
+
+        Args:
+            generation: generation of the lexer the lines were highlighted with
+            start: first line
+            lines: highlighted lines and the state each of them ends in
+        """
+        if generation != self.generation or start != self.frontier:
+            return
+        for row, (fragments, state) in enumerate(lines, start):
+            if row >= self.limit:
+                return
+            self.tokens[row] = fragments
+            self.frontier = row + 1
+            if self.frontier == len(self.tokens):
+                return
+            following = self.frontier
+            if self.states[following] == state and self.tokens[following] is not None:
+                # The following lines were highlighted from this state before
+                try:
+                    self.frontier = self.tokens.index(None, self.frontier)
+                except ValueError:
+                    self.frontier = len(self.tokens)
+                return
+            self.states[self.frontier] = state
+
+    def run(self) -> None:
+        """Highlights the handed out lines, runs in the highlighting thread"""
+        while True:
+            with self.condition:
+                while self.pending is None and not self.closed:
+                    self.condition.wait()
+                if self.closed or self.pending is None:
+                    return
+                generation, lexer, start, state, lines, stops = self.pending
+                self.pending = None
+                self.busy = True
+            highlighted = []
+            for line, stop in zip(lines, stops):
+                fragments, state = lex_line(lexer, line, state)
+                highlighted.append((fragments, state))
+                if state == stop:
+                    break
+            with self.condition:
+                self.result = (generation, start, highlighted)
+                self.busy = False
+                self.condition.notify_all()
+            if self.on_change is not None:
+                self.on_change()
+
+    def wait(self) -> None:
+        """Waits until the handed out lines are highlighted"""
+        with self.condition:
+            while self.pending is not None or self.busy:
+                self.condition.wait()
+
+    def close(self) -> None:
+        """Stops the highlighting thread"""
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        if self.thread is not None:
+            self.thread.join()
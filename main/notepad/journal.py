@@ -0,0 +1,252 @@
+import contextlib
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    from ..common import write_atomic
+except ImportError:
+    from common import write_atomic  # type: ignore[no-redef]
+
+# Bump when the format of the journal changes so that old journals are ignored
+JOURNAL_VERSION = 1
+
+# Marks the first line of a journal, only files starting with it are ever removed
+JOURNAL_MAGIC = "boxos-journal"
+
+# Seconds edits are collected before they are written to the journal
+FLUSH_INTERVAL = 0.5
+
+# An edit: offset, length of the removed text and the inserted text
+Record = Tuple[int, int, str]
+
+
+def journal_path(path: Path) -> Path:
+    """
+    Returns the path of the journal of a file, a hidden file next to it
+
+    Args:
+        path: path of the edited file
+    """
+    return path.with_name("." + path.name + ".boxos-journal")
+
+
+def file_header(path: Path) -> Dict[str, Any]:
+    """
+    Returns the header of a journal, which identifies the version of the file
+    the edits apply to
+
+    Args:
+        path: path of the edited file
+    """
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return {
+            "journal": JOURNAL_MAGIC,
+            "version": JOURNAL_VERSION,
+            "size": None,
+            "mtime_ns": None,
+        }
+    return {
+        "journal": JOURNAL_MAGIC,
+        "version": JOURNAL_VERSION,
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+    }
+
+
+def encode(records: List[Record]) -> str:
+    """
+    Returns records as lines of the journal
+
+    Args:
+        records: records to write
+    """
+    return "".join(json.dumps(record) + "\n" for record in records)
+
+
+class Journal:
+    """
+    Append-only journal of the unsaved edits of a file, used to recover after a crash
+
+    Edits are kept as small deltas and appended to the journal in batches by a
+    background thread, so the journal grows with the edits and not with the
+    size of the file. A save starts the journal again from the saved file.
+    """
+
+    def __init__(self, path: Path):
+        """
+        Constructor for class Journal
+
+        Args:
+            path: path of the edited file
+        """
+        self.path = path
+        self.journal_path = journal_path(path)
+        self.header = file_header(path)
+        # Edits since the saved file, the first self.written are in the journal
+        self.records: List[Record] = []
+        self.written = 0
+        # Number of edits that were dropped because they were saved
+        self.base = 0
+        self.lock = threading.Condition()
+        # Held while the journal file is written, so that a rebase waits for it
+        self.io_lock = threading.Lock()
+        self.closed = False
+        # Set when a file that is not a journal is in the way, it is never touched
+        self.foreign = False
+        self.thread: Optional[threading.Thread] = None
+
+    def recover(self) -> List[Record]:
+        """
+        Returns the edits left in the journal by a crash, if they apply to the file
+
+        A journal of another version of the file can not be replayed and is removed.
+        A file that is not a journal is left alone and no journal is kept.
+        """
+        try:
+            with self.journal_path.open("rb") as f:
+                lines = f.read().split(b"\n")
+        except OSError:
+            return []
+
+        try:
+            header = json.loads(lines[0])
+        except ValueError:
+            header = None
+        if not isinstance(header, dict) or header.get("journal") != JOURNAL_MAGIC:
+            self.foreign = True
+            return []
+
+        records: List[Record] = []
+        # The last line is empty, or cut off if the crash was during a write
+        complete = lines[-1] == b""
+        try:
+            if header != self.header:
+                raise ValueError("journal of another version of the file")
+            for line in lines[1:-1]:
+                offset, length, text = json.loads(line)
+                records.append((offset, length, text))
+        except (TypeError, ValueError):
+            complete = False
+        if not records:
+            self.journal_path.unlink(missing_ok=True)
+            return []
+        if not complete:
+            # New edits appended after a cut off line would be lost on the next
+            # recovery, so the journal is written again with the good records
+            text = json.dumps(self.header) + "\n" + encode(records)
+            with contextlib.suppress(OSError):
+                write_atomic(self.journal_path, text)
+
+        self.records = records
+        self.written = len(records)
+        return records
+
+    def record(self, offset: int, removed: str, inserted: str) -> None:
+        """
+        Adds an edit to the journal, typing is merged into a single record
+
+        Args:
+            offset: offset of the edit
+            removed: removed text
+            inserted: inserted text
+        """
+        with self.lock:
+            if self.records and len(self.records) > self.written and not removed:
+                last_offset, last_length, last_text = self.records[-1]
+                if offset == last_offset + len(last_text):
+                    self.records[-1] = (last_offset, last_length, last_text + inserted)
+                    return
+            self.records.append((offset, len(removed), inserted))
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+            if len(self.records) == self.written + 1:
+                # Only wake up the thread for the first edit of a batch
+                self.lock.notify()
+
+    def run(self) -> None:
+        """Writes the new edits in batches, runs in the journal thread"""
+        while True:
+            with self.lock:
+                while len(self.records) == self.written and not self.closed:
+                    self.lock.wait()
+                if self.closed:
+                    return
+                # Collect the edits that follow shortly after
+                self.lock.wait(FLUSH_INTERVAL)
+            self.flush()
+
+    def flush(self) -> None:
+        """Appends the edits that are not in the journal yet"""
+        with self.io_lock:
+            with self.lock:
+                start = self.written
+                batch = self.records[start:]
+                # Merging into the last record stops once it is being written
+                self.written = len(self.records)
+            if not batch or self.foreign:
+                return
+            try:
+                with self.journal_path.open("a", encoding="utf-8") as f:
+                    if start == 0:
+                        f.write(json.dumps(self.header) + "\n")
+                    f.write(encode(batch))
+                    f.flush()
+                    os.fsync(f.fileno())
+            except OSError:
+                return
+
+    def mark(self) -> int:
+        """Returns the number of edits made so far, to pass to rebase after a save"""
+        with self.lock:
+            return self.base + len(self.records)
+
+    def rebase(self, mark: int) -> None:
+        """
+        Starts the journal again from the saved file, keeping the edits made
+        after the saved text was taken
+
+        Args:
+            mark: value of mark() when the saved text was taken
+        """
+        with self.io_lock:
+            with self.lock:
+                saved = mark - self.base
+                del self.records[:saved]
+                self.base = mark
+                self.header = file_header(self.path)
+                records = list(self.records)
+                self.written = len(records)
+            if self.foreign:
+                return
+            if not records:
+                self.journal_path.unlink(missing_ok=True)
+                return
+            text = json.dumps(self.header) + "\n" + encode(records)
+            with contextlib.suppress(OSError):
+                write_atomic(self.journal_path, text)
+
+    def close(self, keep: bool = False) -> None:
+        """
+        Stops the journal and removes it, the edits were saved or thrown away
+
+        Args:
+            keep: write the remaining edits and keep the journal to recover them,
+                used when the editor crashed
+        """
+        with self.lock:
+            self.closed = True
+            self.lock.notify()
+        if self.thread is not None:
+            self.thread.join()
+        if keep:
+            self.flush()
+            return
+        with self.io_lock:
+            if not self.foreign:
+                self.journal_path.unlink(missing_ok=True)
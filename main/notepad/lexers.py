@@ -0,0 +1,173 @@
+import fnmatch
+import importlib
+import json
+import re
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple, Type
+
+import pygments
+from pygments.lexer import Lexer
+from pygments.lexers._mapping import LEXERS
+from pygments.plugin import find_plugin_lexers
+
+try:
+    from ..common import default_cache_dir, write_atomic
+except ImportError:
+    from common import default_cache_dir, write_atomic  # type: ignore[no-redef]
+
+# Bump when the layout of the index changes so that old indexes are rebuilt
+INDEX_VERSION = 1
+
+INDEX_NAME = "lexers.json"
+
+# Module and class name of a lexer
+LexerKey = Tuple[str, str]
+
+# Characters that make a file name pattern a glob
+GLOB_CHARS = re.compile(r"[*?\[]")
+
+
+def rating(lexer: Type[Lexer], pattern: str) -> float:
+    """
+    Returns how well a lexer fits a file matching a pattern
+
+    The same rating find_lexer_class_for_filename uses: the priority of the
+    lexer, plus a bonus for patterns that name a file exactly.
+
+    Args:
+        lexer: lexer class
+        pattern: file name pattern of the lexer
+    """
+    return lexer.priority + (0 if "*" in pattern else 0.5)
+
+
+def build_index() -> Dict[str, Any]:
+    """
+    Returns the file name patterns of all lexers grouped for fast lookup
+
+    Every lexer module is imported once here, so that the lookup itself does
+    not have to import anything.
+    """
+    entries: List[Tuple[str, float, str, str]] = []
+    for name, (module, _, _, patterns, _) in LEXERS.items():
+        if patterns:
+            lexer = getattr(importlib.import_module(module), name)
+            entries.extend(
+                (pattern, rating(lexer, pattern), module, name) for pattern in patterns
+            )
+    for lexer in find_plugin_lexers():
+        entries.extend(
+            (pattern, rating(lexer, pattern), lexer.__module__, lexer.__name__)
+            for pattern in lexer.filenames
+        )
+
+    names: Dict[str, List[Any]] = {}
+    extensions: Dict[str, List[Any]] = {}
+    globs: List[Any] = []
+    for pattern, score, module, name in entries:
+        candidate = [score, module, name]
+        if not GLOB_CHARS.search(pattern):
+            names.setdefault(pattern, []).append(candidate)
+        elif pattern.startswith("*.") and not GLOB_CHARS.search(pattern[1:]):
+            extensions.setdefault(pattern[1:], []).append(candidate)
+        else:
+            globs.append([pattern] + candidate)
+    return {
+        "version": INDEX_VERSION,
+        "pygments": pygments.__version__,
+        "names": names,
+        "extensions": extensions,
+        "globs": globs,
+    }
+
+
+def index_path() -> Path:
+    """Returns the file the lexer index is saved in"""
+    return default_cache_dir("notepad").joinpath(INDEX_NAME)
+
+
+def read_index(path: Path) -> Optional[Dict[str, Any]]:
+    """
+    Returns the saved lexer index, None if it is missing or was built for
+    another version of pygments
+
+    Args:
+        path: file the index is saved in
+    """
+    try:
+        with path.open("r", encoding="utf-8") as f:
+            index = json.load(f)
+        if (
+            index["version"] == INDEX_VERSION
+            and index["pygments"] == pygments.__version__
+        ):
+            return index
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    return None
+
+
+@lru_cache(maxsize=None)
+def load_index(path: Path) -> Dict[str, Any]:
+    """
+    Returns the saved lexer index, building and saving it if it is missing or
+    was built for another version of pygments
+
+    Args:
+        path: file the index is saved in
+    """
+    index = read_index(path)
+    if index is not None:
+        return index
+
+    index = build_index()
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        write_atomic(path, json.dumps(index))
+    except OSError:
+        pass
+    return index
+
+
+def find_lexer(
+    file_name: str, index: Optional[Dict[str, Any]] = None
+) -> Optional[LexerKey]:
+    """
+    Returns the lexer for a file name without importing it
+
+    Picks the same lexer as pygments' find_lexer_class_for_filename.
+
+    Args:
+        file_name: name of the file
+        index: lexer index. Defaults to the index saved in default_cache_dir("notepad").
+    """
+    if index is None:
+        index = load_index(index_path())
+    candidates = list(index["names"].get(file_name, []))
+    for position, char in enumerate(file_name):
+        if char == ".":
+            candidates.extend(index["extensions"].get(file_name[position:], []))
+    for pattern, *candidate in index["globs"]:
+        if fnmatch.fnmatchcase(file_name, pattern):
+            candidates.append(candidate)
+    if not candidates:
+        return None
+    _, module, name = max(
+        candidates, key=lambda candidate: (candidate[0], candidate[2])
+    )
+    return module, name
+
+
+def load_lexer(key: LexerKey) -> Optional[Type[Lexer]]:
+    """
+    Imports a lexer class
+
+    Args:
+        key: module and class name of the lexer
+    """
+    module, name = key
+    try:
+        return getattr(importlib.import_module(module), name)
+    except (ImportError, AttributeError):
+        return None
@@ -0,0 +1,151 @@
+import mmap
+import threading
+from array import array
+from functools import lru_cache
+from itertools import accumulate, count, repeat
+from operator import add
+from pathlib import Path
+from typing import Callable, Optional, Tuple
+
+# Every INDEX_STEP-th line start is kept in the index, lines in between are found
+# by searching from the nearest indexed line
+INDEX_STEP = 256
+
+# Bytes read at once when the index is built
+READ_CHUNK = 4 * 1024 * 1024
+
+# Longest part of a line that is decoded, the rest of the line is not shown
+LINE_LIMIT = 64 * 1024
+
+# Decoded lines kept in memory
+LINE_CACHE_SIZE = 1024
+
+
+class MappedText:
+    """
+    Read-only lines of a file that is memory-mapped instead of read into memory
+
+    A background thread reads the file once to build a sparse index of line
+    starts. Only the pages of the lines that are shown are touched in the
+    mapping, so the memory use does not depend on the size of the file.
+    """
+
+    def __init__(self, path: Path, on_progress: Optional[Callable[[], None]] = None):
+        """
+        Constructor for class MappedText
+
+        Args:
+            path: file to show
+            on_progress: called from the indexing thread when more lines are known
+        """
+        self.path = path
+        self.on_progress = on_progress
+        self.file = path.open("rb")
+        self.size = path.stat().st_size
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        # Offset of the start of line 0, INDEX_STEP, 2 * INDEX_STEP, ...
+        self.checkpoints = array("q", [0])
+        self.newlines = 0
+        self.indexed = 0
+        self.done = False
+        self.closed = threading.Event()
+        self.read_line = lru_cache(maxsize=LINE_CACHE_SIZE)(self.decode_line)
+        self.thread = threading.Thread(target=self.build_index, daemon=True)
+        self.thread.start()
+
+    @property
+    def line_count(self) -> int:
+        """Number of lines found so far, all lines once the index is done"""
+        return self.newlines + 1 if self.done else max(1, self.newlines)
+
+    @property
+    def progress(self) -> float:
+        """Part of the file that is indexed, from 0 to 1"""
+        return self.indexed / self.size if self.size else 1.0
+
+    def build_index(self) -> None:
+        """Reads the file in chunks and records every INDEX_STEP-th line start"""
+        with self.path.open("rb") as f:
+            base = 0
+            while not self.closed.is_set():
+                data = f.read(READ_CHUNK)
+                if not data:
+                    break
+                parts = data.split(b"\n")
+                parts.pop()
+                if parts:
+                    # Offsets of the newlines in the chunk, as in Source.scan
+                    newlines = list(map(add, accumulate(map(len, parts)), count(base)))
+                    first = (INDEX_STEP - 1 - self.newlines) % INDEX_STEP
+                    starts = newlines[first::INDEX_STEP]
+                    self.checkpoints.extend(map(add, starts, repeat(1)))
+                    self.newlines += len(parts)
+                base += len(data)
+                self.indexed = base
+                if self.on_progress is not None:
+                    self.on_progress()
+        self.done = not self.closed.is_set()
+        if self.on_progress is not None:
+            self.on_progress()
+
+    def line_range(self, row: int) -> Tuple[int, int]:
+        """
+        Returns the start and end offsets of a line, without its newline
+
+        Args:
+            row: line number, counting from 0
+        """
+        start = self.checkpoints[row // INDEX_STEP]
+        for _ in range(row % INDEX_STEP):
+            start = self.map.find(b"\n", start) + 1
+        end = self.map.find(b"\n", start)
+        return start, self.size if end == -1 else end
+
+    def line(self, row: int) -> str:
+        """
+        Returns a line, an empty string for lines that are not indexed yet
+
+        Args:
+            row: line number, counting from 0
+        """
+        if row >= self.line_count:
+            return ""
+        return self.read_line(row)
+
+    def decode_line(self, row: int) -> str:
+        """
+        Returns a line, decoded from the mapping
+
+        Args:
+            row: line number, counting from 0
+        """
+        start, end = self.line_range(row)
+        end = min(end, start + LINE_LIMIT)
+        line = self.map[start:end].decode("utf-8", errors="replace")
+        return line[:-1] if line.endswith("\r") else line
+
+    def line_part(self, row: int, start: int, end: int) -> str:
+        """
+        Returns a range of columns of a line
+
+        Args:
+            row: line number, counting from 0
+            start, end: range of columns
+        """
+        return self.line(row)[start:end]
+
+    def line_length(self, row: int) -> int:
+        """
+        Returns the length of a line
+
+        Args:
+            row: line number, counting from 0
+        """
+        return len(self.line(row))
+
+    def close(self) -> None:
+        """Stops the indexing and closes the file"""
+        self.closed.set()
+        self.thread.join()
+        self.map.close()
+        self.file.close()
@@ -1,12 +1,15 @@
 import argparse
+import re
 from datetime import datetime
+from functools import partial
 from pathlib import Path
 from typing import Optional, Union
 
 from prompt_toolkit.application import Application
 from prompt_toolkit.application.current import get_app
 from prompt_toolkit.buffer import Buffer
-from prompt_toolkit.filters import Condition
+from prompt_toolkit.eventloop import run_in_executor_with_context
+from prompt_toolkit.filters import Condition, has_focus
 from prompt_toolkit.key_binding import KeyBindings
 from prompt_toolkit.key_binding.key_processor import KeyPressEvent
 from prompt_toolkit.layout.containers import (
@@ -18,12 +21,20 @@ from prompt_toolkit.layout.containers import (
 )
 from prompt_toolkit.layout.controls import FormattedTextControl
 from prompt_toolkit.layout.layout import Layout
-from prompt_toolkit.lexers import PygmentsLexer
 from prompt_toolkit.output.color_depth import ColorDepth
 from prompt_toolkit.styles.style import _MergedStyle
 from prompt_toolkit.widgets import MenuContainer, MenuItem, TextArea
-from pygments.lexers import find_lexer_class_for_filename
-from pygments.util import ClassNotFound
+from pygments.lexer import Lexer
+
+from .editor import Editor
+from .journal import Journal
+from .lexers import LexerKey, find_lexer, index_path, load_lexer, read_index
+from .mapped import MappedText
+from .save import Saver
+from .undo import UNDO_BUDGET
+
+# Files of this size or larger are opened read-only without loading them
+VIEW_THRESHOLD = 256 * 1024 * 1024
 
 
 class NotepadApp:
@@ -34,6 +45,8 @@ class NotepadApp:
         current_path: Path,
         file_name: Optional[Union[str, Path]] = None,
         style: Optional[_MergedStyle] = None,
+        view_threshold: int = VIEW_THRESHOLD,
+        undo_budget: int = UNDO_BUDGET,
     ):
         """
         Initialize the class
@@ -42,6 +55,8 @@ class NotepadApp:
             file_name: file to save
             style: Takes in the style. Defaults to {}
             current_path: current path of the REPL
+            view_threshold: size in bytes from which files are opened read-only
+            undo_budget: approximate bytes the undo history may use
         """
         self.current_path = current_path
         if file_name is None:
@@ -51,14 +66,41 @@ class NotepadApp:
                 file_name = Path(file_name)
             self.file_name = self.current_path.joinpath(file_name).resolve()
         self.style = style
+        self.undo_budget = undo_budget
         self.text = ""
         self.lexer = None
         self.show_status_bar = True
         self.ask_for_filename = False
-        self.text = self.get_text_from_file(self.file_name)
-        self.lexer = self.add_lexer(self.file_name)
+        self.ask_for_line = False
+        self.ask_for_find = False
+        self.ask_for_replace = False
+        self.find_regex = False
+        self.find_error = ""
+        # Cursor position when the search started, matches are found from here
+        self.find_origin = (0, 0)
+        self.view: Optional[MappedText] = None
+        self.saver = Saver(on_change=self.invalidate)
+        if self.file_name is not None and self.is_large_file(
+            self.file_name, view_threshold
+        ):
+            self.view = MappedText(self.file_name, on_progress=self.invalidate)
+        else:
+            self.text = self.get_text_from_file(self.file_name)
+        # The lexer is only imported once the first frame is drawn. Building the
+        # lexer index imports every lexer, so without a saved index the lexer
+        # is looked up then too and the text is not highlighted until it is ready
+        self.lexer_key = self.find_lexer_key(self.file_name, build=False)
+        self.lexer_pending = self.file_name is not None
+        self.rendered = False
         self.text_field = self.make_text_field()
+        self.status = ""
+        self.journal: Optional[Journal] = None
+        if self.view is None and self.file_name is not None:
+            self.journal = self.open_journal(self.file_name)
         self.filename_prompt_field = self.make_filename_prompt_field()
+        self.line_prompt_field = self.make_line_prompt_field()
+        self.find_prompt_field = self.make_find_prompt_field()
+        self.replace_prompt_field = self.make_replace_prompt_field()
         self.Key_bindings = self.make_key_bindings()
         self.root_container = self.make_root_container()
         self.application = self.make_application()
@@ -77,6 +119,20 @@ class NotepadApp:
         file_name = args.get("file_name", None)
         return Path(file_name) if file_name is not None else None
 
+    @staticmethod
+    def is_large_file(file_name: Path, view_threshold: int) -> bool:
+        """
+        Returns True if the file should be opened read-only
+
+        Args:
+            file_name: Name of the file to open
+            view_threshold: size in bytes from which files are opened read-only
+        """
+        try:
+            return file_name.stat().st_size >= view_threshold
+        except OSError:
+            return False
+
     @staticmethod
     def get_text_from_file(file_name: Optional[Path]) -> str:
         """
@@ -94,37 +150,105 @@ class NotepadApp:
                 text = f.read()
         return text
 
+    def invalidate(self) -> None:
+        """Redraws the app, can be called from other threads"""
+        if hasattr(self, "application"):
+            self.application.invalidate()
+
+    def open_journal(self, file_name: Path) -> Journal:
+        """
+        Opens the journal of the unsaved edits and replays the edits a crash left in it
+
+        Args:
+            file_name: Name of the edited file
+
+        Returns:
+            Journal: journal the edits of the editor are recorded in
+        """
+        journal = Journal(file_name)
+        records = journal.recover()
+        for offset, length, text in records:
+            self.text_field.replace(offset, length, text)
+        if records:
+            offset, _, text = records[-1]
+            self.text_field.move_to_offset(offset + len(text))
+            self.status = "Recovered {} unsaved edits".format(len(records))
+        self.text_field.edit_handlers.append(journal.record)
+        return journal
+
     def save_file(self) -> None:
         """Saves the file"""
+        if self.view is not None:
+            return
         if self.file_name is not None:
-            with self.file_name.open("w") as f:
-                f.write(self.text_field.text)
+            self.status = ""
+            on_saved = None
+            if self.journal is not None and self.journal.path == self.file_name:
+                # Only the edits made after this point are left unsaved
+                on_saved = partial(self.journal.rebase, self.journal.mark())
+            self.saver.save(self.file_name, self.text_field.buffer.snapshot(), on_saved)
         else:
             self.show_status_bar = False
             self.ask_for_filename = True
             get_app().layout.focus(self.filename_prompt_field)
 
-    def add_lexer(self, file_name: Optional[Path]) -> Optional[PygmentsLexer]:
+    @staticmethod
+    def find_lexer_key(
+        file_name: Optional[Path], build: bool = True
+    ) -> Optional[LexerKey]:
         """
-        Returns the lexer based on the file name
+        Returns the lexer for the file name from the lexer index, without importing it
 
         Args:
             file_name: Takes the name of the file
+            build: build the lexer index if it is not saved yet, else return None
 
         Returns:
-            Optional[PygmentsLexer]: Returns PygmentsLexer class
+            Optional[LexerKey]: module and class name of the lexer
         """
-        lexer_name = None
-        if file_name is not None:
-            try:
-                lexer_name = find_lexer_class_for_filename(file_name.name)
-                if lexer_name is not None:
-                    self.lexer = PygmentsLexer(lexer_name)
+        if file_name is None:
+            return None
+        if not build:
+            index = read_index(index_path())
+            return None if index is None else find_lexer(file_name.name, index)
+        return find_lexer(file_name.name)
+
+    def add_lexer(self) -> Optional[Lexer]:
+        """
+        Imports the lexer found for the file, looking it up first if the lexer
+        index was not ready when the file was opened
 
-            except ClassNotFound:
-                self.lexer = None
+        Returns:
+            Optional[Lexer]: Returns an instance of the pygments lexer
+        """
+        if self.lexer_key is None:
+            self.lexer_key = self.find_lexer_key(self.file_name)
+        if self.lexer_key is not None:
+            lexer_class = load_lexer(self.lexer_key)
+            if lexer_class is not None:
+                self.lexer = lexer_class()
         return self.lexer
 
+    def on_first_render(self, app: Application) -> None:
+        """
+        Starts loading the lexer once the editor is on the screen
+
+        Args:
+            app: the application that was drawn
+        """
+        if self.rendered:
+            return
+        self.rendered = True
+        if self.lexer_pending:
+            app.create_background_task(self.load_lexer())
+
+    async def load_lexer(self) -> None:
+        """Imports the lexer in a thread and highlights the text with it"""
+        lexer = await run_in_executor_with_context(self.add_lexer)
+        self.text_field.set_lexer(lexer)
+        self.lexer_pending = False
+        self.invalidate()
+
     # Adding keybindings
     def make_key_bindings(self) -> KeyBindings:
         """
@@ -155,6 +279,81 @@ class NotepadApp:
             """
             self.save_file()
 
+        @kb.add("c-g")
+        def _go_to_line(event: KeyPressEvent) -> None:
+            """
+            Asks for a line number to move the cursor to
+
+            Args:
+                event: Takes an KeyPress event
+            """
+            self.show_status_bar = False
+            self.ask_for_line = True
+            event.app.layout.focus(self.line_prompt_field)
+
+        @kb.add("c-f")
+        def _find(event: KeyPressEvent) -> None:
+            """
+            Asks for the text to find
+
+            Args:
+                event: Takes an KeyPress event
+            """
+            if self.text_field.search is None:
+                self.status = "Search is not available for read-only files"
+                return
+            self.find_origin = (self.text_field.row, self.text_field.col)
+            self.show_status_bar = False
+            self.ask_for_find = True
+            event.app.layout.focus(self.find_prompt_field)
+
+        @kb.add("escape", "r", filter=has_focus(self.find_prompt_field))
+        def _toggle_regex(event: KeyPressEvent) -> None:
+            """
+            Switches between finding text and a regular expression
+
+            Args:
+                event: Takes an KeyPress event
+            """
+            self.find_regex = not self.find_regex
+            self.start_search(self.find_prompt_field.text)
+
+        @kb.add("f3")
+        def _find_next(event: KeyPressEvent) -> None:
+            """
+            Moves to the next match
+
+            Args:
+                event: Takes an KeyPress event
+            """
+            self.text_field.find()
+
+        @kb.add("f2")
+        def _find_previous(event: KeyPressEvent) -> None:
+            """
+            Moves to the previous match
+
+            Args:
+                event: Takes an KeyPress event
+            """
+            self.text_field.find(forward=False)
+
+        @kb.add("c-r")
+        def _replace(event: KeyPressEvent) -> None:
+            """
+            Asks for the text to replace the matches with
+
+            Args:
+                event: Takes an KeyPress event
+            """
+            search = self.text_field.search
+            if search is None or search.regex is None:
+                self.status = "Press Ctrl+F to find the text to replace first"
+                return
+            self.show_status_bar = False
+            self.ask_for_replace = True
+            event.app.layout.focus(self.replace_prompt_field)
+
         @kb.add("c-c")
         def _focus(event: KeyPressEvent) -> None:
             """Focuses the window
@@ -167,18 +366,18 @@ class NotepadApp:
         return kb
 
     # Make UI elements
-    def make_text_field(self) -> TextArea:
+    def make_text_field(self) -> Editor:
         """Makes text field
 
         Returns:
-            TextArea: returns an instance of text area
+            Editor: returns an instance of the editor
         """
-        return TextArea(
+        return Editor(
             text=self.text,
             lexer=self.lexer,
-            scrollbar=True,
-            line_numbers=True,
-            style="class:text-area",
+            lines=self.view,
+            on_change=self.invalidate,
+            undo_budget=self.undo_budget,
         )
 
     def make_filename_prompt_field(self) -> TextArea:
@@ -210,6 +409,140 @@ class NotepadApp:
             accept_handler=_no_name_handler,
         )
 
+    def make_line_prompt_field(self) -> TextArea:
+        """Creates a Prompt for the line to go to
+
+        Returns:
+            TextArea: Returns TextArea class
+        """
+
+        def _line_handler(buffer: Buffer) -> bool:
+            """Moves the cursor to the line given
+
+            Args:
+                buffer (Buffer): Takes the buffer class
+            Returns:
+                bool: True if text should be kept after accepting else False
+            """
+            line = buffer.text.strip()
+            if line.isdigit():
+                self.text_field.move_to(int(line) - 1, 0)
+            get_app().layout.focus(self.text_field)
+            self.show_status_bar = True
+            self.ask_for_line = False
+            return False
+
+        return TextArea(
+            height=1,
+            multiline=False,
+            wrap_lines=False,
+            accept_handler=_line_handler,
+        )
+
+    def start_search(self, pattern: str) -> None:
+        """
+        Searches for the text in the find prompt and moves to the first match
+
+        Args:
+            pattern: text or regular expression to find
+        """
+        search = self.text_field.search
+        if search is None:
+            return
+        try:
+            search.set_pattern(pattern, self.find_regex)
+        except re.error as e:
+            search.set_pattern("")
+            self.find_error = "Invalid regular expression: {}".format(e.msg)
+            return
+        self.find_error = ""
+        match = search.find(*self.find_origin)
+        if match is not None:
+            row, (start, _) = match
+            self.text_field.move_to(row, start)
+
+    def make_find_prompt_field(self) -> TextArea:
+        """Creates a Prompt for the text to find, matches are found while typing
+
+        Returns:
+            TextArea: Returns TextArea class
+        """
+
+        def _find_handler(buffer: Buffer) -> bool:
+            """Goes back to the editor, F3 moves to the next match
+
+            Args:
+                buffer (Buffer): Takes the buffer class
+            Returns:
+                bool: True if text should be kept after accepting else False
+            """
+            get_app().layout.focus(self.text_field)
+            self.show_status_bar = True
+            self.ask_for_find = False
+            return True
+
+        field = TextArea(
+            height=1,
+            multiline=False,
+            wrap_lines=False,
+            accept_handler=_find_handler,
+        )
+        field.buffer.on_text_changed += lambda buffer: self.start_search(buffer.text)
+        return field
+
+    def make_replace_prompt_field(self) -> TextArea:
+        """Creates a Prompt for the text to replace all matches with
+
+        Returns:
+            TextArea: Returns TextArea class
+        """
+
+        def _replace_handler(buffer: Buffer) -> bool:
+            """Replaces all matches with the text given
+
+            Args:
+                buffer (Buffer): Takes the buffer class
+            Returns:
+                bool: True if text should be kept after accepting else False
+            """
+            try:
+                count = self.text_field.replace_all(buffer.text)
+                self.status = "Replaced {:,} matches".format(count)
+            except re.error as e:
+                self.status = "Invalid replacement: {}".format(e.msg)
+            get_app().layout.focus(self.text_field)
+            self.show_status_bar = True
+            self.ask_for_replace = False
+            return False
+
+        return TextArea(
+            height=1,
+            multiline=False,
+            wrap_lines=False,
+            accept_handler=_replace_handler,
+        )
+
+    def get_find_status(self) -> str:
+        """Returns the number of matches found so far"""
+        search = self.text_field.search
+        if self.find_error or search is None:
+            return self.find_error
+        if search.regex is None:
+            return ""
+        if not search.done:
+            return "{:,} matches, {:.0%}".format(
+                search.found, search.searched / len(search.matches)
+            )
+        return "{:,} matches".format(search.found)
+
+    def get_status(self) -> str:
+        """Returns the state of the save or of a file opened read-only"""
+        if self.view is None:
+            return self.status or self.saver.status
+        if not self.view.done:
+            return "Read only, indexing {:.0%}".format(self.view.progress)
+        return "Read only, {:,} lines".format(self.view.line_count)
+
     def make_body(self) -> HSplit:
         """Returns the body of the program
 
@@ -224,11 +557,16 @@ class NotepadApp:
         def get_pos() -> str:
             """Get line and column number"""
             return "Ln {}, Col {}".format(
-                self.text_field.document.cursor_position_row + 1,
-                self.text_field.document.cursor_position_col + 1,
+                self.text_field.row + 1, self.text_field.col + 1
             )
 
+        def get_find_string() -> str:
+            """Get the label of the find prompt"""
+            return "Find Regex (Alt+R): " if self.find_regex else "Find (Alt+R): "
+
         save_path_string = "Path To Save File: "
+        line_string = "Go To Line: "
+        replace_string = "Replace All With: "
 
         body = HSplit(
             [
@@ -237,6 +575,10 @@ class NotepadApp:
                     content=VSplit(
                         [
                             Window(FormattedTextControl(get_datetime)),
+                            Window(
+                                FormattedTextControl(self.get_status),
+                                align=WindowAlign.CENTER,
+                            ),
                             Window(
                                 FormattedTextControl(get_pos),
                                 width=25,
@@ -261,6 +603,50 @@ class NotepadApp:
                     ),
                     filter=Condition(lambda: self.ask_for_filename),
                 ),
+                ConditionalContainer(
+                    content=VSplit(
+                        [
+                            Window(
+                                FormattedTextControl(line_string),
+                                width=len(line_string),
+                            ),
+                            self.line_prompt_field,
+                        ],
+                        height=1,
+                    ),
+                    filter=Condition(lambda: self.ask_for_line),
+                ),
+                ConditionalContainer(
+                    content=VSplit(
+                        [
+                            Window(
+                                FormattedTextControl(get_find_string),
+                                width=lambda: len(get_find_string()),
+                            ),
+                            self.find_prompt_field,
+                            Window(
+                                FormattedTextControl(self.get_find_status),
+                                width=40,
+                                align=WindowAlign.RIGHT,
+                            ),
+                        ],
+                        height=1,
+                    ),
+                    filter=Condition(lambda: self.ask_for_find),
+                ),
+                ConditionalContainer(
+                    content=VSplit(
+                        [
+                            Window(
+                                FormattedTextControl(replace_string),
+                                width=len(replace_string),
+                            ),
+                            self.replace_prompt_field,
+                        ],
+                        height=1,
+                    ),
+                    filter=Condition(lambda: self.ask_for_replace),
+                ),
             ],
             style="class:body",
         )
@@ -293,6 +679,14 @@ class NotepadApp:
                         MenuItem("Exit", handler=exit_app),
                     ],
                 ),
+                MenuItem(
+                    "Edit  ",
+                    children=[
+                        MenuItem("Cut", handler=self.text_field.cut),
+                        MenuItem("Copy", handler=self.text_field.copy),
+                        MenuItem("Paste", handler=self.text_field.paste),
+                    ],
+                ),
                 MenuItem(
                     "View  ",
                     children=[MenuItem("Status Bar", handler=status_bar_handler)],
@@ -337,12 +731,21 @@ class NotepadApp:
             style=self.style,
             full_screen=True,
             color_depth=ColorDepth.TRUE_COLOR,
+            after_render=self.on_first_render,
         )
 
     def run(self) -> None:
         """Runs the app"""
-        self.application.run()
-
-
-if __name__ == "__main__":
-    NotepadApp(current_path=Path.cwd()).run()
+        crashed = True
+        try:
+            self.application.run()
+            crashed = False
+        finally:
+            # Do not lose a save that is still being written
+            self.saver.wait()
+            self.text_field.close()
+            if self.journal is not None:
+                # After a crash the journal is kept to recover the unsaved edits
+                self.journal.close(keep=crashed)
+            if self.view is not None:
+                self.view.close()
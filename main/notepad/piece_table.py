@@ -0,0 +1,385 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import accumulate, count
+from operator import add
+from typing import List, NamedTuple, Tuple
+
+# Characters scanned at once when the newline index of a text is extended
+SCAN_CHUNK = 1024 * 1024
+
+# Typed text is appended to the same add buffer until it reaches this length
+ADD_LIMIT = 4096
+
+# Below this length newlines are counted directly instead of with the index
+COUNT_LIMIT = 4096
+
+
+class Source:
+    """Text a piece points into, with a newline index that is built as needed"""
+
+    def __init__(self, text: str = ""):
+        """
+        Constructor for class Source
+
+        Args:
+            text: the text. Only ever grows at the end, so offsets stay valid.
+        """
+        self.text = text
+        self.newlines = array("q")
+        self.scanned = 0
+
+    def scan(self, end: int) -> None:
+        """
+        Extends the newline index until it covers the text up to end
+
+        Args:
+            end: offset the index has to reach
+        """
+        text = self.text
+        while self.scanned < min(end, len(text)):
+            start = self.scanned
+            stop = text.find("\n", start + SCAN_CHUNK)
+            stop = len(text) if stop == -1 else stop + 1
+            parts = text[start:stop].split("\n")
+            parts.pop()
+            # The k-th newline is after the first k + 1 parts and k newlines
+            self.newlines.extend(map(add, accumulate(map(len, parts)), count(start)))
+            self.scanned = stop
+
+    def count_newlines(self, start: int, end: int) -> int:
+        """
+        Returns the number of newlines in text[start:end]
+
+        Args:
+            start, end: range of the text
+        """
+        if end - start < COUNT_LIMIT:
+            return self.text.count("\n", start, end)
+        self.scan(end)
+        return bisect_left(self.newlines, end) - bisect_left(self.newlines, start)
+
+    def nth_newline(self, start: int, n: int) -> int:
+        """
+        Returns the offset of the n-th newline at or after start, counting from 1
+
+        Args:
+            start: offset to start counting from
+            n: number of the newline
+        """
+        self.scan(start)
+        index = bisect_left(self.newlines, start) + n - 1
+        while index >= len(self.newlines) and self.scanned < len(self.text):
+            self.scan(self.scanned + SCAN_CHUNK)
+        return self.newlines[index]
+
+
+class Piece(NamedTuple):
+    """A range of a Source that is part of the text"""
+
+    source: Source
+    start: int
+    end: int
+    newlines: int
+
+    def __len__(self) -> int:
+        """Returns the length of the piece"""
+        return self.end - self.start
+
+    def text(self) -> str:
+        """Returns the text of the piece"""
+        start, end = self.start, self.end
+        return self.source.text[start:end]
+
+    def split(self, at: int) -> Tuple["Piece", "Piece"]:
+        """
+        Returns the two pieces the piece is cut into at an offset
+
+        Args:
+            at: offset in the piece
+        """
+        middle = self.start + at
+        newlines = self.source.count_newlines(self.start, middle)
+        return (
+            Piece(self.source, self.start, middle, newlines),
+            Piece(self.source, middle, self.end, self.newlines - newlines),
+        )
+
+
+class PieceTable:
+    """
+    Editable text stored as pieces of the original text and of added text
+
+    An edit only splits the pieces it touches, so it takes time proportional
+    to the size of the edit and the number of pieces, not to the size of the
+    text. Line numbers are found with the newline count of every piece and the
+    newline index of the texts the pieces point into.
+    """
+
+    def __init__(self, text: str = ""):
+        """
+        Constructor for class PieceTable
+
+        Args:
+            text: original text
+        """
+        self.pieces: List[Piece] = []
+        if text:
+            self.pieces.append(Piece(Source(text), 0, len(text), text.count("\n")))
+        self.added = Source()
+        # Start offset and newlines before every piece, valid up to self.valid
+        self.starts: List[int] = []
+        self.lines_before: List[int] = []
+        self.valid = 0
+        self.length = len(text)
+        self.newlines = sum(piece.newlines for piece in self.pieces)
+
+    def __len__(self) -> int:
+        """Returns the length of the text"""
+        return self.length
+
+    @property
+    def line_count(self) -> int:
+        """Number of lines of the text"""
+        return self.newlines + 1
+
+    def update_index(self) -> None:
+        """Recomputes the start offsets and line counts of the changed pieces"""
+        if self.valid == len(self.pieces) and len(self.starts) == len(self.pieces):
+            return
+        valid = self.valid
+        del self.starts[valid:]
+        del self.lines_before[valid:]
+        start = self.starts[-1] + len(self.pieces[valid - 1]) if valid else 0
+        lines = self.lines_before[-1] + self.pieces[valid - 1].newlines if valid else 0
+        for piece in self.pieces[valid:]:
+            self.starts.append(start)
+            self.lines_before.append(lines)
+            start += len(piece)
+            lines += piece.newlines
+        self.valid = len(self.pieces)
+
+    def changed(self, index: int) -> None:
+        """
+        Marks the index of the pieces from a position on as stale
+
+        Args:
+            index: first piece that changed
+        """
+        self.valid = min(self.valid, index)
+
+    def locate(self, offset: int) -> Tuple[int, int]:
+        """
+        Returns the index of the piece an offset falls in and the offset in it
+
+        Args:
+            offset: offset in the text
+        """
+        self.update_index()
+        index = bisect_right(self.starts, offset) - 1
+        if index < 0:
+            return 0, 0
+        if offset - self.starts[index] >= len(self.pieces[index]):
+            return index + 1, 0
+        return index, offset - self.starts[index]
+
+    def split_at(self, offset: int) -> int:
+        """
+        Makes sure a piece starts at an offset and returns its index
+
+        Args:
+            offset: offset in the text
+        """
+        index, inner = self.locate(offset)
+        if inner:
+            after = index + 1
+            self.pieces[index:after] = self.pieces[index].split(inner)
+            self.changed(index)
+            index += 1
+        return index
+
+    def insert(self, offset: int, text: str) -> None:
+        """
+        Inserts text at an offset
+
+        Args:
+            offset: offset in the text
+            text: text to insert
+        """
+        if not text:
+            return
+        added = self.added
+        if len(added.text) + len(text) > ADD_LIMIT and added.text:
+            added = self.added = Source()
+        start = len(added.text)
+        added.text += text
+        newlines = text.count("\n")
+
+        index = self.split_at(offset)
+        previous = self.pieces[index - 1] if index else None
+        if previous is not None and previous.source is added and previous.end == start:
+            # Typing extends the piece of the previous keystroke
+            self.pieces[index - 1] = Piece(
+                added, previous.start, start + len(text), previous.newlines + newlines
+            )
+            self.changed(index - 1)
+        else:
+            self.pieces.insert(index, Piece(added, start, start + len(text), newlines))
+            self.changed(index)
+        self.length += len(text)
+        self.newlines += newlines
+
+    def delete(self, offset: int, length: int) -> str:
+        """
+        Deletes a range of the text and returns the deleted text
+
+        Args:
+            offset: start of the range
+            length: length of the range
+        """
+        length = min(length, self.length - offset)
+        if length <= 0:
+            return ""
+        first = self.split_at(offset)
+        last = self.split_at(offset + length)
+        removed = self.pieces[first:last]
+        del self.pieces[first:last]
+        self.changed(first)
+        self.length -= length
+        self.newlines -= sum(piece.newlines for piece in removed)
+        return "".join(piece.text() for piece in removed)
+
+    def replace(self, offset: int, length: int, text: str) -> str:
+        """
+        Replaces a range of the text and returns the replaced text
+
+        Args:
+            offset: start of the range
+            length: length of the range
+            text: new text
+        """
+        removed = self.delete(offset, length)
+        self.insert(offset, text)
+        return removed
+
+    def text(self, start: int = 0, end: int = -1) -> str:
+        """
+        Returns a range of the text, all of it by default
+
+        Args:
+            start: start of the range
+            end: end of the range, -1 for the end of the text
+        """
+        if end < 0 or end > self.length:
+            end = self.length
+        if start >= end:
+            return ""
+        index, inner = self.locate(start)
+        parts = []
+        remaining = end - start
+        while remaining > 0:
+            piece = self.pieces[index]
+            part_start = piece.start + inner
+            part_end = min(piece.end, part_start + remaining)
+            parts.append(piece.source.text[part_start:part_end])
+            remaining -= part_end - part_start
+            index += 1
+            inner = 0
+        return "".join(parts)
+
+    def snapshot(self) -> List[Piece]:
+        """
+        Returns the pieces of the current text
+
+        Pieces never change and the texts they point into only grow, so the
+        snapshot stays valid after later edits and can be read from another thread.
+        """
+        return list(self.pieces)
+
+    def line_start(self, row: int) -> int:
+        """
+        Returns the offset of the start of a line
+
+        Args:
+            row: line number, counting from 0
+        """
+        if row <= 0:
+            return 0
+        if row > self.newlines:
+            return self.length
+        self.update_index()
+        # The piece with the row-th newline in it
+        index = bisect_left(self.lines_before, row) - 1
+        piece = self.pieces[index]
+        newline = piece.source.nth_newline(piece.start, row - self.lines_before[index])
+        return self.starts[index] + newline - piece.start + 1
+
+    def line_end(self, row: int) -> int:
+        """
+        Returns the offset of the end of a line, before its newline
+
+        Args:
+            row: line number, counting from 0
+        """
+        if row >= self.newlines:
+            return self.length
+        return self.line_start(row + 1) - 1
+
+    def line(self, row: int) -> str:
+        """
+        Returns a line without its newline
+
+        Args:
+            row: line number, counting from 0
+        """
+        return self.text(self.line_start(row), self.line_end(row))
+
+    def line_part(self, row: int, start: int, end: int) -> str:
+        """
+        Returns a range of columns of a line, without reading the rest of the line
+
+        Args:
+            row: line number, counting from 0
+            start, end: range of columns
+        """
+        line_start = self.line_start(row)
+        line_end = self.line_end(row)
+        return self.text(
+            min(line_start + start, line_end), min(line_start + end, line_end)
+        )
+
+    def line_length(self, row: int) -> int:
+        """
+        Returns the length of a line without its newline
+
+        Args:
+            row: line number, counting from 0
+        """
+        return self.line_end(row) - self.line_start(row)
+
+    def position(self, offset: int) -> Tuple[int, int]:
+        """
+        Returns the line and column of an offset
+
+        Args:
+            offset: offset in the text
+        """
+        offset = max(0, min(offset, self.length))
+        index, inner = self.locate(offset)
+        if index < len(self.pieces):
+            piece = self.pieces[index]
+            newlines = piece.source.count_newlines(piece.start, piece.start + inner)
+            row = self.lines_before[index] + newlines
+        else:
+            row = self.newlines
+        return row, offset - self.line_start(row)
+
+    def offset(self, row: int, col: int) -> int:
+        """
+        Returns the offset of a line and column, the column is kept in the line
+
+        Args:
+            row: line number, counting from 0
+            col: column, counting from 0
+        """
+        row = max(0, min(row, self.newlines))
+        return self.line_start(row) + max(0, min(col, self.line_length(row)))
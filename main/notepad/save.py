@@ -0,0 +1,165 @@
+import contextlib
+import os
+import stat
+import tempfile
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple
+
+from .piece_table import Piece
+
+# Characters written at once, the progress is updated after every chunk
+WRITE_CHUNK = 1024 * 1024
+
+
+def current_umask() -> int:
+    """Returns the umask of the process"""
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+def fsync_dir(directory: Path) -> None:
+    """
+    Flushes a rename in a directory to disk where the OS supports it
+
+    Args:
+        directory: directory the file was renamed in
+    """
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class Saver:
+    """
+    Saves files on a background thread so that the editor does not freeze
+
+    The text is written to a temporary file in the same directory, flushed to
+    disk and renamed over the file, so a crash never leaves a half-written file.
+    Saves requested while one is running are merged: only the latest text is
+    written once the running save is done.
+    """
+
+    def __init__(self, on_change: Optional[Callable[[], None]] = None):
+        """
+        Constructor for class Saver
+
+        Args:
+            on_change: called from the saving thread when the status changes
+        """
+        self.on_change = on_change
+        self.status = ""
+        self.pending: Optional[
+            Tuple[Path, List[Piece], Optional[Callable[[], None]]]
+        ] = None
+        self.busy = False
+        self.condition = threading.Condition()
+        self.thread: Optional[threading.Thread] = None
+        # New files get the same permissions as files created with open()
+        self.new_file_mode = 0o666 & ~current_umask()
+
+    def save(
+        self,
+        path: Path,
+        pieces: List[Piece],
+        on_saved: Optional[Callable[[], None]] = None,
+    ) -> None:
+        """
+        Queues a save, replacing a queued save that did not start yet
+
+        Args:
+            path: file to save to
+            pieces: snapshot of the text from PieceTable.snapshot
+            on_saved: called from the saving thread once the file is written
+        """
+        with self.condition:
+            self.pending = (path, pieces, on_saved)
+            self.condition.notify()
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+
+    def set_status(self, status: str) -> None:
+        """
+        Updates the status shown in the status bar
+
+        Args:
+            status: new status
+        """
+        self.status = status
+        if self.on_change is not None:
+            self.on_change()
+
+    def run(self) -> None:
+        """Writes the queued saves one at a time, runs in the saving thread"""
+        while True:
+            with self.condition:
+                while self.pending is None:
+                    self.condition.wait()
+                path, pieces, on_saved = self.pending
+                self.pending = None
+                self.busy = True
+            try:
+                self.write(path, pieces)
+                if on_saved is not None:
+                    on_saved()
+                self.set_status("Saved {}".format(datetime.now().strftime("%H:%M")))
+            except OSError as e:
+                self.set_status("Save failed: {}".format(e.strerror or e))
+            with self.condition:
+                self.busy = False
+                self.condition.notify_all()
+
+    def write(self, path: Path, pieces: List[Piece]) -> None:
+        """
+        Writes the text to a temporary file and renames it over the file
+
+        Args:
+            path: file to save to
+            pieces: pieces of the text
+        """
+        total = sum(len(piece) for piece in pieces) or 1
+        written = 0
+        percent = -1
+        fd, tmp_name = tempfile.mkstemp(
+            dir=path.parent, prefix="." + path.name + ".", suffix=".tmp"
+        )
+        try:
+            with os.fdopen(fd, "w") as f:
+                for piece in pieces:
+                    text = piece.source.text
+                    for start in range(piece.start, piece.end, WRITE_CHUNK):
+                        end = min(start + WRITE_CHUNK, piece.end)
+                        f.write(text[start:end])
+                        written += end - start
+                        if written * 100 // total != percent:
+                            percent = written * 100 // total
+                            self.set_status("Saving {}%".format(percent))
+                f.flush()
+                os.fsync(f.fileno())
+            try:
+                mode = stat.S_IMODE(path.stat().st_mode)
+            except FileNotFoundError:
+                mode = self.new_file_mode
+            os.chmod(tmp_name, mode)
+            os.replace(tmp_name, path)
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.unlink(tmp_name)
+            raise
+        fsync_dir(path.parent)
+
+    def wait(self) -> None:
+        """Waits until all queued saves are written"""
+        with self.condition:
+            while self.pending is not None or self.busy:
+                self.condition.wait()
@@ -0,0 +1,371 @@
+import re
+import threading
+from typing import Callable, List, Optional, Pattern, Tuple
+
+from prompt_toolkit.formatted_text import StyleAndTextTuples
+
+from .piece_table import PieceTable
+
+# Most lines handed to the search thread at once
+SCAN_LINES = 4096
+
+# Start and end column of a match
+Span = Tuple[int, int]
+
+# Generation of the pattern, number of edits, the pattern, first line and the lines
+Job = Tuple[int, int, Pattern[str], int, List[str]]
+
+# Generation of the pattern, number of edits, first line and the matches of the lines
+Result = Tuple[int, int, int, List[List[Span]]]
+
+# Offset, length and new text of a replace, and the number of replaced matches
+BulkEdit = Tuple[int, int, str, int]
+
+
+def find_spans(regex: Pattern[str], line: str) -> List[Span]:
+    """
+    Returns the matches in a line, matches of no text are left out
+
+    Args:
+        regex: compiled pattern
+        line: line without its newline
+    """
+    return [
+        match.span() for match in regex.finditer(line) if match.end() > match.start()
+    ]
+
+
+def mark_matches(
+    fragments: StyleAndTextTuples,
+    spans: List[Span],
+    current: Optional[int] = None,
+    mark: str = "class:search",
+) -> StyleAndTextTuples:
+    """
+    Returns a line with the style of the matches added to it
+
+    Args:
+        fragments: the line as formatted text
+        spans: matches in the line
+        current: column of the match the cursor is on
+        mark: style added to the matches, e.g. class:selected for a selection
+    """
+    marked: StyleAndTextTuples = []
+    index = 0
+    position = 0
+    for fragment in fragments:
+        style, text = fragment[0], fragment[1]
+        end = position + len(text)
+        cut = position
+        while index < len(spans) and spans[index][0] < end:
+            start, stop = spans[index]
+            if start > cut:
+                before, after = cut - position, start - position
+                marked.append((style, text[before:after]))
+                cut = start
+            match_end = min(stop, end)
+            before, after = cut - position, match_end - position
+            match_style = " " + mark
+            if start == current:
+                match_style += " class:incsearch.current"
+            marked.append((style + match_style, text[before:after]))
+            cut = match_end
+            if stop > end:
+                # The match goes on in the next fragment
+                break
+            index += 1
+        if cut < end:
+            before = cut - position
+            marked.append((style, text[before:]))
+        position = end
+    return marked
+
+
+class Search:
+    """
+    Finds the matches of a text or a regular expression in a PieceTable
+
+    The matches of every line are kept in an index that is filled in chunks of
+    lines on a background thread. An edit only clears the matches of the
+    changed lines, which are searched again, so the text is never searched
+    from the start after it changed. Matches do not span lines.
+    """
+
+    def __init__(
+        self, buffer: PieceTable, on_change: Optional[Callable[[], None]] = None
+    ):
+        """
+        Constructor for class Search
+
+        Args:
+            buffer: text to search
+            on_change: called from the search thread when more lines were searched
+        """
+        self.buffer = buffer
+        self.on_change = on_change
+        self.regex: Optional[Pattern[str]] = None
+        self.is_regex = False
+        # Matches of every line, None where a line is not searched yet
+        self.matches: List[Optional[List[Span]]] = []
+        self.found = 0
+        self.searched = 0
+        # Line the next chunk is searched from
+        self.next_row = 0
+        self.edits = 0
+        self.generation = 0
+        self.pending: Optional[Job] = None
+        self.result: Optional[Result] = None
+        self.busy = False
+        self.closed = False
+        self.condition = threading.Condition()
+        self.thread: Optional[threading.Thread] = None
+
+    @property
+    def done(self) -> bool:
+        """True once every line was searched"""
+        return self.searched == len(self.matches)
+
+    def set_pattern(self, pattern: str, is_regex: bool = False) -> None:
+        """
+        Starts searching for another pattern, an empty pattern stops searching
+
+        Args:
+            pattern: text or regular expression to find
+            is_regex: the pattern is a regular expression
+
+        Raises:
+            re.error: the regular expression is not valid
+        """
+        regex = None
+        if pattern:
+            regex = re.compile(pattern if is_regex else re.escape(pattern))
+        self.regex = regex
+        self.is_regex = is_regex
+        self.matches = [None] * (self.buffer.line_count if regex is not None else 0)
+        self.found = 0
+        self.searched = 0
+        self.next_row = 0
+        with self.condition:
+            # Matches of the old pattern are thrown away
+            self.generation += 1
+
+    def store(self, row: int, spans: List[Span]) -> List[Span]:
+        """
+        Stores the matches of a line
+
+        Args:
+            row: line number, counting from 0
+            spans: matches in the line
+        """
+        self.matches[row] = spans
+        self.found += len(spans)
+        self.searched += 1
+        return spans
+
+    def line(self, row: int) -> List[Span]:
+        """
+        Returns the matches in a line, searching the line now if needed
+
+        Args:
+            row: line number, counting from 0
+        """
+        if self.regex is None or row >= len(self.matches):
+            return []
+        spans = self.matches[row]
+        if spans is None:
+            spans = self.store(row, find_spans(self.regex, self.buffer.line(row)))
+        return spans
+
+    def edit(self, offset: int, removed: str, inserted: str) -> None:
+        """
+        Clears the matches of the changed lines, an edit handler of the Editor
+
+        Args:
+            offset: offset of the edit
+            removed: removed text
+            inserted: inserted text
+        """
+        if self.regex is None:
+            return
+        row = self.buffer.position(offset)[0]
+        end = row + removed.count("\n") + 1
+        for spans in self.matches[row:end]:
+            if spans is not None:
+                self.found -= len(spans)
+                self.searched -= 1
+        self.matches[row:end] = [None] * (inserted.count("\n") + 1)
+        self.next_row = min(self.next_row, row)
+        # Lines handed out before the edit may have moved
+        self.edits += 1
+
+    def lines(self, start: int, end: int) -> List[str]:
+        """
+        Returns a range of lines
+
+        Args:
+            start: first line
+            end: line after the last line
+        """
+        text = self.buffer.text(
+            self.buffer.line_start(start), self.buffer.line_end(end - 1)
+        )
+        return text.split("\n")
+
+    def update(self) -> None:
+        """
+        Takes in the lines searched so far and hands the next lines to the
+        search thread, called before the editor is drawn
+        """
+        with self.condition:
+            result, self.result = self.result, None
+            idle = self.pending is None and not self.busy and not self.closed
+        if result is not None:
+            self.apply(*result)
+        regex = self.regex
+        if regex is None or not idle or self.done:
+            return
+
+        try:
+            start = self.matches.index(None, self.next_row)
+        except ValueError:
+            start = self.matches.index(None)
+        end = min(start + SCAN_LINES, len(self.matches))
+        lines = self.lines(start, end)
+        with self.condition:
+            self.pending = (self.generation, self.edits, regex, start, lines)
+            self.condition.notify()
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+
+    def apply(
+        self, generation: int, edits: int, start: int, lines: List[List[Span]]
+    ) -> None:
+        """
+        Stores the matches of searched lines if the text did not change since
+
+        Args:
+            generation: generation of the pattern the lines were searched for
+            edits: number of edits when the lines were handed out
+            start: first line
+            lines: matches of the lines
+        """
+        if generation != self.generation or edits != self.edits:
+            return
+        for row, spans in enumerate(lines, start):
+            if self.matches[row] is None:
+                self.store(row, spans)
+        self.next_row = start + len(lines)
+
+    def run(self) -> None:
+        """Searches the handed out lines, runs in the search thread"""
+        while True:
+            with self.condition:
+                while self.pending is None and not self.closed:
+                    self.condition.wait()
+                if self.closed or self.pending is None:
+                    return
+                generation, edits, regex, start, lines = self.pending
+                self.pending = None
+                self.busy = True
+            matches = [find_spans(regex, line) for line in lines]
+            with self.condition:
+                self.result = (generation, edits, start, matches)
+                self.busy = False
+                self.condition.notify_all()
+            if self.on_change is not None:
+                self.on_change()
+
+    def wait(self) -> None:
+        """Waits until the handed out lines are searched"""
+        with self.condition:
+            while self.pending is not None or self.busy:
+                self.condition.wait()
+
+    def search_all(self) -> None:
+        """Searches the lines the search thread did not get to yet"""
+        if self.regex is None:
+            return
+        end = 0
+        while not self.done:
+            start = self.matches.index(None, end)
+            end = min(start + SCAN_LINES, len(self.matches))
+            for row, line in enumerate(self.lines(start, end), start):
+                if self.matches[row] is None:
+                    self.store(row, find_spans(self.regex, line))
+
+    def find(
+        self, row: int, col: int, forward: bool = True
+    ) -> Optional[Tuple[int, Span]]:
+        """
+        Returns the next match from a position, going round at the end of the text
+
+        Args:
+            row: line to start from
+            col: matches starting at this column or after it are next, before
+                it when going backwards
+            forward: find the next match, else the previous one
+
+        Returns:
+            Optional[Tuple[int, Span]]: line and columns of the match
+        """
+        line_count = len(self.matches)
+        if not line_count:
+            return None
+        for step in range(line_count + 1):
+            current = (row + step if forward else row - step) % line_count
+            spans = self.line(current)
+            if step == 0:
+                if forward:
+                    spans = [span for span in spans if span[0] >= col]
+                else:
+                    spans = [span for span in spans if span[0] < col]
+            if spans:
+                return current, spans[0] if forward else spans[-1]
+        return None
+
+    def replace_all(self, replacement: str) -> Optional[BulkEdit]:
+        """
+        Returns a single edit that replaces every match
+
+        Args:
+            replacement: new text, with group references like \\1 for a
+                regular expression
+
+        Returns:
+            Optional[BulkEdit]: offset, length and new text of the range from
+            the first to the last match, and the number of replaced matches
+        """
+        regex = self.regex
+        if regex is None:
+            return None
+        self.search_all()
+        if not self.found:
+            return None
+        rows = [row for row, spans in enumerate(self.matches) if spans]
+        first, last = rows[0], rows[-1]
+        count = 0
+
+        def replace(match: "re.Match[str]") -> str:
+            """Returns the replacement of a match"""
+            nonlocal count
+            if match.end() == match.start():
+                return ""
+            count += 1
+            return match.expand(replacement) if self.is_regex else replacement
+
+        lines = self.lines(first, last + 1)
+        for row in rows:
+            index = row - first
+            lines[index] = regex.sub(replace, lines[index])
+        start = self.buffer.line_start(first)
+        end = self.buffer.line_end(last)
+        return start, end - start, "\n".join(lines), count
+
+    def close(self) -> None:
+        """Stops the search thread"""
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        if self.thread is not None:
+            self.thread.join()
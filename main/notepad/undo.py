@@ -0,0 +1,121 @@
+from collections import deque
+from typing import Deque, List, Optional, Tuple
+
+# Approximate bytes the undo history may use, the oldest edits are dropped beyond it
+UNDO_BUDGET = 16 * 1024 * 1024
+
+# Bytes counted for every edit on top of its text
+EDIT_OVERHEAD = 64
+
+# An edit: offset, removed text and inserted text
+Edit = Tuple[int, str, str]
+
+
+def edit_size(edit: Edit) -> int:
+    """
+    Returns the approximate memory used by an edit
+
+    Args:
+        edit: the edit
+    """
+    return EDIT_OVERHEAD + len(edit[1]) + len(edit[2])
+
+
+def merge(last: Edit, edit: Edit) -> Optional[Edit]:
+    """
+    Returns the two edits as a single edit if the second continues typing or
+    deleting where the first stopped
+
+    Args:
+        last: earlier edit
+        edit: following edit
+    """
+    last_offset, last_removed, last_inserted = last
+    offset, removed, inserted = edit
+    if not removed and not last_removed:
+        # Typing, a new line starts a new group
+        if offset == last_offset + len(last_inserted) and "\n" not in inserted:
+            return last_offset, "", last_inserted + inserted
+    elif not inserted and not last_inserted:
+        if offset + len(removed) == last_offset:
+            # Backspace
+            return offset, removed + last_removed, ""
+        if offset == last_offset:
+            # Delete
+            return offset, last_removed + removed, ""
+    return None
+
+
+class History:
+    """
+    Undo and redo history that keeps the changes of the edits, not copies of the text
+
+    Typing and deleting character by character is merged into a single edit,
+    and the oldest edits are dropped once the history uses more than its
+    budget, so the memory used does not grow with the length of a session.
+    The last edit can always be undone.
+    """
+
+    def __init__(self, budget: int = UNDO_BUDGET):
+        """
+        Constructor for class History
+
+        Args:
+            budget: approximate bytes the history may use
+        """
+        self.budget = budget
+        self.undo_stack: Deque[Edit] = deque()
+        self.redo_stack: List[Edit] = []
+        # Bytes used by the edits of both stacks
+        self.size = 0
+        # The next edit starts a new group instead of merging into the last one
+        self.closed = True
+        # Edits made by undo and redo are not recorded
+        self.applying = False
+
+    def record(self, offset: int, removed: str, inserted: str) -> None:
+        """
+        Adds an edit to the history, an edit handler of the Editor
+
+        Args:
+            offset: offset of the edit
+            removed: removed text
+            inserted: inserted text
+        """
+        if self.applying:
+            return
+        for undone in self.redo_stack:
+            self.size -= edit_size(undone)
+        self.redo_stack.clear()
+        edit = (offset, removed, inserted)
+        merged = None
+        if self.undo_stack and not self.closed:
+            merged = merge(self.undo_stack[-1], edit)
+        if merged is not None:
+            self.size -= edit_size(self.undo_stack.pop())
+            edit = merged
+        self.undo_stack.append(edit)
+        self.size += edit_size(edit)
+        self.closed = "\n" in inserted
+        # The last edit is kept even when it is larger than the budget alone
+        while self.size > self.budget and len(self.undo_stack) > 1:
+            self.size -= edit_size(self.undo_stack.popleft())
+
+    def undo(self) -> Optional[Edit]:
+        """Returns the edit that reverts the last edit, None if there is none"""
+        if not self.undo_stack:
+            return None
+        edit = self.undo_stack.pop()
+        self.redo_stack.append(edit)
+        self.closed = True
+        offset, removed, inserted = edit
+        return offset, inserted, removed
+
+    def redo(self) -> Optional[Edit]:
+        """Returns the last undone edit, None if there is none"""
+        if not self.redo_stack:
+            return None
+        edit = self.redo_stack.pop()
+        self.undo_stack.append(edit)
+        self.closed = True
+        return edit
@@ -0,0 +1,306 @@
+import asyncio
+import time
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from PIL import Image, ImageSequence
+from prompt_toolkit import Application
+from prompt_toolkit.formatted_text import StyleAndTextTuples
+from prompt_toolkit.key_binding import KeyBindings
+from prompt_toolkit.key_binding.key_processor import KeyPressEvent
+from prompt_toolkit.layout.containers import HSplit, VSplit, Window, WindowAlign
+from prompt_toolkit.layout.controls import (
+    FormattedTextControl,
+    GetLinePrefixCallable,
+    UIContent,
+    UIControl,
+)
+from prompt_toolkit.layout.layout import Layout
+from prompt_toolkit.output.color_depth import ColorDepth
+from prompt_toolkit.styles.style import _MergedStyle
+
+from .cells import cell_rows
+
+# Browsers show frames without a usable duration for 100 ms
+DEFAULT_DURATION = 100
+MIN_DURATION = 20
+
+# (row, column, style) of a character that changes from one frame to the next
+Change = Tuple[int, int, str]
+
+
+def is_animated(path: Path) -> bool:
+    """
+    Returns True if the image has more than one frame
+
+    Args:
+        path: path of the image
+    """
+    try:
+        with Image.open(path) as image:
+            return getattr(image, "is_animated", False)
+    except OSError:
+        return False
+
+
+def frame_styles(image: Image.Image) -> List[List[str]]:
+    """
+    Returns the prompt_toolkit style of every half-block character of a frame
+
+    The styles are the same that ANSI() makes of the output of
+    ImageViewer.ansi_rows: the lower pixel is the foreground of "▄" and the
+    upper pixel the background. An odd last row has the default background.
+
+    Args:
+        image: frame to be rendered
+    """
+    width = image.width
+    # Every style ends with a NUL so that a formatted row can be split again
+    row_format = "#%02x%02x%02x bg:#%02x%02x%02x\0" * width
+    last_format = "#%02x%02x%02x bg:ansidefault\0" * width
+    rows = []
+    for cells in cell_rows(image):
+        # An odd last row has one pixel per character
+        row = row_format if len(cells) == width * 6 else last_format
+        rows.append((row % tuple(cells)).split("\0")[:-1])
+    return rows
+
+
+def frame_changes(previous: List[List[str]], current: List[List[str]]) -> List[Change]:
+    """
+    Returns the characters whose style differs between two frames
+
+    Args:
+        previous: styles of the previous frame
+        current: styles of the frame that is shown next
+    """
+    changes: List[Change] = []
+    for y, (old_row, new_row) in enumerate(zip(previous, current)):
+        if old_row != new_row:
+            changes.extend(
+                (y, x, new)
+                for x, (old, new) in enumerate(zip(old_row, new_row))
+                if old != new
+            )
+    return changes
+
+
+class FrameControl(UIControl):
+    """Control that shows the current frame and updates only the changed characters"""
+
+    def __init__(self, styles: List[List[str]], odd_height: bool):
+        """
+        Constructor for class FrameControl
+
+        Args:
+            styles: styles of the first frame
+            odd_height: whether the last row only has the upper pixels
+        """
+        self.lines: List[StyleAndTextTuples] = [
+            [(style, "▄") for style in row] for row in styles
+        ]
+        if odd_height and self.lines:
+            self.lines[-1] = [(style, "▀") for style in styles[-1]]
+        self.width = len(styles[0]) if styles else 0
+
+    def apply(self, changes: List[Change]) -> None:
+        """
+        Updates the characters that changed since the previous frame
+
+        Args:
+            changes: changes from frame_changes
+        """
+        lines = self.lines
+        for y, x, style in changes:
+            line = lines[y]
+            line[x] = (style, line[x][1])
+
+    def preferred_width(self, max_available_width: int) -> Optional[int]:
+        """Returns the width of the frame"""
+        return self.width
+
+    def preferred_height(
+        self,
+        width: int,
+        max_available_height: int,
+        wrap_lines: bool,
+        get_line_prefix: Optional[GetLinePrefixCallable],
+    ) -> Optional[int]:
+        """Returns the height of the frame"""
+        return len(self.lines)
+
+    def create_content(self, width: int, height: int) -> UIContent:
+        """Returns the lines of the current frame"""
+        return UIContent(
+            get_line=lambda y: self.lines[y],
+            line_count=len(self.lines),
+            show_cursor=False,
+        )
+
+
+class Animation:
+    """Player for animated GIF and APNG images"""
+
+    def __init__(
+        self,
+        path: Path,
+        size: Tuple[int, int] = (100, 50),
+        style: Optional[_MergedStyle] = None,
+    ):
+        """
+        Constructor for class Animation
+
+        Args:
+            path: path of the animated image
+            size: box the frames have to fit in, in pixels
+            style: styles for the app
+        """
+        self.path = path
+        self.size = size
+        self.style = style
+        self.durations: List[float] = []
+        self.changes: List[List[Change]] = []
+        self.control: Optional[FrameControl] = None
+        self.frame = 0
+        self.dropped = 0
+
+    def load_frames(self) -> None:
+        """
+        Decodes and renders all frames once
+
+        Only the first frame is kept in full. For every frame the list of
+        characters that differ from the frame before it is stored, and the
+        first frame is compared with the last one so that the loop wraps around.
+        """
+        first: List[List[str]] = []
+        previous: List[List[str]] = []
+        odd_height = False
+        with Image.open(self.path) as image:
+            for frame in ImageSequence.Iterator(image):
+                duration = frame.info.get("duration") or DEFAULT_DURATION
+                if duration < MIN_DURATION:
+                    duration = DEFAULT_DURATION
+                self.durations.append(duration / 1000)
+
+                thumbnail = frame.convert("RGB")
+                thumbnail.thumbnail(self.size, Image.HAMMING)
+                styles = frame_styles(thumbnail)
+                if not first:
+                    first = styles
+                    odd_height = thumbnail.height % 2 == 1
+                    self.changes.append([])
+                else:
+                    self.changes.append(frame_changes(previous, styles))
+                previous = styles
+
+        self.changes[0] = frame_changes(previous, first)
+        self.control = FrameControl(first, odd_height)
+
+    async def play(self, app: Application) -> None:
+        """
+        Shows the frames for their durations, runs as a background task of the app
+
+        When drawing falls behind, frames whose time has already passed are
+        applied to the control but not drawn, so the animation keeps its speed.
+
+        Args:
+            app: the running application
+        """
+        control = self.control
+        if control is None:
+            return
+        count = len(self.durations)
+        shown_at = time.monotonic()
+        while True:
+            next_at = shown_at + self.durations[self.frame]
+            next_frame = (self.frame + 1) % count
+            control.apply(self.changes[next_frame])
+            while time.monotonic() >= next_at + self.durations[next_frame]:
+                next_at += self.durations[next_frame]
+                next_frame = (next_frame + 1) % count
+                control.apply(self.changes[next_frame])
+                self.dropped += 1
+
+            await asyncio.sleep(max(0, next_at - time.monotonic()))
+            self.frame, shown_at = next_frame, next_at
+            app.invalidate()
+
+    def get_status(self) -> str:
+        """Returns the current frame and the number of dropped frames"""
+        return "frame {}/{}, {} dropped".format(
+            self.frame + 1, len(self.durations), self.dropped
+        )
+
+    def run_app(self) -> None:
+        """Run the Animation app"""
+        self.load_frames()
+        app = self.make_app()
+
+        def start_playing() -> None:
+            """Starts the animation once the event loop of the app is running"""
+            app.create_background_task(self.play(app))
+
+        app.run(pre_run=start_playing)
+
+    def make_app(self) -> Application:
+        """Create the app to play the animation"""
+        kb = KeyBindings()
+
+        @kb.add("c-d")
+        def _exit(event: KeyPressEvent) -> None:
+            """Exits from the app
+
+            Args:
+                event (KeyPressEvent): Takes an KeyPress event
+            """
+            event.app.exit()
+
+        layout = Layout(
+            HSplit(
+                [
+                    Window(
+                        content=FormattedTextControl(
+                            "Photos - {}".format(self.path.name)
+                        ),
+                        height=1,
+                        always_hide_cursor=True,
+                        align=WindowAlign.CENTER,
+                        style="class:frame",
+                    ),
+                    Window(content=None, height=1),
+                    VSplit(
+                        [
+                            Window(
+                                content=self.control,
+                                always_hide_cursor=True,
+                                align=WindowAlign.CENTER,
+                            )
+                        ]
+                    ),
+                    VSplit(
+                        [
+                            Window(
+                                content=FormattedTextControl("<Ctrl+D=Exit>"),
+                                always_hide_cursor=True,
+                                align=WindowAlign.LEFT,
+                            ),
+                            Window(
+                                content=FormattedTextControl(self.get_status),
+                                always_hide_cursor=True,
+                                align=WindowAlign.RIGHT,
+                            ),
+                        ],
+                        height=1,
+                        style="class:frame",
+                    ),
+                ],
+                key_bindings=kb,
+            )
+        )
+        app: Application = Application(
+            layout=layout,
+            full_screen=True,
+            style=self.style,
+            color_depth=ColorDepth.TRUE_COLOR,
+        )
+        return app
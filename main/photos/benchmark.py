@@ -0,0 +1,298 @@
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import PIL
+from PIL import Image
+from prompt_toolkit import ANSI
+
+from .cache import RenderCache
+from .decode import open_thumbnail, peak_rss, reset_peak_rss
+from .photos import ANSI_MODES, SOURCE_SIZE, ImageViewer
+
+try:
+    from ..common import benchmark_parser, change, environment, show_results
+except ImportError:
+    from common import (  # type: ignore[no-redef]
+        benchmark_parser,
+        change,
+        environment,
+        show_results,
+    )
+
+SIZES = [(640, 480), (1920, 1080), (4000, 3000)]
+FORMATS = ["PNG", "JPEG", "BMP"]
+
+# Columns and lines of the terminal the images are rendered for
+WINDOW_SIZE = (160, 45)
+
+EXTENSIONS = {"PNG": ".png", "JPEG": ".jpg", "BMP": ".bmp"}
+
+Result = Dict[str, Any]
+
+
+def synthetic_image(size: Tuple[int, int]) -> Image.Image:
+    """
+    Returns an image with smooth gradients and fine detail, the same on every run
+
+    Args:
+        size: size of the image
+    """
+    red = Image.linear_gradient("L").resize(size)
+    green = Image.linear_gradient("L").rotate(90).resize(size)
+    blue = Image.effect_mandelbrot(size, (-2.0, -1.2, 1.0, 1.2), 64)
+    return Image.merge("RGB", (red, green, blue))
+
+
+def write_images(
+    directory: Path, sizes: Sequence[Tuple[int, int]], formats: Sequence[str]
+) -> List[Path]:
+    """
+    Saves a synthetic image for every size and format
+
+    Args:
+        directory: directory to save the images in
+        sizes: sizes of the images
+        formats: Pillow format names, e.g. PNG
+    """
+    paths = []
+    for size in sizes:
+        image = synthetic_image(size)
+        for image_format in formats:
+            path = directory.joinpath(
+                "{}x{}{}".format(size[0], size[1], EXTENSIONS[image_format])
+            )
+            image.save(path, image_format)
+            paths.append(path)
+    return paths
+
+
+def measure(
+    function: Callable[[], Any], repeat: int
+) -> Tuple[float, Optional[int], Any]:
+    """
+    Runs a function a number of times and returns its fastest run
+
+    Args:
+        function: function to time
+        repeat: number of runs
+
+    Returns:
+        Tuple[float, Optional[int], Any]: seconds of the fastest run, peak
+            RSS in bytes during the runs and the value of the last run
+    """
+    best = float("inf")
+    value = None
+    reset_peak_rss()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        value = function()
+        best = min(best, time.perf_counter() - start)
+    return best, peak_rss(), value
+
+
+def stage_result(
+    stage: str,
+    seconds: float,
+    rss: Optional[int],
+    pixels: int,
+    output_bytes: Optional[int] = None,
+) -> Result:
+    """
+    Returns the result of one stage
+
+    Args:
+        stage: name of the stage
+        seconds: time the stage took
+        rss: peak RSS in bytes, None if it is not available
+        pixels: number of pixels the stage worked on
+        output_bytes: size of the output of the stage
+    """
+    return {
+        "stage": stage,
+        "seconds": seconds,
+        "megapixels_per_second": pixels / seconds / 1e6 if seconds else None,
+        "output_bytes": output_bytes,
+        "peak_rss": rss,
+    }
+
+
+def benchmark_image(
+    path: Path, window_size: Tuple[int, int], repeat: int, cache: RenderCache
+) -> List[Result]:
+    """
+    Times every stage of rendering an image
+
+    Args:
+        path: path of the image
+        window_size: columns and lines the image is rendered for
+        repeat: number of runs of every stage
+        cache: cache given to ImageViewer, it is not used
+    """
+    results = []
+
+    def decode() -> Image.Image:
+        """Decodes the image the way ImageViewer.load_source does"""
+        image = open_thumbnail(path, SOURCE_SIZE)
+        image.load()
+        return image
+
+    seconds, rss, source = measure(decode, repeat)
+    with Image.open(path) as image:
+        full_pixels = image.width * image.height
+    results.append(stage_result("decode", seconds, rss, full_pixels))
+
+    viewer = ImageViewer(path, cache=cache)
+    box = viewer.window_box(window_size)
+
+    def thumbnail() -> Image.Image:
+        """Shrinks the decoded image to fit in the window"""
+        image = source.copy()
+        image.thumbnail(box, Image.HAMMING)
+        return image
+
+    seconds, rss, image = measure(thumbnail, repeat)
+    results.append(
+        stage_result("thumbnail", seconds, rss, source.width * source.height)
+    )
+    pixels = image.width * image.height
+
+    for mode in ANSI_MODES:
+        viewer = ImageViewer(path, mode=mode, cache=cache)
+
+        def view_ansi() -> str:
+            """Renders the thumbnail with view_ansi"""
+            viewer.image_string = ""
+            viewer.view_ansi(image)
+            return viewer.image_string
+
+        seconds, rss, image_string = measure(view_ansi, repeat)
+        output_bytes = len(image_string.encode())
+        results.append(
+            stage_result("view_ansi_" + mode, seconds, rss, pixels, output_bytes)
+        )
+
+        def fragments() -> int:
+            """Parses the escape codes into prompt_toolkit fragments"""
+            return len(ANSI(image_string).__pt_formatted_text__())
+
+        seconds, rss, _ = measure(fragments, repeat)
+        results.append(
+            stage_result("fragments_" + mode, seconds, rss, pixels, output_bytes)
+        )
+
+    viewer = ImageViewer(path, mode="ASCII", cache=cache)
+
+    def view_ascii() -> str:
+        """Renders the decoded image with view_ascii"""
+        viewer.image_string = ""
+        viewer.view_ascii(source, window_size[1])
+        return viewer.image_string
+
+    seconds, rss, image_string = measure(view_ascii, repeat)
+    results.append(
+        stage_result(
+            "view_ascii",
+            seconds,
+            rss,
+            source.width * source.height,
+            len(image_string.encode()),
+        )
+    )
+    return results
+
+
+def run_benchmarks(
+    sizes: Sequence[Tuple[int, int]] = SIZES,
+    formats: Sequence[str] = FORMATS,
+    window_size: Tuple[int, int] = WINDOW_SIZE,
+    repeat: int = 5,
+) -> Dict[str, Any]:
+    """
+    Benchmarks the rendering pipeline on synthetic images
+
+    Args:
+        sizes: sizes of the images
+        formats: formats the images are saved in
+        window_size: columns and lines the images are rendered for
+        repeat: number of runs of every stage, the fastest is reported
+
+    Returns:
+        Dict[str, Any]: the environment and the results of every image and stage
+    """
+    images = []
+    with tempfile.TemporaryDirectory() as directory:
+        cache = RenderCache(Path(directory).joinpath("cache"))
+        for path in write_images(Path(directory), sizes, formats):
+            with Image.open(path) as image:
+                image_format, size = image.format, list(image.size)
+            images.append(
+                {
+                    "name": path.name,
+                    "format": image_format,
+                    "size": size,
+                    "file_bytes": path.stat().st_size,
+                    "stages": benchmark_image(path, window_size, repeat, cache),
+                }
+            )
+
+    return {
+        **environment(pillow=PIL.__version__),
+        "window_size": list(window_size),
+        "repeat": repeat,
+        "images": images,
+    }
+
+
+def compare(old: Dict[str, Any], new: Dict[str, Any]) -> List[str]:
+    """
+    Returns a line for every stage found in both results with the change in time
+
+    Args:
+        old: results of the earlier run
+        new: results of the later run
+    """
+    old_seconds = {
+        (image["name"], stage["stage"]): stage["seconds"]
+        for image in old["images"]
+        for stage in image["stages"]
+    }
+    lines = []
+    for image in new["images"]:
+        for stage in image["stages"]:
+            before = old_seconds.get((image["name"], stage["stage"]))
+            if before:
+                label = "{:<16} {:<18}".format(image["name"], stage["stage"])
+                lines.append(change(label, before, stage["seconds"]))
+    return lines
+
+
+def report(results: Dict[str, Any]) -> List[str]:
+    """
+    Returns the results as lines of a table
+
+    Args:
+        results: results from run_benchmarks
+    """
+    lines = []
+    for image in results["images"]:
+        for stage in image["stages"]:
+            rss = stage["peak_rss"]
+            lines.append(
+                "{:<16} {:<18} {:>9.2f} ms {:>9.1f} MP/s {:>11} B {:>8} MB".format(
+                    image["name"],
+                    stage["stage"],
+                    stage["seconds"] * 1000,
+                    stage["megapixels_per_second"] or 0,
+                    "-" if stage["output_bytes"] is None else stage["output_bytes"],
+                    "-" if rss is None else "{:.1f}".format(rss / 1024 / 1024),
+                )
+            )
+    return lines
+
+
+if __name__ == "__main__":
+    parser = benchmark_parser("Benchmark the Photos rendering pipeline", 5, "stage")
+    args = parser.parse_args()
+    show_results(run_benchmarks(repeat=args.repeat), args, report, compare)
@@ -0,0 +1,148 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+try:
+    from ..common import default_cache_dir, write_atomic
+except ImportError:
+    from common import default_cache_dir, write_atomic  # type: ignore[no-redef]
+
+# Bump when the rendered output changes so that old entries are not reused
+CACHE_VERSION = 1
+
+
+def digest(value: Any) -> str:
+    """
+    Returns a short hash of a JSON serializable value
+
+    Args:
+        value: value to hash
+    """
+    text = json.dumps(value, sort_keys=True)
+    return hashlib.sha256(text.encode()).hexdigest()[:24]
+
+
+def file_size(path: Path) -> int:
+    """
+    Returns the size of a file, 0 if it does not exist
+
+    Args:
+        path: path of the file
+    """
+    try:
+        return path.stat().st_size
+    except FileNotFoundError:
+        return 0
+
+
+class RenderCache:
+    """On-disk cache of rendered images with a size cap and LRU eviction"""
+
+    def __init__(
+        self, cache_dir: Optional[Path] = None, max_size: int = 64 * 1024 * 1024
+    ):
+        """
+        Constructor for class RenderCache
+
+        Args:
+            cache_dir: directory for the cache files. Defaults to default_cache_dir("photos").
+            max_size: total size in bytes the cache files may take up
+        """
+        self.cache_dir = (
+            cache_dir if cache_dir is not None else default_cache_dir("photos")
+        )
+        self.max_size = max_size
+        # Bytes the cache files take up, measured by the first store or evict and
+        # then kept up to date, so that a store does not list the whole cache
+        self.size: Optional[int] = None
+
+    def entry_path(self, path: Path, params: Dict[str, Any]) -> Path:
+        """
+        Returns the path of the cache file for an image
+
+        The name is made of three hashes: of the file path, of the file version
+        (modification time and size) and of the render options. An entry is
+        therefore never returned for a file that changed after it was rendered.
+
+        Args:
+            path: path of the image
+            params: options the image was rendered with, e.g. mode and size
+        """
+        stat = path.stat()
+        name = "{}-{}-{}.json".format(
+            digest(str(path.resolve())),
+            digest([CACHE_VERSION, stat.st_mtime_ns, stat.st_size]),
+            digest(params),
+        )
+        return self.cache_dir.joinpath(name)
+
+    def load(self, path: Path, params: Dict[str, Any]) -> Optional[Dict[str, str]]:
+        """
+        Returns the cached render of an image or None if it is not cached
+
+        Args:
+            path: path of the image
+            params: options the image was rendered with
+        """
+        try:
+            entry = self.entry_path(path, params)
+            with entry.open("r", encoding="utf-8") as f:
+                data = json.load(f)
+            # Mark the entry as recently used for the LRU eviction
+            os.utime(entry)
+        except (OSError, ValueError):
+            return None
+        return data
+
+    def store(self, path: Path, params: Dict[str, Any], data: Dict[str, str]) -> None:
+        """
+        Saves the render of an image and removes renders of older versions of it
+
+        Args:
+            path: path of the image
+            params: options the image was rendered with
+            data: rendered output to save
+        """
+        try:
+            entry = self.entry_path(path, params)
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            text = json.dumps(data)
+            change = len(text.encode()) - file_size(entry)
+            write_atomic(entry, text)
+
+            path_hash, version_hash, _ = entry.stem.split("-")
+            for old in self.cache_dir.glob(path_hash + "-*.json"):
+                if old.stem.split("-")[1] != version_hash:
+                    change -= file_size(old)
+                    old.unlink(missing_ok=True)
+        except OSError:
+            return
+        if self.size is None or self.size + change > self.max_size:
+            self.evict()
+        else:
+            self.size += change
+
+    def evict(self) -> None:
+        """
+        Removes the least recently used entries until the cache fits in max_size
+        and measures the size of the cache again
+        """
+        entries = []
+        total = 0
+        for entry in self.cache_dir.glob("*.json"):
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, entry))
+            total += stat.st_size
+
+        entries.sort()
+        for _, size, entry in entries:
+            if total <= self.max_size:
+                break
+            entry.unlink(missing_ok=True)
+            total -= size
+        self.size = total
@@ -0,0 +1,39 @@
+from typing import Iterator
+
+from PIL import Image
+
+
+def cell_rows(image: Image.Image) -> Iterator[bytes]:
+    """
+    Yields the colors of every row of half-block characters of an image
+
+    Each character shows two pixels. Whole rows of pixels are interleaved into
+    a single bytearray so that a row can be formatted with one string operation
+    instead of two getpixel calls per character. A row has six bytes per
+    character: the red, green and blue of the lower pixel, then those of the
+    upper pixel. An odd last row only has the three bytes of its pixel.
+
+    Args:
+        image: image to be rendered
+    """
+    image = image.convert("RGB")
+    width, height = image.size
+    data = image.tobytes()
+    stride = width * 3
+    cells = bytearray(width * 6)
+
+    for y in range(0, height - 1, 2):
+        start = y * stride
+        middle = start + stride
+        end = middle + stride
+        top = data[start:middle]
+        bottom = data[middle:end]
+        for channel in range(3):
+            bg_channel = channel + 3
+            cells[channel::6] = bottom[channel::3]
+            cells[bg_channel::6] = top[channel::3]
+        yield bytes(cells)
+
+    if height % 2:
+        last_row = len(data) - stride
+        yield data[last_row:]
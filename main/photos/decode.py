@@ -0,0 +1,224 @@
+import itertools
+import sys
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+
+from PIL import Image
+
+# Tags read from the EXIF data of an image
+ORIENTATION = 0x0112
+
+# Rows decoded at once when a large uncompressed image is read in strips
+STRIP_BYTES = 4 * 1024 * 1024
+
+Tile = Tuple[str, Tuple[int, int, int, int], int, tuple]
+
+
+def reset_peak_rss() -> None:
+    """Resets the peak resident set size of the process where the OS supports it"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def peak_rss() -> Optional[int]:
+    """Returns the peak resident set size of the process in bytes, if available"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+
+    try:
+        import resource
+    except ImportError:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+def reduce_factor(image_size: Tuple[int, int], size: Tuple[int, int]) -> int:
+    """
+    Returns how many times an image can be shrunk while staying twice the target size
+
+    Keeping at least twice the target size leaves enough pixels for the final
+    thumbnail to be resampled with a good filter.
+
+    Args:
+        image_size: size of the source image
+        size: box the thumbnail has to fit in
+    """
+    scale = min(size[0] / image_size[0], size[1] / image_size[1])
+    return max(1, int(1 / (scale * 2)))
+
+
+def split_tiles(image: Image.Image) -> Optional[List[Tile]]:
+    """
+    Returns the tiles of an uncompressed image cut into strips of whole rows
+
+    Returns None when the image data can not be read a part at a time, which
+    is the case for compressed formats like PNG or compressed TIFF.
+
+    Args:
+        image: image opened with Image.open that is not loaded yet
+    """
+    tiles = image.tile
+    if not tiles or any(tile[0] != "raw" for tile in tiles):
+        return None
+    if len({tile[1] for tile in tiles}) != len(tiles):
+        # Planar images store every band in its own set of tiles
+        return None
+    if image.getexif().get(ORIENTATION, 1) != 1:
+        return None
+    # The bytes of a row are needed to read a tile on its own
+    raw_tiles = []
+    for _, (x0, y0, x1, y1), offset, args in tiles:
+        if isinstance(args, str):
+            args = (args, 0, 1)
+        rawmode, stride, orientation = (tuple(args) + (0, 1))[:3]
+        if stride == 0:
+            if rawmode != image.mode or image.mode not in ("L", "RGB", "RGBA", "CMYK"):
+                return None
+            stride = (x1 - x0) * len(image.mode)
+        raw_tiles.append(
+            ("raw", (x0, y0, x1, y1), offset, (rawmode, stride, orientation))
+        )
+    if len(raw_tiles) > 1:
+        return sorted(raw_tiles, key=lambda tile: (tile[1][1], tile[1][0]))
+
+    # A single block of rows, e.g. BMP or PPM, is cut into strips
+    _, (x0, y0, x1, y1), offset, (rawmode, stride, orientation) = raw_tiles[0]
+    height = y1 - y0
+    rows = max(1, STRIP_BYTES // stride)
+    strips = []
+    for top in range(0, height, rows):
+        bottom = min(top + rows, height)
+        if orientation < 0:
+            # Bottom-up images store the last row first
+            strip_offset = offset + (height - bottom) * stride
+        else:
+            strip_offset = offset + top * stride
+        strips.append(
+            (
+                "raw",
+                (x0, y0 + top, x1, y0 + bottom),
+                strip_offset,
+                (rawmode, stride, orientation),
+            )
+        )
+    return strips
+
+
+def load_tile(path: Path, tile: Tile, image_mode: str, mode: str) -> Image.Image:
+    """
+    Decodes a single tile of an image file, reading only the bytes of the tile
+
+    Args:
+        path: path of the image
+        tile: tile to decode, as returned by split_tiles
+        image_mode: mode of the image
+        mode: mode to convert the decoded tile to
+    """
+    decoder, (x0, y0, x1, y1), offset, args = tile
+    _, stride, _ = args
+    with path.open("rb") as f:
+        f.seek(offset)
+        data = f.read(stride * (y1 - y0))
+    part = Image.frombytes(image_mode, (x1 - x0, y1 - y0), data, decoder, args)
+    return part.convert(mode)
+
+
+def load_bands(
+    path: Path, tiles: List[Tile], width: int, image_mode: str, mode: str
+) -> Iterator[Image.Image]:
+    """
+    Decodes an image one band of rows at a time
+
+    Args:
+        path: path of the image
+        tiles: tiles of the image sorted top to bottom, as returned by split_tiles
+        width: width of the image
+        image_mode: mode of the image
+        mode: mode of the returned bands
+    """
+    for (y0, y1), row in itertools.groupby(
+        tiles, lambda tile: (tile[1][1], tile[1][3])
+    ):
+        band = Image.new(mode, (width, y1 - y0))
+        for tile in row:
+            band.paste(load_tile(path, tile, image_mode, mode), (tile[1][0], 0))
+        yield band
+
+
+def reduce_bands(
+    bands: Iterator[Image.Image], size: Tuple[int, int], factor: int, mode: str
+) -> Image.Image:
+    """
+    Shrinks an image given as bands of rows by a whole factor
+
+    The result is the same as Image.reduce on the full image, but only a band
+    and a few leftover rows are held in memory at a time.
+
+    Args:
+        bands: bands of rows from top to bottom
+        size: size of the full image
+        factor: reduction factor for both dimensions
+        mode: mode of the bands
+    """
+    width, height = size
+    reduced = Image.new(mode, (-(-width // factor), -(-height // factor)))
+    leftover: Optional[Image.Image] = None
+    y = 0
+    for band in bands:
+        if leftover is not None:
+            merged = Image.new(mode, (width, leftover.height + band.height))
+            merged.paste(leftover, (0, 0))
+            merged.paste(band, (0, leftover.height))
+            band = merged
+        usable = band.height - band.height % factor
+        if usable:
+            reduced.paste(band.crop((0, 0, width, usable)).reduce(factor), (0, y))
+            y += usable // factor
+        leftover = (
+            band.crop((0, usable, width, band.height)) if usable < band.height else None
+        )
+    if leftover is not None:
+        reduced.paste(leftover.reduce(factor), (0, y))
+    return reduced
+
+
+def open_thumbnail(path: Path, size: Tuple[int, int]) -> Image.Image:
+    """
+    Opens an image already shrunk to fit in size without decoding it at full size
+
+    JPEG images are decoded at 1/2, 1/4 or 1/8 scale with draft mode.
+    Uncompressed images (BMP, PPM, uncompressed TIFF, ...) are decoded in
+    strips that are reduced as they are read. Other formats are decoded at
+    full size, as Pillow can only decode them in one go.
+
+    Args:
+        path: path of the image
+        size: box the thumbnail has to fit in
+    """
+    with Image.open(path) as image:
+        factor = reduce_factor(image.size, size)
+        if image.format == "JPEG":
+            image.draft("RGB", (image.width // factor, image.height // factor))
+        elif factor > 1:
+            tiles = split_tiles(image)
+            if tiles is not None:
+                has_alpha = "A" in image.mode or "transparency" in image.info
+                mode = "RGBA" if has_alpha else "RGB"
+                bands = load_bands(path, tiles, image.width, image.mode, mode)
+                thumbnail = reduce_bands(bands, image.size, factor, mode)
+                thumbnail.thumbnail(size, Image.HAMMING)
+                return thumbnail
+        image.thumbnail(size, Image.HAMMING)
+        # Read an image that was small enough already before the file is closed
+        image.load()
+        return image
@@ -0,0 +1,378 @@
+import os
+import shutil
+import threading
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+from PIL import Image
+from prompt_toolkit import ANSI, Application
+from prompt_toolkit.application.current import get_app
+from prompt_toolkit.formatted_text import StyleAndTextTuples, fragment_list_width
+from prompt_toolkit.key_binding import KeyBindings
+from prompt_toolkit.key_binding.key_processor import KeyPressEvent
+from prompt_toolkit.layout.containers import HSplit, VSplit, Window, WindowAlign
+from prompt_toolkit.layout.controls import FormattedTextControl
+from prompt_toolkit.layout.layout import Layout
+from prompt_toolkit.output.color_depth import ColorDepth
+from prompt_toolkit.styles.style import _MergedStyle
+
+from .cache import RenderCache
+from .decode import open_thumbnail
+from .photos import ImageViewer
+
+# Spaces between two thumbnails
+GAP = 2
+
+
+def image_paths(directory: Path) -> List[Path]:
+    """
+    Returns the image files in a directory sorted by name
+
+    Args:
+        directory: directory to look for images in
+    """
+    extensions = Image.registered_extensions()
+    paths = [
+        path
+        for path in directory.iterdir()
+        if path.suffix.lower() in extensions and path.is_file()
+    ]
+    return sorted(paths, key=lambda path: path.name.lower())
+
+
+def render_thumbnail(
+    path: Path, size: Tuple[int, int], tolerance: int, cache: RenderCache
+) -> Optional[List[str]]:
+    """
+    Renders a thumbnail as rows of ANSI text, this runs in a worker process
+
+    Every row starts from the default colors so that the rows can be placed
+    next to each other in the grid.
+
+    Args:
+        path: path of the image
+        size: size of the thumbnail in characters
+        tolerance: color tolerance passed to ImageViewer.coalesced_ansi_rows
+        cache: cache of rendered images
+
+    Returns:
+        Optional[List[str]]: rows of the thumbnail, None if it can not be opened
+    """
+    params = {"mode": "GALLERY", "size": list(size), "tolerance": tolerance}
+    try:
+        cached = cache.load(path, params)
+        if cached is not None:
+            return cached["image_string"].split("\n")
+
+        image = open_thumbnail(path, (size[0], size[1] * 2))
+        rows = ImageViewer.coalesced_ansi_rows(image, tolerance, reset_rows=True)
+    except Exception:
+        # Anything Pillow can not decode is shown as a broken cell
+        return None
+
+    cache.store(path, params, {"image_string": "\n".join(rows)})
+    return rows
+
+
+class Gallery:
+    """Contact sheet of all the images in a directory"""
+
+    def __init__(
+        self,
+        path: Path,
+        cell_size: Tuple[int, int] = (24, 12),
+        style: Optional[_MergedStyle] = None,
+        tolerance: int = 0,
+        cache: Optional[RenderCache] = None,
+        workers: Optional[int] = None,
+    ):
+        """
+        Constructor for class Gallery
+
+        Args:
+            path: directory with the images
+            cell_size: size of a thumbnail in characters
+            style: styles for the app
+            tolerance: color tolerance of the thumbnails
+            cache: cache of rendered images. Defaults to RenderCache().
+            workers: number of worker processes. Defaults to the number of CPUs.
+        """
+        self.path = path
+        self.cell_size = cell_size
+        self.style = style
+        self.tolerance = tolerance
+        self.cache = cache if cache is not None else RenderCache()
+        self.workers = workers or os.cpu_count() or 1
+        self.paths = image_paths(path)
+        self.cells: Dict[int, List[StyleAndTextTuples]] = {}
+        self.failed: Set[int] = set()
+        self.page = 0
+        self.page_range = range(0)
+        self.per_page = 1
+        self.stopped = threading.Event()
+        self.app: Optional[Application] = None
+
+    def grid_shape(self, columns: int, lines: int) -> Tuple[int, int]:
+        """
+        Returns how many thumbnails fit in a row and how many rows fit on a page
+
+        Args:
+            columns: width of the terminal
+            lines: height of the terminal
+        """
+        width, height = self.cell_size
+        # The title bar, the empty line below it and the status bar
+        lines -= 3
+        # Every thumbnail has its file name below it
+        return max(1, (columns + GAP) // (width + GAP)), max(1, lines // (height + 1))
+
+    def update_page_range(self, columns: int, lines: int) -> None:
+        """
+        Works out which thumbnails are on the current page
+
+        Args:
+            columns: width of the terminal
+            lines: height of the terminal
+        """
+        grid_columns, grid_rows = self.grid_shape(columns, lines)
+        self.per_page = grid_columns * grid_rows
+        self.page = max(0, min(self.page, (len(self.paths) - 1) // self.per_page))
+        start = self.page * self.per_page
+        self.page_range = range(start, min(start + self.per_page, len(self.paths)))
+
+    def next_request(self, requested: List[bool], start: int) -> int:
+        """
+        Returns the index of the next thumbnail to render
+
+        Thumbnails on the current page go first, then the rest in order.
+
+        Args:
+            requested: which thumbnails were already sent to a worker
+            start: index before which all thumbnails were already sent
+        """
+        for index in self.page_range:
+            if not requested[index]:
+                return index
+        while requested[start]:
+            start += 1
+        return start
+
+    def feed(self, executor: Executor) -> None:
+        """
+        Sends the thumbnails to the workers, runs in a background thread
+
+        Only a few tasks are queued at a time, so thumbnails of a page the user
+        switches to are rendered before the rest.
+
+        Args:
+            executor: pool of workers to render the thumbnails in
+        """
+        requested = [False] * len(self.paths)
+        slots = threading.Semaphore(self.workers * 2)
+        start = 0
+        for _ in range(len(self.paths)):
+            while not slots.acquire(timeout=0.1):
+                if self.stopped.is_set():
+                    return
+            if self.stopped.is_set():
+                return
+            index = self.next_request(requested, start)
+            requested[index] = True
+            if index == start:
+                start += 1
+            try:
+                future = executor.submit(
+                    render_thumbnail,
+                    self.paths[index],
+                    self.cell_size,
+                    self.tolerance,
+                    self.cache,
+                )
+            except RuntimeError:
+                # The pool was shut down because the app exited
+                return
+            future.add_done_callback(partial(self.thumbnail_done, index, slots))
+
+    def thumbnail_done(
+        self, index: int, slots: threading.Semaphore, future: Future
+    ) -> None:
+        """
+        Stores a rendered thumbnail and redraws the app
+
+        Args:
+            index: index of the thumbnail
+            slots: semaphore limiting the number of queued tasks
+            future: finished task
+        """
+        slots.release()
+        if future.cancelled():
+            return
+        try:
+            rows = future.result()
+        except Exception:
+            rows = None
+
+        if rows is None:
+            self.failed.add(index)
+        else:
+            # Parse the escape codes here instead of on every redraw
+            self.cells[index] = [ANSI(row).__pt_formatted_text__() for row in rows]
+        if self.app is not None:
+            self.app.invalidate()
+
+    def cell_line(self, index: int, line: int) -> StyleAndTextTuples:
+        """
+        Returns one line of a thumbnail padded to the width of a cell
+
+        Args:
+            index: index of the thumbnail
+            line: line of the thumbnail
+        """
+        width, height = self.cell_size
+        if index in self.cells:
+            rows = self.cells[index]
+            if line < len(rows):
+                fragments = list(rows[line])
+                padding = width - fragment_list_width(fragments)
+                return fragments + [("", " " * padding)]
+        elif line == height // 2:
+            text = "cannot open" if index in self.failed else "loading..."
+            return [("", text.center(width))]
+        return [("", " " * width)]
+
+    def get_grid(self) -> StyleAndTextTuples:
+        """Returns the thumbnails on the current page as formatted text"""
+        size = get_app().output.get_size()
+        self.update_page_range(size.columns, size.rows)
+        grid_columns, _ = self.grid_shape(size.columns, size.rows)
+        width, height = self.cell_size
+        gap = ("", " " * GAP)
+
+        fragments: StyleAndTextTuples = []
+        for row_start in range(
+            self.page_range.start, self.page_range.stop, grid_columns
+        ):
+            indexes = range(
+                row_start, min(row_start + grid_columns, self.page_range.stop)
+            )
+            for line in range(height):
+                for index in indexes:
+                    fragments.extend(self.cell_line(index, line))
+                    fragments.append(gap)
+                fragments.append(("", "\n"))
+            for index in indexes:
+                name = self.paths[index].name
+                fragments.append(("", name[:width].ljust(width)))
+                fragments.append(gap)
+            fragments.append(("", "\n"))
+        return fragments
+
+    def get_status(self) -> str:
+        """Returns the page number and how many thumbnails are rendered"""
+        pages = max(1, -(-len(self.paths) // self.per_page))
+        return "Page {}/{} | {}/{} images".format(
+            self.page + 1,
+            pages,
+            len(self.cells) + len(self.failed),
+            len(self.paths),
+        )
+
+    def run_app(self) -> None:
+        """Run the Gallery app"""
+        if not self.paths:
+            print("No images found in {}".format(self.path))
+            return
+
+        columns, lines = shutil.get_terminal_size()
+        self.update_page_range(columns, lines)
+        self.app = self.make_app()
+        executor = ProcessPoolExecutor(max_workers=self.workers)
+        feeder = threading.Thread(target=self.feed, args=(executor,), daemon=True)
+        feeder.start()
+        try:
+            self.app.run()
+        finally:
+            self.stopped.set()
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def make_app(self) -> Application:
+        """Create the app to show the thumbnails"""
+        kb = KeyBindings()
+
+        @kb.add("c-d")
+        def _exit(event: KeyPressEvent) -> None:
+            """Exits from the app
+
+            Args:
+                event (KeyPressEvent): Takes an KeyPress event
+            """
+            event.app.exit()
+
+        @kb.add("pagedown")
+        @kb.add("right")
+        def _next_page(event: KeyPressEvent) -> None:
+            """Shows the next page of thumbnails
+
+            Args:
+                event (KeyPressEvent): Takes an KeyPress event
+            """
+            self.page += 1
+
+        @kb.add("pageup")
+        @kb.add("left")
+        def _previous_page(event: KeyPressEvent) -> None:
+            """Shows the previous page of thumbnails
+
+            Args:
+                event (KeyPressEvent): Takes an KeyPress event
+            """
+            self.page = max(0, self.page - 1)
+
+        layout = Layout(
+            HSplit(
+                [
+                    Window(
+                        content=FormattedTextControl(
+                            "Photos - {}".format(self.path.name)
+                        ),
+                        height=1,
+                        always_hide_cursor=True,
+                        align=WindowAlign.CENTER,
+                        style="class:frame",
+                    ),
+                    Window(content=None, height=1),
+                    Window(
+                        content=FormattedTextControl(self.get_grid),
+                        always_hide_cursor=True,
+                    ),
+                    VSplit(
+                        [
+                            Window(
+                                content=FormattedTextControl(
+                                    "<Ctrl+D=Exit> <PgUp/PgDn=Page>"
+                                ),
+                                always_hide_cursor=True,
+                                align=WindowAlign.LEFT,
+                            ),
+                            Window(
+                                content=FormattedTextControl(self.get_status),
+                                always_hide_cursor=True,
+                                align=WindowAlign.RIGHT,
+                            ),
+                        ],
+                        height=1,
+                        style="class:frame",
+                    ),
+                ],
+                key_bindings=kb,
+            )
+        )
+        app: Application = Application(
+            layout=layout,
+            full_screen=True,
+            style=self.style,
+            color_depth=ColorDepth.TRUE_COLOR,
+        )
+        return app
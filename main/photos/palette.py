@@ -0,0 +1,105 @@
+from functools import lru_cache
+from typing import List, Tuple
+
+from PIL import Image, ImageChops
+from prompt_toolkit.output.vt100 import ANSI_COLORS_TO_RGB, FG_ANSI_COLORS
+
+Color = Tuple[int, int, int]
+
+# Threshold map for 4x4 ordered (Bayer) dithering, values 0 to 15
+BAYER_4X4 = bytes([0, 8, 2, 10, 12, 4, 14, 6, 3, 11, 1, 9, 15, 7, 13, 5])
+
+# Distance between palette levels the dithering has to bridge
+DITHER_SPREAD = {"ANSI256": 40, "ANSI16": 128}
+
+
+def ansi16_colors() -> List[Tuple[int, Color]]:
+    """Returns the 16 ANSI colors as (foreground code, rgb) in code order"""
+    codes = sorted(
+        (code, name) for name, code in FG_ANSI_COLORS.items() if name != "ansidefault"
+    )
+    return [(code, ANSI_COLORS_TO_RGB[name]) for code, name in codes]
+
+
+# The 6x6x6 color cube and the greys of the xterm palette. prompt_toolkit has
+# no entries for 254 and 255 and reads 232 as black, so those are left out.
+XTERM_CODES = list(range(16, 232)) + list(range(233, 254))
+
+
+def xterm256_colors() -> List[Color]:
+    """Returns the colors of XTERM_CODES"""
+    levels = (0, 95, 135, 175, 215, 255)
+    cube = [(r, g, b) for r in levels for g in levels for b in levels]
+    greys = [(level, level, level) for level in range(18, 228, 10)]
+    return cube + greys
+
+
+# Escape parameters of every palette index for the foreground and background
+FG_PARAMS = {
+    "ANSI16": [str(code) for code, _ in ansi16_colors()],
+    "ANSI256": ["38;5;{}".format(code) for code in XTERM_CODES],
+}
+BG_PARAMS = {
+    "ANSI16": [str(code + 10) for code, _ in ansi16_colors()],
+    "ANSI256": ["48;5;{}".format(code) for code in XTERM_CODES],
+}
+
+
+@lru_cache(maxsize=None)
+def palette_image(mode: str) -> Image.Image:
+    """
+    Returns an image holding the palette of a color mode, built once per mode
+
+    Args:
+        mode: ANSI16 or ANSI256
+    """
+    if mode == "ANSI16":
+        colors = [color for _, color in ansi16_colors()]
+    else:
+        colors = xterm256_colors()
+    image = Image.new("P", (1, 1))
+    image.putpalette([channel for color in colors for channel in color])
+    return image
+
+
+@lru_cache(maxsize=8)
+def bayer_offsets(size: Tuple[int, int], spread: int) -> Image.Image:
+    """
+    Returns the ordered dithering threshold map tiled over an image size
+
+    Args:
+        size: size of the image to dither
+        spread: distance between palette levels
+    """
+    tile = Image.frombytes("L", (4, 4), BAYER_4X4).point(
+        lambda value: value * spread // 16
+    )
+    tiled = Image.new("L", size)
+    for y in range(0, size[1], 4):
+        for x in range(0, size[0], 4):
+            tiled.paste(tile, (x, y))
+    return Image.merge("RGB", (tiled, tiled, tiled))
+
+
+def quantize(image: Image.Image, mode: str, dither: bool = False) -> Image.Image:
+    """
+    Returns the image mapped to the palette of a color mode
+
+    The mapping to the nearest palette color is done by Pillow in C. With
+    dither an ordered threshold map is added first, which spreads the error
+    in a fixed pattern that does not change between renders.
+
+    Args:
+        image: image to quantize
+        mode: ANSI16 or ANSI256
+        dither: whether to use ordered dithering
+
+    Returns:
+        Image.Image: image in mode P whose values are indexes into FG_PARAMS
+    """
+    image = image.convert("RGB")
+    if dither:
+        spread = DITHER_SPREAD[mode]
+        offsets = bayer_offsets(image.size, spread)
+        image = ImageChops.add(image, offsets, 1.0, -spread // 2)
+    return image.quantize(palette=palette_image(mode), dither=Image.NONE)
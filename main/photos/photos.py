@@ -1,10 +1,13 @@
 import os
-import sys
+import shutil
+import time
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import Any, Dict, List, Optional, OrderedDict, Sequence, Tuple
 
 from PIL import Image
 from prompt_toolkit import ANSI, Application
+from prompt_toolkit.application.current import get_app
+from prompt_toolkit.formatted_text import StyleAndTextTuples
 from prompt_toolkit.key_binding import KeyBindings
 from prompt_toolkit.key_binding.key_processor import KeyPressEvent
 from prompt_toolkit.layout.containers import HSplit, VSplit, Window, WindowAlign
@@ -13,6 +16,33 @@ from prompt_toolkit.layout.layout import Layout
 from prompt_toolkit.output.color_depth import ColorDepth
 from prompt_toolkit.styles.style import _MergedStyle
 
+from .animation import Animation, is_animated
+from .cache import RenderCache
+from .cells import cell_rows
+from .decode import open_thumbnail, peak_rss, reset_peak_rss
+from .palette import BG_PARAMS, FG_PARAMS, quantize
+
+Color = Tuple[int, int, int]
+
+# Number of decimal digits needed to print each byte value
+DIGITS = bytes(len(str(i)) for i in range(256))
+
+# Largest size the image is decoded at, renders for any window size are made from it
+SOURCE_SIZE = (1024, 1024)
+
+# Renders kept in memory, so resizing back and forth does not render again
+MAX_RENDERS = 16
+
+# Modes that draw the image with half-block characters and their color depths
+ANSI_MODES = {
+    "ANSI": ColorDepth.TRUE_COLOR,
+    "ANSI256": ColorDepth.DEPTH_8_BIT,
+    "ANSI16": ColorDepth.DEPTH_4_BIT,
+}
+
+# Lines used by the title bar, the empty line below it and the status bar
+FRAME_LINES = 3
+
 
 class ImageViewer:
     """Image viewer class"""
@@ -21,25 +51,41 @@ class ImageViewer:
         self,
         path: Path,
         mode: str = "ANSI",
-        size: Tuple[int, int] = (100, 50),
+        size: Optional[Tuple[int, int]] = None,
         style: Optional[_MergedStyle] = None,
+        tolerance: int = 0,
+        cache: Optional[RenderCache] = None,
+        dither: bool = False,
     ):
         self.path = path
         self.mode = mode.upper()
+        self.dither = dither
+        # Largest size of the image in pixels, None to fill the window
         self.size = size
         self.style = style
+        self.tolerance = tolerance
+        self.cache = cache if cache is not None else RenderCache()
         self.image_string: str = ""
+        self.output_info: str = ""
+        self.decode_info: str = ""
+        self.source: Optional[Image.Image] = None
+        self.window_size: Optional[Tuple[int, int]] = None
+        self.fragments: StyleAndTextTuples = []
+        self.renders: OrderedDict[
+            Tuple[int, int], Tuple[StyleAndTextTuples, str]
+        ] = OrderedDict()
 
     @staticmethod
-    def resize_image(image: Image.Image) -> Image.Image:
+    def resize_image(image: Image.Image, height: Optional[int] = None) -> Image.Image:
         """
         Returns the resized image
 
         Args:
             image: image to be resized
+            height: new height. Defaults to the height of the terminal.
         """
         (w, h) = image.size
-        new_height = os.get_terminal_size()[1]
+        new_height = height if height is not None else os.get_terminal_size()[1]
         # Aspect ratio with height
         aspect_ratio = w / h
         new_width = int(aspect_ratio * new_height)
@@ -78,44 +124,350 @@ class ImageViewer:
         """
         return "\x1b[48;2;{};{};{}m".format(r, g, b)
 
+    @staticmethod
+    def ansi_rows(image: Image.Image) -> List[str]:
+        """
+        Returns the image rendered as rows of ANSI half-block characters
+
+        Each character shows two pixels: the upper pixel as the background and
+        the lower pixel as the foreground of "▄", see cell_rows. An odd last row
+        is drawn with "▀" over the default background.
+
+        Args:
+            image: image to be rendered
+        """
+        width = image.width
+        row_format = "\x1b[38;2;%d;%d;%dm\x1b[48;2;%d;%d;%dm▄" * width
+        last_format = "\x1b[49m" + "\x1b[38;2;%d;%d;%dm▀" * width
+        rows = []
+        for cells in cell_rows(image):
+            # An odd last row has one pixel per character
+            row = row_format if len(cells) == width * 6 else last_format
+            rows.append(row % tuple(cells))
+        return rows
+
+    @staticmethod
+    def ansi_size(image: Image.Image) -> int:
+        """
+        Returns the size in bytes of the output of ansi_rows without building it
+
+        Args:
+            image: image to be rendered
+        """
+        image = image.convert("RGB")
+        width, height = image.size
+        # Every channel of every pixel is printed once as a decimal number
+        size = sum(image.tobytes().translate(DIGITS))
+        # "\x1b[38;2;" and "\x1b[48;2;" with ";", ";", "m", plus "▄" and "\n"
+        size += (height // 2) * (width * 23 + 1)
+        if height % 2:
+            # "\x1b[49m", then one foreground color and "▀" per cell, and "\n"
+            size += 5 + width * 13 + 1
+        return size
+
+    @staticmethod
+    def color_distance(color1: Color, color2: Color) -> float:
+        """
+        Returns the perceptual distance between two colors
+
+        Uses the "redmean" approximation, which weights the channels by how
+        sensitive the eye is to them. Black and white are about 765 apart.
+
+        Args:
+            color1, color2: rgb colors to compare
+        """
+        r_mean = (color1[0] + color2[0]) / 2
+        r = color1[0] - color2[0]
+        g = color1[1] - color2[1]
+        b = color1[2] - color2[2]
+        return (
+            (2 + r_mean / 256) * r * r + 4 * g * g + (2 + (255 - r_mean) / 256) * b * b
+        ) ** 0.5
+
+    @classmethod
+    def coalesced_ansi_rows(
+        cls, image: Image.Image, tolerance: int = 0, reset_rows: bool = False
+    ) -> List[str]:
+        """
+        Returns the image as rows of ANSI half-block characters with minimal escapes
+
+        Same picture as ansi_rows, but a color is only emitted when it differs
+        from the current foreground or background, both changes share a single
+        escape sequence, and runs of unchanged cells are written as plain "▄".
+        The colors are carried over from one row to the next.
+
+        Args:
+            image: image to be rendered
+            tolerance: colors closer than this to the current color (see
+                color_distance) are drawn with the current color to make longer runs
+            reset_rows: start every row from the default colors instead, so that
+                the rows can be placed next to other text
+        """
+        image = image.convert("RGB")
+        width, height = image.size
+        data = image.tobytes()
+        stride = width * 3
+        fg_state: Optional[Color] = None
+        bg_state: Optional[Color] = None
+        rows = []
+
+        def pixels(start: int) -> List[Color]:
+            """Returns the colors of the row of pixels starting at the byte offset"""
+            end = start + stride
+            row = data[start:end]
+            return list(zip(row[0::3], row[1::3], row[2::3]))
+
+        for y in range(0, height, 2):
+            if reset_rows:
+                fg_state = bg_state = None
+            start = y * stride
+            bgs: Sequence[Optional[Color]]
+            if y + 1 < height:
+                fgs, bgs = pixels(start + stride), pixels(start)
+                block = "▄"
+            else:
+                fgs, bgs = pixels(start), [None] * width
+                block = "▀"
+
+            parts = []
+            run = 0
+            for fg, bg in zip(fgs, bgs):
+                if tolerance:
+                    if fg_state and cls.color_distance(fg, fg_state) <= tolerance:
+                        fg = fg_state
+                    if (
+                        bg
+                        and bg_state
+                        and cls.color_distance(bg, bg_state) <= tolerance
+                    ):
+                        bg = bg_state
+                params = []
+                if fg != fg_state:
+                    params.append("38;2;%d;%d;%d" % fg)
+                    fg_state = fg
+                if bg != bg_state:
+                    params.append("48;2;%d;%d;%d" % bg if bg else "49")
+                    bg_state = bg
+                if params:
+                    if run:
+                        parts.append(block * run)
+                        run = 0
+                    parts.append("\x1b[" + ";".join(params) + "m")
+                run += 1
+            parts.append(block * run)
+            rows.append("".join(parts))
+        return rows
+
+    @staticmethod
+    def indexed_ansi_rows(image: Image.Image, mode: str) -> List[str]:
+        """
+        Returns a palette image as rows of ANSI half-block characters
+
+        Works like coalesced_ansi_rows but writes the short 256 or 16 color
+        escape codes.
+
+        Args:
+            image: image from palette.quantize
+            mode: ANSI256 or ANSI16
+        """
+        fg_params = FG_PARAMS[mode]
+        bg_params = BG_PARAMS[mode]
+        width, height = image.size
+        data = image.tobytes()
+        fg_state: Optional[int] = None
+        bg_state: Optional[int] = None
+        rows = []
+
+        for y in range(0, height, 2):
+            start = y * width
+            middle = start + width
+            end = middle + width
+            bgs: Sequence[Optional[int]]
+            if y + 1 < height:
+                fgs, bgs = data[middle:end], data[start:middle]
+                block = "▄"
+            else:
+                fgs, bgs = data[start:middle], [None] * width
+                block = "▀"
+
+            parts = []
+            run = 0
+            for fg, bg in zip(fgs, bgs):
+                params = []
+                if fg != fg_state:
+                    params.append(fg_params[fg])
+                    fg_state = fg
+                if bg != bg_state:
+                    params.append(bg_params[bg] if bg is not None else "49")
+                    bg_state = bg
+                if params:
+                    if run:
+                        parts.append(block * run)
+                        run = 0
+                    parts.append("\x1b[" + ";".join(params) + "m")
+                run += 1
+            parts.append(block * run)
+            rows.append("".join(parts))
+        return rows
+
     def view_ansi(self, image: Image.Image) -> None:
         """View the image in ANSI mode"""
-        for y in range(0, image.height, 2):
-            for x in range(0, image.width):
-                try:
-                    fg_color = image.getpixel((x, y + 1))[:3]
-                    bg_color = image.getpixel((x, y))[:3]
-                except IndexError:
-                    continue
-
-                fg = self.ansi_fg(*fg_color)
-                bg = self.ansi_bg(*bg_color)
-                self.image_string += "{}{}▄".format(fg, bg)
-            self.image_string += "\n"
-
-    def view_ascii(self, image: Image.Image) -> None:
-        """View the image in ASCII mode"""
-        image = self.resize_image(image)
+        if self.mode == "ANSI":
+            rows = self.coalesced_ansi_rows(image, self.tolerance)
+        else:
+            palette_image = quantize(image, self.mode, self.dither)
+            rows = self.indexed_ansi_rows(palette_image, self.mode)
+        self.image_string += "".join(row + "\n" for row in rows)
+
+        size = len(self.image_string.encode())
+        full_size = self.ansi_size(image)
+        self.output_info = "{:,} bytes, {:.0%} less than {:,}".format(
+            size, 1 - size / full_size, full_size
+        )
+
+    def view_ascii(self, image: Image.Image, height: Optional[int] = None) -> None:
+        """
+        View the image in ASCII mode
+
+        Args:
+            image: image to be rendered
+            height: height in lines. Defaults to the height of the terminal.
+        """
+        image = self.resize_image(image, height)
         # Convert image to greyscale
         image = image.convert("L")
+        table = bytes(ord(self.rgb2ascii(px)) for px in range(256))
 
-        for y in range(0, image.height):
-            for x in range(0, image.width):
-                color = image.getpixel((x, y))
+        data = image.tobytes().translate(table).decode()
+        for start in range(0, len(data), image.width):
+            end = start + image.width
+            self.image_string += data[start:end] + "\n"
 
-                self.image_string += self.rgb2ascii(color)
-            self.image_string += "\n"
+    def window_box(self, window_size: Tuple[int, int]) -> Tuple[int, int]:
+        """
+        Returns the box the rendered image has to fit in for a window size
 
-    def run_app(self) -> None:
-        """Run the ImageViewer app"""
-        image = Image.open(self.path)
-        image.thumbnail(self.size, Image.HAMMING)
-        # image = self.resize_image(image)
+        In ANSI mode every character shows two pixels, one above the other.
 
+        Args:
+            window_size: columns and lines available for the image
+        """
+        columns, lines = window_size
+        if self.mode in ANSI_MODES:
+            box = (columns, lines * 2)
+        else:
+            box = (columns, lines)
+        if self.size is not None:
+            box = (min(box[0], self.size[0]), min(box[1], self.size[1]))
+        return max(1, box[0]), max(1, box[1])
+
+    def render_params(self, box: Tuple[int, int]) -> Dict[str, Any]:
+        """
+        Returns the options that decide what the rendered image looks like
+
+        Args:
+            box: box the rendered image has to fit in
+        """
+        params: Dict[str, Any] = {"mode": self.mode, "size": list(box)}
         if self.mode == "ANSI":
+            params.update(tolerance=self.tolerance)
+        elif self.mode in ANSI_MODES:
+            params.update(dither=self.dither)
+        return params
+
+    def load_source(self) -> Image.Image:
+        """Decodes the image once and keeps it for renders at other sizes"""
+        if self.source is None:
+            reset_peak_rss()
+            start = time.perf_counter()
+            self.source = open_thumbnail(self.path, SOURCE_SIZE)
+            self.source.load()
+            self.decode_info = "decoded in {:.0f} ms".format(
+                (time.perf_counter() - start) * 1000
+            )
+            rss = peak_rss()
+            if rss is not None:
+                self.decode_info += ", peak RSS {:.1f} MB".format(rss / 1024 / 1024)
+        return self.source
+
+    def render(self, window_size: Optional[Tuple[int, int]] = None) -> None:
+        """
+        Renders the image into image_string, reusing a cached render if possible
+
+        Args:
+            window_size: columns and lines available for the image. Defaults
+                to the size of the terminal without the title and status bars.
+        """
+        if window_size is None:
+            columns, lines = shutil.get_terminal_size()
+            window_size = (columns, lines - FRAME_LINES)
+        box = self.window_box(window_size)
+
+        self.image_string = ""
+        self.output_info = ""
+        params = self.render_params(box)
+        cached = self.cache.load(self.path, params)
+        if cached is not None:
+            self.image_string = cached["image_string"]
+            self.output_info = cached["output_info"]
+            if self.source is None:
+                self.decode_info = "cached"
+            return
+
+        image = self.load_source()
+        if self.mode in ANSI_MODES:
+            image = image.copy()
+            image.thumbnail(box, Image.HAMMING)
             self.view_ansi(image)
         elif self.mode == "ASCII":
-            self.view_ascii(image)
+            width, height = image.size
+            self.view_ascii(image, max(1, min(box[1], box[0] * height // width)))
+
+        self.cache.store(
+            self.path,
+            params,
+            {"image_string": self.image_string, "output_info": self.output_info},
+        )
+
+    def show(self, window_size: Tuple[int, int]) -> None:
+        """
+        Shows the image rendered for a window size, rendering it only once per size
+
+        Args:
+            window_size: columns and lines available for the image
+        """
+        self.window_size = window_size
+        box = self.window_box(window_size)
+        if box in self.renders:
+            self.renders.move_to_end(box)
+        else:
+            self.render(window_size)
+            # Parse the escape codes once instead of on every redraw
+            fragments = ANSI(self.image_string).__pt_formatted_text__()
+            self.renders[box] = (fragments, self.output_info)
+            if len(self.renders) > MAX_RENDERS:
+                self.renders.popitem(last=False)
+        self.fragments, self.output_info = self.renders[box]
+
+    def get_image(self) -> StyleAndTextTuples:
+        """Returns the image for the current size of the terminal"""
+        size = get_app().output.get_size()
+        window_size = (size.columns, max(1, size.rows - FRAME_LINES))
+        if window_size != self.window_size:
+            self.show(window_size)
+        return self.fragments
+
+    def get_info(self) -> str:
+        """Returns the decode and output information shown in the status bar"""
+        return " | ".join(info for info in (self.decode_info, self.output_info) if info)
+
+    def run_app(self) -> None:
+        """Run the ImageViewer app"""
+        if self.mode == "ANSI" and is_animated(self.path):
+            columns, lines = shutil.get_terminal_size()
+            size = self.window_box((columns, lines - FRAME_LINES))
+            Animation(path=self.path, size=size, style=self.style).run_app()
+            return
 
         app = self.make_app()
         app.run()
@@ -136,9 +488,7 @@ class ImageViewer:
         container = VSplit(
             [
                 Window(
-                    content=FormattedTextControl(
-                        text=ANSI(self.image_string),
-                    ),
+                    content=FormattedTextControl(text=self.get_image),
                     always_hide_cursor=True,
                     align=WindowAlign.CENTER,
                 )
@@ -158,11 +508,20 @@ class ImageViewer:
                     ),
                     Window(content=None, height=1),
                     container,
-                    Window(
-                        content=FormattedTextControl("<Ctrl+D=Exit>"),
+                    VSplit(
+                        [
+                            Window(
+                                content=FormattedTextControl("<Ctrl+D=Exit>"),
+                                always_hide_cursor=True,
+                                align=WindowAlign.LEFT,
+                            ),
+                            Window(
+                                content=FormattedTextControl(self.get_info),
+                                always_hide_cursor=True,
+                                align=WindowAlign.RIGHT,
+                            ),
+                        ],
                         height=1,
-                        always_hide_cursor=True,
-                        align=WindowAlign.LEFT,
                         style="class:frame",
                     ),
                 ],
@@ -173,18 +532,6 @@ class ImageViewer:
             layout=layout,
             full_screen=True,
             style=self.style,
-            color_depth=ColorDepth.TRUE_COLOR,
+            color_depth=ANSI_MODES.get(self.mode, ColorDepth.TRUE_COLOR),
         )
         return app
-
-
-if __name__ == "__main__":
-    if len(sys.argv) > 1:
-        path = sys.argv[1]
-        if len(sys.argv) > 2:
-            mode = sys.argv[2]
-        else:
-            mode = "ANSI"
-        ImageViewer(path=Path(path), mode=mode).run_app()
-    else:
-        print("Usage: photos img_path")
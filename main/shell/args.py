@@ -0,0 +1,27 @@
+import shlex
+from typing import List
+
+
+def split_args(input_text: str) -> List[str]:
+    """
+    Splits the input of the shell into arguments
+
+    Double quotes keep text with spaces together. Backslashes, # and
+    apostrophes are kept as they are typed, as they are in DOS paths and text.
+
+    Args:
+        input_text: arguments in a single string
+
+    Returns:
+        List[str]: arguments as a list of strings
+    """
+    lexer = shlex.shlex(input_text, posix=True)
+    lexer.whitespace_split = True
+    lexer.escape = ""
+    lexer.commenters = ""
+    lexer.quotes = '"'
+    try:
+        return list(lexer)
+    except ValueError:
+        # A quote that is not closed
+        return input_text.strip().split()
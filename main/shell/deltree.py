@@ -0,0 +1,193 @@
+import os
+import threading
+import time
+from pathlib import Path
+from typing import List, Optional
+
+# Threads deleting a tree, most of their time is spent waiting for the file system
+DELETE_WORKERS = 16
+
+# Seconds between progress lines while a tree is deleted
+PROGRESS_INTERVAL = 0.5
+
+# Opens a directory without following a symbolic link
+OPEN_DIR = os.O_RDONLY | os.O_DIRECTORY | os.O_NOFOLLOW | os.O_CLOEXEC
+
+
+class DirNode:
+    """A directory being deleted by TreeDeleter"""
+
+    def __init__(self, name: str, parent: Optional["DirNode"]):
+        """
+        Constructor for class DirNode
+
+        Args:
+            name: name of the directory in its parent
+            parent: directory containing it, None for the deleted directory
+        """
+        self.name = name
+        self.parent = parent
+        # Open while the directory is read and its subdirectories are deleted
+        self.fd: Optional[int] = None
+        # Subdirectories not deleted yet, plus one until the directory is read
+        self.pending = 1
+
+
+class TreeDeleter:
+    """
+    Deletes a directory tree with a pool of threads
+
+    Every directory is opened relative to the directory containing it, and
+    its entries are removed relative to its own descriptor, so no path is
+    looked up twice and symbolic links are never followed. Subdirectories
+    are handed to the threads as they are found, the most recently found
+    first, which keeps few directories open at a time. A directory is
+    removed once all its subdirectories are.
+    """
+
+    def __init__(self, workers: int = DELETE_WORKERS):
+        """
+        Constructor for class TreeDeleter
+
+        Args:
+            workers: number of threads
+        """
+        self.workers = workers
+        self.files = 0
+        self.dirs = 0
+        self.errors = 0
+        self.cancelled = False
+        self.done = False
+        # Directories waiting to be read
+        self.stack: List[DirNode] = []
+        self.condition = threading.Condition()
+        # Descriptor of the directory containing the deleted directory
+        self.top_fd = -1
+
+    @property
+    def progress(self) -> str:
+        """Returns a line with the number of deleted entries and errors"""
+        line = f"Deleted {self.files:,} files and {self.dirs:,} directories"
+        if self.errors:
+            line += f", {self.errors:,} errors"
+        if self.cancelled:
+            line += ", cancelled"
+        return line
+
+    def delete(self, path: Path) -> None:
+        """
+        Deletes a directory and everything in it, printing the progress
+
+        Ctrl-C stops the deletion, what was deleted stays deleted.
+
+        Args:
+            path: directory to delete, it is not resolved
+
+        Raises:
+            OSError: the directory containing it cannot be opened
+        """
+        self.top_fd = os.open(path.parent, OPEN_DIR)
+        self.stack.append(DirNode(path.name, None))
+        threads = [
+            threading.Thread(target=self.run, daemon=True) for _ in range(self.workers)
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            with self.condition:
+                shown = time.monotonic()
+                while not self.done:
+                    try:
+                        self.condition.wait(PROGRESS_INTERVAL)
+                        if time.monotonic() - shown >= PROGRESS_INTERVAL:
+                            print(self.progress, end="\r", flush=True)
+                            shown = time.monotonic()
+                    except KeyboardInterrupt:
+                        # The threads close the directories they opened and stop
+                        self.cancelled = True
+        finally:
+            self.cancelled = self.cancelled or not self.done
+            for thread in threads:
+                thread.join()
+            os.close(self.top_fd)
+        print(self.progress)
+
+    def run(self) -> None:
+        """Reads and deletes directories, runs in the threads"""
+        while True:
+            with self.condition:
+                while not self.stack and not self.done:
+                    self.condition.wait()
+                if self.done:
+                    return
+                node = self.stack.pop()
+            self.read(node)
+
+    def read(self, node: DirNode) -> None:
+        """
+        Deletes the files in a directory and hands out its subdirectories
+
+        Args:
+            node: directory to read
+        """
+        parent_fd = self.top_fd if node.parent is None else node.parent.fd
+        files = errors = 0
+        children: List[str] = []
+        if not self.cancelled:
+            try:
+                node.fd = os.open(node.name, OPEN_DIR, dir_fd=parent_fd)
+                with os.scandir(node.fd) as entries:
+                    for entry in entries:
+                        if self.cancelled:
+                            break
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                children.append(entry.name)
+                            else:
+                                os.unlink(entry.name, dir_fd=node.fd)
+                                files += 1
+                        except OSError:
+                            errors += 1
+            except OSError:
+                errors += 1
+        with self.condition:
+            self.files += files
+            self.errors += errors
+            if node.fd is not None:
+                node.pending += len(children)
+                self.stack.extend(DirNode(name, node) for name in children)
+                self.condition.notify_all()
+        self.finish(node)
+
+    def finish(self, node: Optional[DirNode]) -> None:
+        """
+        Counts a directory as done, removing it and the directories above it
+        that have nothing left in them
+
+        Args:
+            node: directory that was read or had a subdirectory removed
+        """
+        while node is not None:
+            with self.condition:
+                node.pending -= 1
+                if node.pending:
+                    return
+            parent_fd = self.top_fd if node.parent is None else node.parent.fd
+            removed = False
+            if node.fd is not None:
+                os.close(node.fd)
+                if not self.cancelled:
+                    try:
+                        os.rmdir(node.name, dir_fd=parent_fd)
+                        removed = True
+                    except OSError:
+                        pass
+            with self.condition:
+                if removed:
+                    self.dirs += 1
+                elif node.fd is not None and not self.cancelled:
+                    self.errors += 1
+                if node.parent is None:
+                    self.done = True
+                    self.condition.notify_all()
+            node = node.parent
@@ -0,0 +1,240 @@
+import mmap
+import os
+import re
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from pathlib import Path
+from typing import (
+    Any,
+    Callable,
+    Deque,
+    Iterator,
+    List,
+    Optional,
+    Pattern,
+    Tuple,
+    TypeVar,
+    Union,
+)
+
+T = TypeVar("T")
+
+# Files with a NUL byte in this many bytes from their start are binary
+BINARY_SAMPLE = 8192
+
+# Files handed to the search processes ahead of the file being printed, per process
+FIND_AHEAD = 4
+
+# Bytes of whole lines decoded at once to search a file as text
+DECODE_CHUNK = 4 * 1024 * 1024
+
+# Number of matching lines of a file and the lines with their line number
+FileMatches = Tuple[int, List[Tuple[int, str]]]
+
+
+def compile_pattern(
+    text: str, ignore_case: bool = False, is_regex: bool = False
+) -> "Pattern[Any]":
+    """
+    Returns the compiled pattern FIND searches the files for
+
+    Patterns are compiled as bytes, which only fold the case of ASCII
+    letters. To ignore the case of other letters the pattern is compiled as
+    str, and the files are searched as decoded text.
+
+    Args:
+        text: text or regular expression
+        ignore_case: match upper and lower case letters alike
+        is_regex: the text is a regular expression
+
+    Raises:
+        re.error: the regular expression is invalid
+    """
+    flags = re.MULTILINE | (re.IGNORECASE if ignore_case else 0)
+    pattern: Union[str, bytes]
+    if ignore_case and not text.isascii():
+        pattern = text if is_regex else re.escape(text)
+    else:
+        pattern = text.encode() if is_regex else re.escape(text.encode())
+    return re.compile(pattern, flags)
+
+
+def walk_files(root: Path, recursive: bool = False) -> Iterator[Path]:
+    """
+    Yields the files in a directory sorted by name, the files of a directory
+    before its subdirectories
+
+    Args:
+        root: directory to list
+        recursive: also list the files in the subdirectories, symbolic links
+            to directories are not followed
+    """
+    for entry in walk_entries(root, recursive):
+        yield Path(entry.path)
+
+
+def walk_entries(root: Path, recursive: bool = False) -> Iterator["os.DirEntry[str]"]:
+    """
+    Yields the directory entries of the files walk_files lists, in the same order
+
+    Args:
+        root: directory to list
+        recursive: also list the files in the subdirectories
+    """
+    stack = [str(root)]
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as entries:
+                children = sorted(entries, key=lambda entry: entry.name)
+        except OSError:
+            continue
+        directories = []
+        for entry in children:
+            try:
+                if entry.is_file():
+                    yield entry
+                elif recursive and entry.is_dir(follow_symlinks=False):
+                    directories.append(entry.path)
+            except OSError:
+                continue
+        stack.extend(reversed(directories))
+
+
+def search_file(
+    path: Path, regex: "Pattern[Any]", count: bool = False
+) -> Optional[FileMatches]:
+    """
+    Finds the lines of a file that match a pattern, searching the bytes of the
+    memory mapped file
+
+    A pattern of str is searched in the decoded text instead, so that case is
+    ignored for all letters and not only for ASCII ones.
+
+    Args:
+        path: file to search
+        regex: compiled pattern of bytes or str
+        count: only count the matching lines
+
+    Returns:
+        Optional[FileMatches]: the number of matching lines and the lines,
+        None if the file is binary or cannot be read
+    """
+    try:
+        with path.open("rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return 0, []
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                if data.find(b"\0", 0, BINARY_SAMPLE) != -1:
+                    return None
+                if isinstance(regex.pattern, str):
+                    return search_text(data, regex, count)
+                return search_lines(data, regex, count)
+    except (OSError, ValueError):
+        return None
+
+
+def search_text(data: mmap.mmap, regex: "Pattern[str]", count: bool) -> FileMatches:
+    """
+    Finds the lines of a memory mapped file that match a pattern of str,
+    decoding the file in chunks of whole lines instead of all at once
+
+    Args:
+        data: contents of the file
+        regex: compiled pattern of str
+        count: only count the matching lines
+    """
+    matches = 0
+    lines: List[Tuple[int, str]] = []
+    size = len(data)
+    start = 0
+    # Lines before the chunk
+    line_count = 0
+    while start < size:
+        end = data.find(b"\n", start + DECODE_CHUNK - 1)
+        end = size if end == -1 else end + 1
+        chunk = data[start:end]
+        found, chunk_lines = search_lines(chunk.decode(errors="replace"), regex, count)
+        matches += found
+        lines.extend((line_count + line_no, line) for line_no, line in chunk_lines)
+        line_count += chunk.count(b"\n")
+        start = end
+    return matches, lines
+
+
+def search_lines(
+    data: Union[mmap.mmap, str], regex: "Pattern[Any]", count: bool
+) -> FileMatches:
+    """
+    Finds the lines of a memory mapped file or of decoded text that match a pattern
+
+    Args:
+        data: contents of the file
+        regex: compiled pattern of the same type as the contents
+        count: only count the matching lines
+    """
+    newline: Any = "\n" if isinstance(data, str) else b"\n"
+    matches = 0
+    lines: List[Tuple[int, str]] = []
+    size = len(data)
+    # Start of the line after the last matching line and its line number
+    position = 0
+    line_no = 1
+    while position < size:
+        match = regex.search(data, position)
+        if match is None:
+            break
+        start = data.rfind(newline, position, match.start())
+        start = position if start == -1 else start + 1
+        end = data.find(newline, match.start())
+        if end == -1:
+            end = size
+        line_no += data[position:start].count(newline)
+        matches += 1
+        if not count:
+            found = data[start:end]
+            line = found if isinstance(found, str) else found.decode(errors="replace")
+            lines.append((line_no, line.rstrip("\r")))
+        position = end + 1
+        line_no += 1
+    return matches, lines
+
+
+def map_files(
+    function: Callable[..., T],
+    files: Iterator[Path],
+    *args: object,
+    workers: Optional[int] = None,
+) -> Iterator[Tuple[Path, T]]:
+    """
+    Calls a function for every file in a pool of processes and yields the
+    results in the order of the files as soon as they are ready
+
+    Only a few files per process are handed out ahead, so the first results
+    come before all the files are listed.
+
+    Args:
+        function: function taking a file and the other arguments
+        files: files to pass to the function
+        args: other arguments of the function
+        workers: number of processes, 1 calls the function in this process
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        for path in files:
+            yield path, function(path, *args)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        queue: Deque[Tuple[Path, "Future[T]"]] = deque()
+        try:
+            for path in files:
+                queue.append((path, pool.submit(function, path, *args)))
+                if len(queue) >= workers * FIND_AHEAD:
+                    path, future = queue.popleft()
+                    yield path, future.result()
+            while queue:
+                path, future = queue.popleft()
+                yield path, future.result()
+        finally:
+            for _, future in queue:
+                future.cancel()
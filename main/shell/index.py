@@ -0,0 +1,476 @@
+import hashlib
+import mmap
+import os
+import sqlite3
+from array import array
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Pattern, Set, Tuple
+
+from .find import BINARY_SAMPLE, map_files, walk_entries, walk_files
+
+try:
+    from ..common import default_cache_dir
+except ImportError:
+    from common import default_cache_dir  # type: ignore[no-redef]
+
+# Version of the layout of the content index
+INDEX_VERSION = 1
+
+# Bytes of a file split into trigrams at once
+TRIGRAM_CHUNK = 1024 * 1024
+
+# File ids collected in memory before they are written to the content index
+FLUSH_POSTINGS = 4 * 1024 * 1024
+
+# Looking up trigrams in the content index stops once this few files are left
+FEW_CANDIDATES = 64
+
+# Most values passed to a single SQLite query
+SQL_VARIABLES = 900
+
+# Escapes of a single character class in regular expressions
+CLASS_ESCAPES = "dDsSwWbBAZ"
+
+# Characters with a meaning in regular expressions
+REGEX_CHARS = set(".^$*+?{}[]()|\\")
+
+
+def trigrams(text: bytes) -> Set[int]:
+    """
+    Returns the trigrams of lowercased text, every three bytes packed in an int
+
+    Args:
+        text: text to split
+    """
+    text = text.lower()
+    # Packing only the distinct trigrams is much faster than packing every one
+    found = set(zip(text, text[1:], text[2:]))
+    return {(a << 16) | (b << 8) | c for a, b, c in found}
+
+
+def file_trigrams(path: Path) -> Optional[bytes]:
+    """
+    Returns the trigrams of the lowercased contents of a file
+
+    Args:
+        path: file to read
+
+    Returns:
+        Optional[bytes]: the sorted trigrams as an array of unsigned ints,
+        None if the file is binary or cannot be read
+    """
+    found: Set[int] = set()
+    try:
+        with path.open("rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return b""
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                if data.find(b"\0", 0, BINARY_SAMPLE) != -1:
+                    return None
+                size = len(data)
+                start = 0
+                while start < size:
+                    end = data.find(b"\n", start + TRIGRAM_CHUNK)
+                    if end == -1:
+                        end = size
+                    # Repeated lines, common in logs, are split only once
+                    lines = set(data[start:end].split(b"\n"))
+                    found.update(trigrams(b"\n".join(lines)))
+                    start = end + 1
+    except (OSError, ValueError):
+        return None
+    return array("I", sorted(found)).tobytes()
+
+
+def required_literals(text: str, is_regex: bool = False) -> List[str]:
+    """
+    Returns parts of a pattern that every match contains
+
+    Regular expressions with groups or alternatives are not looked into, for
+    them no parts are returned.
+
+    Args:
+        text: text or regular expression
+        is_regex: the text is a regular expression
+    """
+    if not is_regex:
+        return [text]
+    if "(" in text or "|" in text:
+        return []
+    literals = []
+    run = ""
+    index = 0
+    while index < len(text):
+        char = text[index]
+        index += 1
+        if char == "\\":
+            escaped = text[index] if index < len(text) else ""
+            index += 1
+            if escaped and not escaped.isalnum():
+                run += escaped
+                continue
+            literals.append(run)
+            run = ""
+            if escaped not in CLASS_ESCAPES:
+                # An escape like \x41 or \1 is followed by more characters
+                break
+            continue
+        if char not in REGEX_CHARS:
+            run += char
+            continue
+        if char in "*?{":
+            # The character before is optional
+            run = run[:-1]
+        literals.append(run)
+        run = ""
+        if char in "[{":
+            closing = "]" if char == "[" else "}"
+            if char == "[" and text.startswith("^", index):
+                index += 1
+            if char == "[" and text.startswith("]", index):
+                index += 1
+            while index < len(text) and text[index] != closing:
+                index += 2 if text[index] == "\\" else 1
+            index += 1
+    literals.append(run)
+    return [literal for literal in literals if literal]
+
+
+class ContentIndex:
+    """
+    Index of the trigrams in the files of a directory tree, saved in SQLite
+
+    For every trigram the ids of the files containing it are kept, so the
+    files that can contain a text are found without reading them. Updating
+    the index only reads the files whose time of change or size differ. A
+    changed file gets a new id, the ids it had are left in the lists of
+    trigrams and dropped when the ids are looked up. Once the index holds
+    more such ids than files it is built again.
+    """
+
+    def __init__(self, root: Path, cache_dir: Optional[Path] = None):
+        """
+        Constructor for class ContentIndex
+
+        Args:
+            root: directory the index is for
+            cache_dir: directory the index is saved in. Defaults to default_cache_dir("index").
+        """
+        self.root = root
+        digest = hashlib.sha256(str(root).encode()).hexdigest()
+        self.path = (cache_dir or default_cache_dir("index")).joinpath(
+            digest[:32] + ".sqlite"
+        )
+
+    @classmethod
+    def find(cls, path: Path) -> Optional["ContentIndex"]:
+        """
+        Returns the index of a directory or of the closest directory above it
+
+        Args:
+            path: directory to find the index of
+        """
+        for directory in [path, *path.parents]:
+            index = cls(directory)
+            if index.path.exists():
+                return index
+        return None
+
+    def connect(self) -> sqlite3.Connection:
+        """Opens the index, creating it if it is missing or has another layout"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        connection = sqlite3.connect(str(self.path))
+        if self.version(connection) != INDEX_VERSION:
+            with connection:
+                connection.execute("DROP TABLE IF EXISTS files")
+                connection.execute("DROP TABLE IF EXISTS postings")
+                connection.execute("DROP TABLE IF EXISTS meta")
+                connection.execute(
+                    "CREATE TABLE files (id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                    " path TEXT UNIQUE, mtime INTEGER, size INTEGER)"
+                )
+                connection.execute("CREATE TABLE postings (trigram INTEGER, ids BLOB)")
+                connection.execute(
+                    "CREATE INDEX postings_trigram ON postings (trigram)"
+                )
+                connection.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value)")
+                connection.execute(f"PRAGMA user_version = {INDEX_VERSION}")
+        return connection
+
+    def version(self, connection: sqlite3.Connection) -> int:
+        """
+        Returns the version of the layout of an opened index
+
+        Args:
+            connection: the opened index
+        """
+        return connection.execute("PRAGMA user_version").fetchone()[0]
+
+    def update(self, workers: Optional[int] = None) -> Tuple[int, int, int]:
+        """
+        Reads the new and changed files into the index and drops the removed ones
+
+        Args:
+            workers: number of processes to read the files with, defaults to
+                the number of CPUs
+
+        Returns:
+            Tuple[int, int, int]: the number of read files, of removed files
+            and of files in the index
+        """
+        connection = self.connect()
+        try:
+            with connection:
+                return self.update_files(connection, workers)
+        finally:
+            connection.close()
+
+    def update_files(
+        self, connection: sqlite3.Connection, workers: Optional[int]
+    ) -> Tuple[int, int, int]:
+        """
+        Updates the index inside a transaction
+
+        Args:
+            connection: the opened index
+            workers: number of processes to read the files with
+        """
+        known: Dict[str, Tuple[int, int, int]] = {
+            name: (file_id, mtime, size)
+            for file_id, name, mtime, size in connection.execute("SELECT * FROM files")
+        }
+        row = connection.execute(
+            "SELECT value FROM meta WHERE key = 'stale'"
+        ).fetchone()
+        stale = row[0] if row is not None else 0
+        if stale > len(known):
+            connection.execute("DELETE FROM files")
+            connection.execute("DELETE FROM postings")
+            known = {}
+            stale = 0
+
+        changed: List[Tuple[Path, str, int, int]] = []
+        for file_path in walk_files(self.root, recursive=True):
+            try:
+                stat = file_path.stat()
+            except OSError:
+                continue
+            name = str(file_path.relative_to(self.root))
+            entry = known.pop(name, None)
+            if entry is not None:
+                if entry[1:] == (stat.st_mtime_ns, stat.st_size):
+                    continue
+                connection.execute("DELETE FROM files WHERE id = ?", (entry[0],))
+                stale += 1
+            changed.append((file_path, name, stat.st_mtime_ns, stat.st_size))
+        connection.executemany(
+            "DELETE FROM files WHERE id = ?", [(entry[0],) for entry in known.values()]
+        )
+        stale += len(known)
+
+        postings: Dict[int, "array[int]"] = {}
+        collected = 0
+        paths = (item[0] for item in changed)
+        results = map_files(file_trigrams, paths, workers=workers)
+        for (_, name, mtime, size), (_, packed) in zip(changed, results):
+            cursor = connection.execute(
+                "INSERT INTO files (path, mtime, size) VALUES (?, ?, ?)",
+                (name, mtime, size),
+            )
+            file_id = cursor.lastrowid
+            if not packed or file_id is None:
+                continue
+            contained = array("I")
+            contained.frombytes(packed)
+            for trigram in contained:
+                ids = postings.get(trigram)
+                if ids is None:
+                    ids = postings[trigram] = array("I")
+                ids.append(file_id)
+            collected += len(contained)
+            if collected >= FLUSH_POSTINGS:
+                self.flush(connection, postings)
+                postings = {}
+                collected = 0
+        self.flush(connection, postings)
+        connection.execute("INSERT OR REPLACE INTO meta VALUES ('stale', ?)", (stale,))
+        total = connection.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+        return len(changed), len(known), total
+
+    def flush(
+        self, connection: sqlite3.Connection, postings: Dict[int, "array[int]"]
+    ) -> None:
+        """
+        Adds collected file ids to the lists of their trigrams
+
+        Args:
+            connection: the opened index
+            postings: ids of the files containing every trigram
+        """
+        connection.executemany(
+            "INSERT INTO postings VALUES (?, ?)",
+            ((trigram, ids.tobytes()) for trigram, ids in postings.items()),
+        )
+
+    def candidates(
+        self, wanted: Set[int], directory: Path, recursive: bool = False
+    ) -> Optional[Iterator[Path]]:
+        """
+        Returns the files in a directory that contain all the given trigrams,
+        in the order walk_files lists them
+
+        The index may be older than the files, so the directory is still walked
+        and the files added or changed since the index was updated are
+        returned as well.
+
+        Args:
+            wanted: trigrams the files have to contain
+            directory: directory in the indexed tree
+            recursive: also return the files in the subdirectories
+
+        Returns:
+            Optional[Iterator[Path]]: the files, None if the index has another layout
+        """
+        connection = sqlite3.connect(str(self.path))
+        try:
+            if self.version(connection) != INDEX_VERSION:
+                return None
+            ids = self.lookup(connection, wanted)
+            found: Set[str] = set()
+            indexed: Dict[str, Tuple[int, int]] = {}
+            for file_id, name, mtime, size in connection.execute("SELECT * FROM files"):
+                indexed[name] = (mtime, size)
+                if file_id in ids:
+                    found.add(name)
+        finally:
+            connection.close()
+        return self.fresh_files(directory, recursive, found, indexed)
+
+    def fresh_files(
+        self,
+        directory: Path,
+        recursive: bool,
+        found: Set[str],
+        indexed: Dict[str, Tuple[int, int]],
+    ) -> Iterator[Path]:
+        """
+        Yields the files of a directory the index found or does not know as
+        they are now
+
+        Args:
+            directory: directory in the indexed tree
+            recursive: also yield the files in the subdirectories
+            found: files the index found, relative to the root
+            indexed: time of change and size of every indexed file
+        """
+        start = len(os.path.join(str(self.root), ""))
+        for entry in walk_entries(directory, recursive):
+            name = entry.path[start:]
+            if name in found:
+                yield Path(entry.path)
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            if indexed.get(name) != (stat.st_mtime_ns, stat.st_size):
+                yield Path(entry.path)
+
+    def lookup(self, connection: sqlite3.Connection, wanted: Set[int]) -> Set[int]:
+        """
+        Returns the ids of the files that may contain all the given trigrams,
+        including ids of changed and removed files
+
+        The lists of the rarest trigrams are intersected first, and once only
+        a few files are left the other lists are not read.
+
+        Args:
+            connection: the opened index
+            wanted: trigrams the files have to contain
+        """
+        sizes: Dict[int, int] = {}
+        trigram_list = list(wanted)
+        for start in range(0, len(trigram_list), SQL_VARIABLES):
+            end = start + SQL_VARIABLES
+            chunk = trigram_list[start:end]
+            marks = ",".join("?" * len(chunk))
+            query = (
+                "SELECT trigram, SUM(LENGTH(ids)) FROM postings"
+                f" WHERE trigram IN ({marks}) GROUP BY trigram"  # noqa: S608
+            )
+            sizes.update(connection.execute(query, chunk))
+        if len(sizes) < len(wanted):
+            # No file contains one of the trigrams
+            return set()
+        ids: Optional[Set[int]] = None
+        for trigram in sorted(wanted, key=lambda trigram: sizes[trigram]):
+            found: Set[int] = set()
+            for (blob,) in connection.execute(
+                "SELECT ids FROM postings WHERE trigram = ?", (trigram,)
+            ):
+                file_ids = array("I")
+                file_ids.frombytes(blob)
+                found.update(file_ids)
+            ids = found if ids is None else ids & found
+            if len(ids) <= FEW_CANDIDATES:
+                break
+        return ids or set()
+
+
+def indexed_files(
+    root: Path, text: str, is_regex: bool = False, recursive: bool = False
+) -> Optional[Iterator[Path]]:
+    """
+    Returns the files in a directory that may contain a pattern according to
+    the content index of the directory
+
+    Args:
+        root: directory to search
+        text: text or regular expression
+        is_regex: the text is a regular expression
+        recursive: also return the files in the subdirectories
+
+    Returns:
+        Optional[Iterator[Path]]: the files, None if the directory is not
+        indexed or the pattern has no part that every match contains
+    """
+    index = ContentIndex.find(root)
+    if index is None:
+        return None
+    wanted: Set[int] = set()
+    for literal in required_literals(text, is_regex):
+        wanted |= trigrams(literal.encode())
+    if not wanted:
+        return None
+    try:
+        return index.candidates(wanted, root, recursive)
+    except sqlite3.Error:
+        return None
+
+
+def files_to_search(
+    root: Path,
+    regex: "Pattern[Any]",
+    text: str,
+    is_regex: bool = False,
+    recursive: bool = False,
+) -> Iterator[Path]:
+    """
+    Returns the files FIND searches, in a directory with a content index only
+    the files that may match
+
+    Args:
+        root: file or directory to search
+        regex: compiled pattern, see compile_pattern
+        text: text or regular expression the pattern was compiled from
+        is_regex: the text is a regular expression
+        recursive: also search the subdirectories of a directory
+    """
+    if not root.is_dir():
+        return iter([root])
+    # The index only folds the case of ASCII letters, like a pattern of bytes
+    if isinstance(regex.pattern, bytes):
+        candidates = indexed_files(root, text, is_regex, recursive)
+        if candidates is not None:
+            return candidates
+    return walk_files(root, recursive)
@@ -0,0 +1,289 @@
+import ctypes
+import ctypes.util
+import os
+import struct
+from collections import OrderedDict
+from stat import S_ISDIR
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Most directories whose entries are kept in the directory cache
+DIR_CACHE_DIRS = 64
+
+# Events of a watched directory that change its listing
+IN_MODIFY = 0x2
+IN_ATTRIB = 0x4
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_MOVE_SELF = 0x800
+WATCH_EVENTS = (
+    IN_MODIFY
+    | IN_ATTRIB
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_DELETE_SELF
+    | IN_MOVE_SELF
+)
+
+# Events were lost, every watched directory may have changed
+IN_Q_OVERFLOW = 0x4000
+
+# The watch was removed
+IN_IGNORED = 0x8000
+
+# Header of an inotify event: watch, mask, cookie and length of the name
+INOTIFY_EVENT = struct.Struct("iIII")
+
+# Name, is a directory, size and time of change of a directory entry
+EntryInfo = Tuple[str, bool, int, float]
+
+# Keys DIR /O sorts entries by
+SORT_KEYS: Dict[str, Callable[[EntryInfo], Any]] = {
+    "N": lambda entry: entry[0].lower(),
+    "E": lambda entry: os.path.splitext(entry[0])[1].lower(),
+    "S": lambda entry: entry[2],
+    "D": lambda entry: entry[3],
+    "G": lambda entry: not entry[1],
+}
+
+
+class Inotify:
+    """
+    Watches directories for changes with the Linux inotify API
+
+    The events are read without blocking when they are needed, so no thread
+    is used.
+    """
+
+    def __init__(self) -> None:
+        """
+        Constructor for class Inotify
+
+        Raises:
+            OSError: inotify is not available
+        """
+        try:
+            self.libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+            self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        except AttributeError:
+            raise OSError("inotify is not available")
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+
+    def add_watch(self, path: str) -> int:
+        """
+        Starts watching a directory, returns the watch descriptor
+
+        Args:
+            path: directory to watch
+
+        Raises:
+            OSError: the directory cannot be watched, for example when the
+                limit of watches is reached
+        """
+        watch = self.libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_EVENTS)
+        if watch < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), path)
+        return watch
+
+    def remove_watch(self, watch: int) -> None:
+        """
+        Stops watching a directory
+
+        Args:
+            watch: watch descriptor returned by add_watch
+        """
+        self.libc.inotify_rm_watch(self.fd, watch)
+
+    def read(self) -> List[Tuple[int, int]]:
+        """Returns the watch descriptor and mask of the events that happened since the last read"""
+        events: List[Tuple[int, int]] = []
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except BlockingIOError:
+                return events
+            position = 0
+            while position < len(data):
+                watch, mask, _, length = INOTIFY_EVENT.unpack_from(data, position)
+                events.append((watch, mask))
+                position += INOTIFY_EVENT.size + length
+
+    def close(self) -> None:
+        """Stops watching all directories"""
+        os.close(self.fd)
+
+
+class DirCache:
+    """
+    Cache of the entries of directories and their metadata
+
+    A directory is read with a single scandir and a stat of every entry, and
+    listing it again is served from memory until it changes. Changes are
+    noticed through inotify, and where it cannot be used, by the time of
+    change of the directory. That time does not change when a file in the
+    directory is written to, so without inotify sizes may be out of date.
+    """
+
+    def __init__(self, limit: int = DIR_CACHE_DIRS):
+        """
+        Constructor for class DirCache
+
+        Args:
+            limit: most directories to keep, the least recently listed are dropped
+        """
+        self.limit = limit
+        # Time of change, watch descriptor and entries of every cached directory
+        self.dirs: "OrderedDict[str, Tuple[int, Optional[int], List[EntryInfo]]]" = (
+            OrderedDict()
+        )
+        # Cached directories by watch descriptor
+        self.watches: Dict[int, str] = {}
+        self.inotify: Optional[Inotify] = None
+        self.started = False
+        self.hits = 0
+        self.misses = 0
+
+    def start(self) -> None:
+        """Starts inotify the first time a directory is listed"""
+        if self.started:
+            return
+        self.started = True
+        try:
+            self.inotify = Inotify()
+        except OSError:
+            self.inotify = None
+
+    def invalidate(self) -> None:
+        """Drops the directories that changed according to inotify"""
+        if self.inotify is None:
+            return
+        for watch, mask in self.inotify.read():
+            if mask & IN_Q_OVERFLOW:
+                self.clear()
+                return
+            path = self.watches.pop(watch, None)
+            if path is None:
+                continue
+            self.dirs.pop(path, None)
+            if not mask & IN_IGNORED:
+                # Watched again when the directory is read again
+                self.inotify.remove_watch(watch)
+
+    def list(self, path: str) -> List[EntryInfo]:
+        """
+        Returns the entries of a directory, from the cache if it did not change
+
+        Args:
+            path: resolved path of the directory
+
+        Raises:
+            OSError: the directory cannot be read
+        """
+        self.start()
+        self.invalidate()
+        cached = self.dirs.get(path)
+        if cached is not None:
+            mtime, watch, entries = cached
+            if watch is not None or os.stat(path).st_mtime_ns == mtime:
+                self.hits += 1
+                self.dirs.move_to_end(path)
+                return entries
+            del self.dirs[path]
+
+        self.misses += 1
+        # The directory is watched before it is read, so no change is missed
+        watch = None
+        if self.inotify is not None:
+            try:
+                watch = self.inotify.add_watch(path)
+            except OSError:
+                watch = None
+        try:
+            mtime = os.stat(path).st_mtime_ns
+            entries = scan_dir(path)
+        except OSError:
+            self.forget(watch)
+            raise
+        if watch is not None:
+            self.watches[watch] = path
+        self.dirs[path] = (mtime, watch, entries)
+        while len(self.dirs) > self.limit:
+            _, (_, old_watch, _) = self.dirs.popitem(last=False)
+            self.forget(old_watch)
+        return entries
+
+    def forget(self, watch: Optional[int]) -> None:
+        """
+        Stops watching a directory that is dropped from the cache
+
+        Args:
+            watch: watch descriptor of the directory, None if it is not watched
+        """
+        if watch is None or self.inotify is None:
+            return
+        self.watches.pop(watch, None)
+        self.inotify.remove_watch(watch)
+
+    def clear(self) -> None:
+        """Drops all directories from the cache"""
+        for _, watch, _ in self.dirs.values():
+            self.forget(watch)
+        self.dirs.clear()
+
+
+def scan_dir(path: str) -> List[EntryInfo]:
+    """
+    Returns the entries of a directory with their metadata, in directory order
+
+    Args:
+        path: directory to read
+
+    Raises:
+        OSError: the directory cannot be read
+    """
+    entries = []
+    with os.scandir(path) as children:
+        for entry in children:
+            try:
+                stat = entry.stat()
+            except OSError:
+                # A broken link
+                try:
+                    stat = entry.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+            is_dir = S_ISDIR(stat.st_mode)
+            entries.append((entry.name, is_dir, stat.st_size, stat.st_mtime))
+    return entries
+
+
+def sort_entries(entries: List[EntryInfo], order: str) -> List[EntryInfo]:
+    """
+    Returns directory entries sorted like DIR /O sorts them
+
+    Args:
+        order: letters of the keys to sort by, N for name, E for extension,
+            S for size, D for date and G for directories first. A - before a
+            letter reverses it.
+    """
+    keys = []
+    reverse = False
+    for letter in order.upper():
+        if letter == "-":
+            reverse = True
+            continue
+        if letter in SORT_KEYS:
+            keys.append((SORT_KEYS[letter], reverse))
+        reverse = False
+    entries = list(entries)
+    # Sorting is stable, so sorting by the last key first gives the right order
+    for key, reverse in reversed(keys):
+        entries.sort(key=key, reverse=reverse)
+    return entries
@@ -0,0 +1,175 @@
+import codecs
+import mmap
+import os
+import shutil
+import sys
+from pathlib import Path
+from typing import List
+
+from prompt_toolkit.utils import get_cwidth
+
+# Bytes of a file TYPE reads and prints at once
+TYPE_CHUNK = 64 * 1024
+
+# Control characters that could change the terminal are shown as this character
+CONTROL_CHARS = {
+    code: "\ufffd" for code in [*range(32), 127] if chr(code) not in "\t\n\r"
+}
+
+# Columns between the tab stops of the terminal
+TAB_SIZE = 8
+
+
+class Pager:
+    """
+    Shows a memory mapped file a screen at a time, like MORE
+
+    Only the rows on the screen are read from the file, so paging through a
+    file of any size uses the same memory. Lines longer than the screen are
+    wrapped on screen columns: wide characters take two columns, combining
+    characters none and a tab goes on to the next tab stop. Going back shows
+    the pages that were shown before, so a wrapped line is never read again
+    from its start.
+    """
+
+    def __init__(self, data: mmap.mmap, width: int, height: int):
+        """
+        Constructor for class Pager
+
+        Args:
+            data: contents of the file
+            width: columns of the screen
+            height: rows of the screen, one of them shows the prompt
+        """
+        self.data = data
+        self.width = max(width, 1)
+        self.rows = max(height - 1, 1)
+
+    def char_length(self, position: int) -> int:
+        """
+        Returns the number of bytes of the UTF-8 character at a position, a
+        byte that does not start a valid character is a character of its own
+
+        Args:
+            position: start of the character
+        """
+        data = self.data
+        lead = data[position]
+        if lead < 0xC0:
+            return 1
+        length = 2 if lead < 0xE0 else 3 if lead < 0xF0 else 4
+        if position + length > len(data):
+            return 1
+        for index in range(position + 1, position + length):
+            if data[index] & 0xC0 != 0x80:
+                return 1
+        return length
+
+    def next_row(self, position: int) -> int:
+        """
+        Returns where the row after a row starts
+
+        Args:
+            position: start of the row
+        """
+        data = self.data
+        size = len(data)
+        column = 0
+        while position < size:
+            if data[position] == ord("\n"):
+                return position + 1
+            end = position + self.char_length(position)
+            char = data[position:end].decode(errors="replace")
+            if char == "\t":
+                columns = TAB_SIZE - column % TAB_SIZE
+            else:
+                columns = get_cwidth(char.translate(CONTROL_CHARS))
+            if column + columns > self.width and column:
+                return position
+            column += columns
+            position = end
+        return size
+
+    def row_text(self, position: int) -> str:
+        """
+        Returns the text of a row, bytes that are no UTF-8 are replaced
+
+        Args:
+            position: start of the row
+        """
+        data = self.data
+        end = self.next_row(position)
+        if data[end - 1] == ord("\n"):
+            end -= 1
+        # Decoded like next_row counts them, so that the row fits the screen
+        chars = []
+        while position < end:
+            char_end = position + self.char_length(position)
+            chars.append(data[position:char_end].decode(errors="replace"))
+            position = char_end
+        return "".join(chars).rstrip("\r").translate(CONTROL_CHARS)
+
+    def page(self) -> None:
+        """Shows the file a screen at a time until its end or until q is typed"""
+        size = len(self.data)
+        top = 0
+        # Tops of the pages before the shown page, b goes back to the last one
+        tops: List[int] = []
+        while True:
+            position = top
+            for _ in range(self.rows):
+                if position >= size:
+                    return
+                print(self.row_text(position))
+                position = self.next_row(position)
+            if position >= size:
+                return
+            percent = position * 100 // size
+            reply = input(f"-- More ({percent}%) [Enter, b, q] -- ").strip().lower()
+            if reply == "q":
+                return
+            if reply == "b":
+                if tops:
+                    top = tops.pop()
+            else:
+                tops.append(top)
+                top = position
+
+
+def print_file(path: Path) -> None:
+    """
+    Prints a file in chunks, so files of any size can be shown
+
+    Bytes that are no UTF-8 and control characters are replaced.
+
+    Args:
+        path: file to print
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    last = ""
+    with path.open("rb") as f:
+        while True:
+            chunk = f.read(TYPE_CHUNK)
+            text = decoder.decode(chunk, final=not chunk)
+            if text:
+                sys.stdout.write(text.translate(CONTROL_CHARS))
+                last = text[-1]
+            if not chunk:
+                break
+    if last != "\n":
+        print()
+
+
+def page_file(path: Path) -> None:
+    """
+    Shows a file a screen at a time, see Pager
+
+    Args:
+        path: file to show
+    """
+    with path.open("rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            width, height = shutil.get_terminal_size()
+            Pager(data, width, height).page()
@@ -0,0 +1,92 @@
+import os
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+
+
+def sorted_entries(path: str) -> List[Tuple["os.DirEntry[str]", bool]]:
+    """
+    Returns the entries of a directory sorted by name, each with whether it is
+    the last one, no entries if the directory cannot be read
+
+    Args:
+        path: directory to list
+    """
+    try:
+        with os.scandir(path) as entries:
+            children = sorted(entries, key=lambda entry: entry.name)
+    except OSError:
+        return []
+    last = len(children) - 1
+    return [(entry, i == last) for i, entry in enumerate(children)]
+
+
+def tree_lines(
+    root: Path,
+    depth: Optional[int] = None,
+    files_only: bool = False,
+    sizes: bool = False,
+) -> Iterator[str]:
+    """
+    Yields the lines of the tree view of a directory as the directories are read
+
+    The tree is walked without recursion and the type of every entry comes
+    from the directory listing. Symbolic links to directories are followed,
+    unless they point to a directory above them, which would never end.
+
+    Args:
+        root: directory to show
+        depth: levels of subdirectories to show, all if None
+        files_only: only list the files, with their path from the root
+        sizes: show the size of every file
+    """
+    if not root.is_dir():
+        yield root.name if files_only else "└──" + root.name
+        return
+    if not files_only:
+        yield "└──" + root.name
+    start = len(str(root)) + 1
+    root_stat = root.stat()
+    # Entries of the open directories left to show, the start of their lines,
+    # their level and the directories above them
+    stack = [
+        (
+            iter(sorted_entries(str(root))),
+            "    ",
+            1,
+            frozenset([(root_stat.st_dev, root_stat.st_ino)]),
+        )
+    ]
+    while stack:
+        entries, prefix, level, above = stack[-1]
+        item = next(entries, None)
+        if item is None:
+            stack.pop()
+            continue
+        entry, last = item
+        suffix = ""
+        try:
+            is_dir = entry.is_dir()
+            if is_dir and (depth is None or level < depth):
+                stat = entry.stat()
+                key = (stat.st_dev, stat.st_ino)
+                if key in above:
+                    suffix = " [loop]"
+                else:
+                    stack.append(
+                        (
+                            iter(sorted_entries(entry.path)),
+                            prefix + ("    " if last else "│   "),
+                            level + 1,
+                            above | {key},
+                        )
+                    )
+            elif sizes and not is_dir:
+                suffix = f" ({entry.stat().st_size:,} bytes)"
+        except OSError:
+            # A broken link or an entry removed since it was listed
+            is_dir = False
+        if files_only:
+            if not is_dir:
+                yield entry.path[start:] + suffix
+        else:
+            yield prefix + ("└──" if last else "├──") + entry.name + suffix
@@ -0,0 +1,182 @@
+import errno
+import os
+import shutil
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Deque, Tuple
+
+# Bytes copied by a single system call
+COPY_CHUNK = 8 * 1024 * 1024
+
+# Threads copying files at once
+COPY_WORKERS = 8
+
+# Copies queued per thread, so that the tree is not walked far ahead of them
+COPY_AHEAD = 4
+
+# Errors of a copy method that the file system or kernel does not support it
+UNSUPPORTED_ERRORS = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP}
+
+
+def copy_range(src_fd: int, dst_fd: int) -> int:
+    """
+    Copies the next chunk of a file inside the kernel, without going through
+    memory where the file system supports it, returns the copied bytes
+
+    Args:
+        src_fd: file to copy from
+        dst_fd: file to copy to
+    """
+    if not hasattr(os, "copy_file_range"):
+        raise OSError(errno.ENOSYS, "copy_file_range is not available")
+    return os.copy_file_range(src_fd, dst_fd, COPY_CHUNK)
+
+
+def send_file(src_fd: int, dst_fd: int) -> int:
+    """
+    Copies the next chunk of a file inside the kernel, returns the copied bytes
+
+    Args:
+        src_fd: file to copy from
+        dst_fd: file to copy to
+    """
+    return os.sendfile(dst_fd, src_fd, None, COPY_CHUNK)
+
+
+def read_write(src_fd: int, dst_fd: int) -> int:
+    """
+    Copies the next chunk of a file through memory, returns the copied bytes
+
+    Args:
+        src_fd: file to copy from
+        dst_fd: file to copy to
+    """
+    data = memoryview(os.read(src_fd, COPY_CHUNK))
+    written = 0
+    while written < len(data):
+        written += os.write(dst_fd, data[written:])
+    return len(data)
+
+
+def copy_data(src_fd: int, dst_fd: int) -> int:
+    """
+    Copies a file with the fastest method that works for it, returns the
+    copied bytes
+
+    Args:
+        src_fd: file to copy from, from its current position
+        dst_fd: file to copy to, at its current position
+    """
+    copied = 0
+    for method in (copy_range, send_file):
+        try:
+            while True:
+                count = method(src_fd, dst_fd)
+                if not count:
+                    return copied
+                copied += count
+        except OSError as error:
+            if copied or error.errno not in UNSUPPORTED_ERRORS:
+                raise
+    while True:
+        count = read_write(src_fd, dst_fd)
+        if not count:
+            return copied
+        copied += count
+
+
+def copy_file(src: Path, dst: Path) -> int:
+    """
+    Copies a file with its permissions and times, returns the copied bytes
+
+    Args:
+        src: file to copy, a symbolic link is followed
+        dst: the copy, replaced if it exists, a symbolic link is replaced too
+
+    Raises:
+        OSError: the file cannot be copied
+    """
+    if dst.is_symlink():
+        # Opening the link would overwrite the file it points to
+        if os.path.samestat(src.lstat(), dst.lstat()):
+            raise OSError(errno.EINVAL, "A file cannot be copied onto itself", str(src))
+        dst.unlink()
+    elif dst.exists() and os.path.samefile(src, dst):
+        raise OSError(errno.EINVAL, "A file cannot be copied onto itself", str(src))
+    with src.open("rb") as source, dst.open("wb") as target:
+        copied = copy_data(source.fileno(), target.fileno())
+    shutil.copystat(src, dst)
+    return copied
+
+
+def copy_tree(
+    src: Path, dst: Path, recursive: bool = False, workers: int = COPY_WORKERS
+) -> Tuple[int, int, int]:
+    """
+    Copies the files in a directory into another directory with a pool of
+    threads, creating it if needed
+
+    Symbolic links in the directory are copied as links. The directories
+    get the permissions and times of the copied ones once their files are
+    copied.
+
+    Args:
+        src: directory to copy from
+        dst: directory to copy to
+        recursive: also copy the subdirectories
+        workers: number of threads
+
+    Returns:
+        Tuple[int, int, int]: the number of copied files, copied bytes and errors
+    """
+    files = copied = errors = 0
+    directories = [(src, dst)]
+    stack = [(src, dst)]
+    queue: Deque["Future[int]"] = deque()
+
+    def collect(future: "Future[int]") -> None:
+        """Counts a finished copy"""
+        nonlocal files, copied, errors
+        try:
+            copied += future.result()
+            files += 1
+        except OSError:
+            errors += 1
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while stack:
+            src_dir, dst_dir = stack.pop()
+            try:
+                dst_dir.mkdir(exist_ok=True)
+                with os.scandir(src_dir) as entries:
+                    children = list(entries)
+            except OSError:
+                errors += 1
+                continue
+            for entry in children:
+                target = dst_dir.joinpath(entry.name)
+                try:
+                    if entry.is_symlink():
+                        if target.is_symlink() or target.is_file():
+                            target.unlink()
+                        os.symlink(os.readlink(entry.path), target)
+                        files += 1
+                    elif entry.is_dir():
+                        if recursive:
+                            stack.append((Path(entry.path), target))
+                            directories.append((Path(entry.path), target))
+                    else:
+                        queue.append(pool.submit(copy_file, Path(entry.path), target))
+                        if len(queue) >= workers * COPY_AHEAD:
+                            collect(queue.popleft())
+                except OSError:
+                    errors += 1
+        while queue:
+            collect(queue.popleft())
+    for src_dir, dst_dir in reversed(directories):
+        try:
+            shutil.copystat(src_dir, dst_dir)
+        except OSError:
+            errors += 1
+    return files, copied, errors
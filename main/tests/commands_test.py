@@ -1,10 +1,19 @@
 import datetime
+import errno
+import mmap
+import os
 from pathlib import Path
+from typing import List, Optional
 
 import pytest
 from _pytest.capture import CaptureFixture
 
 from ..commands import Commands
+from ..shell import find, pager
+from ..shell.args import split_args
+from ..shell.deltree import TreeDeleter
+from ..shell.index import indexed_files, required_literals
+from ..shell.pager import Pager
 
 
 class TestCommands:
@@ -41,13 +50,13 @@ class TestCommands:
             cmds: object returned by the Commands class
             capsys: CaptureFixture object
         """
-        cmds.list_dir()
+        cmds.list_dir(bare=True)
         out, err = capsys.readouterr()
         assert (
             out == "\n".join([dir.name for dir in cmds.current_path.iterdir()]) + "\n"
         )
         assert err == ""
-        cmds.list_dir("./main")
+        cmds.list_dir("./main", bare=True)
         out, err = capsys.readouterr()
         assert (
             out
@@ -58,6 +67,63 @@ class TestCommands:
         )
         assert err == ""
 
+    def test_dir_cache(self, tmp_path: Path, capsys: CaptureFixture) -> None:
+        """
+        Unit test for the listing and the directory cache of the dir command
+
+        Args:
+            tmp_path: temporary directory
+            capsys: CaptureFixture object
+        """
+        tmp_path.joinpath("b.py").write_text("x" * 1500)
+        tmp_path.joinpath("a.txt").write_text("hello")
+        tmp_path.joinpath("sub").mkdir()
+        os.utime(tmp_path.joinpath("b.py"), (0, 0))
+        cmds = Commands(tmp_path)
+
+        cmds.list_dir(order="GN")
+        out, err = capsys.readouterr()
+        lines = out.splitlines()
+        assert lines[0] == f" Directory of {tmp_path}"
+        assert lines[2].endswith("    <DIR>          sub")
+        assert lines[3].endswith("                 5 a.txt")
+        assert lines[4].endswith("             1,500 b.py")
+        assert lines[5:] == [
+            "               2 File(s)          1,505 bytes",
+            "               1 Dir(s)",
+        ]
+        cmds.list_dir(order="-D", bare=True)
+        out, err = capsys.readouterr()
+        assert out.splitlines()[-1] == "b.py"
+
+        cache = cmds.dir_cache
+        assert (cache.hits, cache.misses) == (1, 1)
+        cmds.dir_cache_stats()
+        out, err = capsys.readouterr()
+        assert out.startswith("Directory cache: 1 hits, 1 misses, 1 directories cached")
+
+        # Writing to a file does not change the time of change of the directory
+        if cache.inotify is not None:
+            tmp_path.joinpath("a.txt").write_text("hello world")
+            cmds.list_dir(order="N", bare=True)
+            assert (cache.hits, cache.misses) == (1, 2)
+            sizes = {entry[0]: entry[2] for entry in cache.list(str(tmp_path))}
+            assert sizes["a.txt"] == len("hello world")
+            assert cache.hits == 2
+
+        # Without inotify a new file is noticed by the time of change
+        cache.clear()
+        if cache.inotify is not None:
+            cache.inotify.close()
+        cache.inotify = None
+        cache.list(str(tmp_path))
+        tmp_path.joinpath("c.txt").write_text("")
+        # In case the time of change did not move on since the listing
+        os.utime(tmp_path, ns=(0, 0))
+        names = [entry[0] for entry in cache.list(str(tmp_path))]
+        assert sorted(names) == ["a.txt", "b.py", "c.txt", "sub"]
+        assert cache.list(str(tmp_path)) is cache.dirs[str(tmp_path)][2]
+
     def test_del(self, cmds: Commands) -> None:
         """
         Unit test for the del command
@@ -74,6 +140,108 @@ class TestCommands:
         cmds.delete_file([str(path)])
         assert not path.exists()
 
+    def test_deltree(self, tmp_path: Path, capsys: CaptureFixture) -> None:
+        """
+        Unit test for the deltree command
+
+        Args:
+            tmp_path: temporary directory
+            capsys: CaptureFixture object
+        """
+        kept = tmp_path.joinpath("kept")
+        kept.mkdir()
+        kept.joinpath("file.txt").write_text("")
+        root = tmp_path.joinpath("root")
+        for i in range(5):
+            sub = root.joinpath(f"dir{i}", "sub")
+            sub.mkdir(parents=True)
+            for j in range(20):
+                sub.joinpath(f"file{j}.txt").write_text("")
+        # Links are deleted without deleting what they point to
+        root.joinpath("dir0", "link").symlink_to(kept)
+        root.joinpath("file.txt").symlink_to(kept.joinpath("file.txt"))
+        cmds = Commands(tmp_path)
+
+        deleter = TreeDeleter(2)
+        deleter.cancelled = True
+        deleter.delete(root)
+        out, err = capsys.readouterr()
+        assert out == "Deleted 0 files and 0 directories, cancelled\n"
+        assert root.exists()
+
+        cmds.del_tree("root/dir0/link")
+        out, err = capsys.readouterr()
+        assert out == "root/dir0/link is not a directory\n"
+        cmds.del_tree("root", workers=4)
+        out, err = capsys.readouterr()
+        assert out.split("\r")[-1] == "Deleted 102 files and 11 directories\n"
+        assert err == ""
+        assert not root.exists()
+        assert kept.joinpath("file.txt").exists()
+
+    def test_copy(
+        self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch, capsys: CaptureFixture
+    ) -> None:
+        """
+        Unit test for the copy and xcopy commands
+
+        Args:
+            tmp_path: temporary directory
+            monkeypatch: MonkeyPatch object
+            capsys: CaptureFixture object
+        """
+        src = tmp_path.joinpath("src")
+        src.joinpath("sub").mkdir(parents=True)
+        src.joinpath("a.txt").write_text("hello")
+        src.joinpath("sub", "b.txt").write_text("world!")
+        src.joinpath("link").symlink_to("a.txt")
+        os.utime(src.joinpath("a.txt"), (0, 0))
+        cmds = Commands(tmp_path)
+
+        cmds.copy("src/a.txt", "a.txt")
+        out, err = capsys.readouterr()
+        assert out.startswith("Copied 1 files, 5 bytes in ")
+        assert tmp_path.joinpath("a.txt").read_text() == "hello"
+        assert tmp_path.joinpath("a.txt").stat().st_mtime == 0
+        cmds.copy("a.txt", "src")
+        out, err = capsys.readouterr()
+        assert out.startswith("Copied 1 files")
+        cmds.copy("a.txt", ".")
+        out, err = capsys.readouterr()
+        assert out.startswith("a.txt cannot be copied: ")
+        # A link in place of the copy is replaced, not written through
+        tmp_path.joinpath("b.txt").symlink_to("src/sub/b.txt")
+        cmds.copy("a.txt", "b.txt")
+        out, err = capsys.readouterr()
+        assert out.startswith("Copied 1 files")
+        assert not tmp_path.joinpath("b.txt").is_symlink()
+        assert src.joinpath("sub", "b.txt").read_text() == "world!"
+
+        cmds.copy("src", "flat")
+        out, err = capsys.readouterr()
+        assert out.startswith("Copied 2 files, 5 bytes in ")
+        assert sorted(p.name for p in tmp_path.joinpath("flat").iterdir()) == [
+            "a.txt",
+            "link",
+        ]
+        cmds.copy("src", "tree", recursive=True, workers=2)
+        out, err = capsys.readouterr()
+        assert out.startswith("Copied 3 files, 11 bytes in ")
+        assert tmp_path.joinpath("tree", "sub", "b.txt").read_text() == "world!"
+        assert os.readlink(tmp_path.joinpath("tree", "link")) == "a.txt"
+        cmds.copy("src", "src/sub", recursive=True)
+        out, err = capsys.readouterr()
+        assert out == "src cannot be copied into itself\n"
+
+        # Moving to another file system copies the file and deletes it
+        def replace(self: Path, target: Path) -> None:
+            raise OSError(errno.EXDEV, "Invalid cross-device link")
+
+        monkeypatch.setattr(Path, "replace", replace)
+        cmds.move_file("a.txt", "tree/sub")
+        assert not tmp_path.joinpath("a.txt").exists()
+        assert tmp_path.joinpath("tree", "sub", "a.txt").read_text() == "hello"
+
     def test_rd(self, cmds: Commands, capsys: CaptureFixture) -> None:
         """
         Unit test for the rd command
@@ -109,6 +277,74 @@ class TestCommands:
         assert out == "hello world\n"
         assert err == ""
 
+    def test_type_stream(
+        self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch, capsys: CaptureFixture
+    ) -> None:
+        """
+        Unit Test for type command on text that is no UTF-8, read in chunks
+
+        Args:
+            tmp_path: temporary directory
+            monkeypatch: used to read one byte at a time
+            capsys: CaptureFixture object
+        """
+        monkeypatch.setattr(pager, "TYPE_CHUNK", 1)
+        tmp_path.joinpath("mixed.txt").write_bytes(
+            "héllo\n".encode() + b"\xff\x1b[2J\tend\n"
+        )
+        cmds = Commands(tmp_path)
+        cmds.show_file_content("mixed.txt")
+        out, err = capsys.readouterr()
+        assert out == "héllo\n\ufffd\ufffd[2J\tend\n"
+        cmds.show_file_content("missing.txt")
+        out, err = capsys.readouterr()
+        assert out == "missing.txt is not a file\n"
+        assert err == ""
+
+    def test_more(
+        self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch, capsys: CaptureFixture
+    ) -> None:
+        """
+        Unit Test for paging through a file
+
+        Args:
+            tmp_path: temporary directory
+            monkeypatch: used to answer the prompts
+            capsys: CaptureFixture object
+        """
+        path = tmp_path.joinpath("more.txt")
+        text = "one\n\n" + "x" * 7 + "e\u0301" * 3 + "中" * 3 + "\nlast"
+        path.write_bytes(text.encode())
+        with path.open("rb") as f, mmap.mmap(
+            f.fileno(), 0, access=mmap.ACCESS_READ
+        ) as data:
+            screen = Pager(data, 5, 4)
+            rows = [0]
+            while screen.next_row(rows[-1]) < len(data):
+                rows.append(screen.next_row(rows[-1]))
+            texts = [screen.row_text(row) for row in rows]
+            # Rows wrap on screen columns, wide characters take two of them
+            accents = "e\u0301" * 3
+            assert texts == ["one", "", "xxxxx", "xx" + accents, "中中", "中", "last"]
+
+            replies = iter(["", "b", "", "q"])
+            monkeypatch.setattr("builtins.input", lambda prompt: next(replies))
+            screen.page()
+            out, err = capsys.readouterr()
+            # The first two pages, shown again after going back
+            assert out == ("one\n\nxxxxx\n" + f"xx{accents}\n中中\n中\n") * 2
+            assert next(replies, None) is None
+
+        # A tab goes on to the next tab stop
+        path.write_bytes(b"ab\tcdefgh\n\tx")
+        with path.open("rb") as f, mmap.mmap(
+            f.fileno(), 0, access=mmap.ACCESS_READ
+        ) as data:
+            screen = Pager(data, 10, 4)
+            assert screen.next_row(0) == 5
+            assert screen.row_text(5) == "efgh"
+            assert screen.row_text(screen.next_row(5)) == "\tx"
+
     def test_ren(self, cmds: Commands, capsys: CaptureFixture) -> None:
         """
         Unit Test for ren command
@@ -145,3 +381,195 @@ class TestCommands:
         out, err = capsys.readouterr()
         assert out == datetime.datetime.now().strftime("%H:%M") + "\n"
         assert err == ""
+
+    def test_find(
+        self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch, capsys: CaptureFixture
+    ) -> None:
+        """
+        Unit Test for find command
+
+        Args:
+            tmp_path: temporary directory
+            monkeypatch: used to decode the file a line at a time
+            capsys: CaptureFixture object
+        """
+        tmp_path.joinpath("a.txt").write_text("one\nHello world\nthree\nhello\n")
+        tmp_path.joinpath("b.bin").write_bytes(b"hello\0world")
+        sub = tmp_path.joinpath("sub")
+        sub.mkdir()
+        sub.joinpath("c.txt").write_text("first\r\nsecond hello")
+        cmds = Commands(tmp_path)
+
+        cmds.find_text("hello", "a.txt")
+        out, err = capsys.readouterr()
+        assert out == "---------- a.txt\n[4]hello\n"
+        assert err == ""
+
+        cmds.find_text("hello", recursive=True, ignore_case=True)
+        out, err = capsys.readouterr()
+        assert out == (
+            "---------- a.txt\n[2]Hello world\n[4]hello\n"
+            "---------- sub/c.txt\n[2]second hello\n"
+        )
+
+        cmds.find_text("hello", recursive=True, count=True, workers=2)
+        out, err = capsys.readouterr()
+        assert out == "---------- a.txt: 1\n---------- sub/c.txt: 1\n"
+
+        # Case is ignored for letters beyond ASCII too
+        tmp_path.joinpath("d.txt").write_text("l'école\nÉCOLE\n")
+        cmds.find_text("ÉCOLE", "d.txt", ignore_case=True)
+        out, err = capsys.readouterr()
+        assert out == "---------- d.txt\n[1]l'école\n[2]ÉCOLE\n"
+        cmds.find_text("école", "d.txt")
+        out, err = capsys.readouterr()
+        assert out == "---------- d.txt\n[1]l'école\n"
+        # The text is decoded in chunks of whole lines
+        monkeypatch.setattr(find, "DECODE_CHUNK", 4)
+        tmp_path.joinpath("e.txt").write_text("école\nx\n\nÉcole école\n")
+        regex = find.compile_pattern("ÉCOLE", ignore_case=True)
+        result = find.search_file(tmp_path.joinpath("e.txt"), regex)
+        assert result == (2, [(1, "école"), (4, "École école")])
+
+        cmds.find_text(r"^t\w+$", "a.txt", is_regex=True)
+        out, err = capsys.readouterr()
+        assert out == "---------- a.txt\n[3]three\n"
+
+        cmds.find_text("missing")
+        out, err = capsys.readouterr()
+        assert out == "String missing was not found!\n"
+        cmds.find_text("hello", "none.txt")
+        out, err = capsys.readouterr()
+        assert out == "The file none.txt does not exist!\n"
+        assert err == ""
+
+    def test_split_args(self) -> None:
+        """Unit test for splitting the input of the shell into arguments"""
+        assert split_args('find "hello world" /S') == ["find", "hello world", "/S"]
+        assert split_args(r"cd C:\Users\box") == ["cd", r"C:\Users\box"]
+        assert split_args("del file#1.txt") == ["del", "file#1.txt"]
+        assert split_args("find #include src") == ["find", "#include", "src"]
+        assert split_args("echo a # b") == ["echo", "a", "#", "b"]
+        assert split_args("echo it's Bob's car") == ["echo", "it's", "Bob's", "car"]
+        assert split_args('echo "not closed') == ["echo", '"not', "closed"]
+
+    def test_index(
+        self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch, capsys: CaptureFixture
+    ) -> None:
+        """
+        Unit Test for index command
+
+        Args:
+            tmp_path: temporary directory
+            monkeypatch: MonkeyPatch object
+            capsys: CaptureFixture object
+        """
+        monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path.joinpath("cache")))
+
+        def indexed(
+            directory: Path, text: str, recursive: bool = False
+        ) -> Optional[List[Path]]:
+            files = indexed_files(directory, text, recursive=recursive)
+            return None if files is None else list(files)
+
+        root = tmp_path.joinpath("tree")
+        sub = root.joinpath("sub")
+        sub.mkdir(parents=True)
+        root.joinpath("a.txt").write_text("alpha beta\n")
+        root.joinpath("b.txt").write_text("gamma\nBeta Gamma\n")
+        sub.joinpath("c.txt").write_text("beta\n")
+        cmds = Commands(root)
+        assert indexed(root, "beta") is None
+
+        cmds.index_dir(workers=1)
+        out, err = capsys.readouterr()
+        assert out.startswith("Indexed 3 files and removed 0 in ")
+        assert out.endswith(", 3 files in the index\n")
+        assert indexed(root, "gamma", True) == [root / "b.txt"]
+        assert indexed(root, "beta") == [root / "a.txt", root / "b.txt"]
+        assert indexed(sub, "beta") == [sub / "c.txt"]
+        assert indexed(root, "zeta") == []
+        assert indexed(root, "be") is None
+
+        root.joinpath("a.txt").write_text("alpha delta\n")
+        sub.joinpath("c.txt").unlink()
+        cmds.index_dir(workers=2)
+        out, err = capsys.readouterr()
+        assert out.startswith("Indexed 1 files and removed 1 in ")
+        assert indexed(root, "delta") == [root / "a.txt"]
+
+        cmds.find_text("beta", recursive=True, ignore_case=True)
+        out, err = capsys.readouterr()
+        assert out == "---------- b.txt\n[2]Beta Gamma\n"
+        assert err == ""
+
+        # Files added or changed after the index was updated are searched too
+        root.joinpath("d.txt").write_text("beta\n")
+        sub.joinpath("e.txt").write_text("beta\n")
+        root.joinpath("a.txt").write_text("alpha beta\n")
+        assert indexed(root, "beta", True) == [
+            root / "a.txt",
+            root / "b.txt",
+            root / "d.txt",
+            sub / "e.txt",
+        ]
+        cmds.find_text("beta", recursive=True)
+        out, err = capsys.readouterr()
+        assert out == (
+            "---------- a.txt\n[1]alpha beta\n"
+            "---------- d.txt\n[1]beta\n"
+            "---------- sub/e.txt\n[1]beta\n"
+        )
+
+    def test_required_literals(self) -> None:
+        """Unit Test for the parts of a pattern the content index is searched for"""
+        assert required_literals("a.b*c") == ["a.b*c"]
+        assert required_literals(r"def \w+_test\.py$", True) == ["def ", "_test.py"]
+        assert required_literals(r"ab?c[xyz]+d{2}", True) == ["a", "c"]
+        assert required_literals(r"(foo|bar)", True) == []
+
+    def test_tree(self, tmp_path: Path, capsys: CaptureFixture) -> None:
+        """
+        Unit Test for tree command
+
+        Args:
+            tmp_path: temporary directory
+            capsys: CaptureFixture object
+        """
+        root = tmp_path.joinpath("root")
+        deep = root.joinpath("sub", "deep")
+        deep.mkdir(parents=True)
+        root.joinpath("a.txt").write_text("hello")
+        root.joinpath("sub", "b.txt").write_text("")
+        deep.joinpath("c.txt").write_text("")
+        root.joinpath("z.txt").write_text("")
+        # A link back up to the root is not followed
+        deep.joinpath("up").symlink_to(root)
+        cmds = Commands(tmp_path)
+
+        cmds.tree("root")
+        out, err = capsys.readouterr()
+        assert out == (
+            "└──root\n"
+            "    ├──a.txt\n"
+            "    ├──sub\n"
+            "    │   ├──b.txt\n"
+            "    │   └──deep\n"
+            "    │       ├──c.txt\n"
+            "    │       └──up [loop]\n"
+            "    └──z.txt\n"
+        )
+        assert err == ""
+
+        cmds.tree("root", depth=1, sizes=True)
+        out, err = capsys.readouterr()
+        assert out == (
+            "└──root\n"
+            "    ├──a.txt (5 bytes)\n"
+            "    ├──sub\n"
+            "    └──z.txt (0 bytes)\n"
+        )
+
+        cmds.tree("root", files_only=True)
+        out, err = capsys.readouterr()
+        assert out == "a.txt\nsub/b.txt\nsub/deep/c.txt\nz.txt\n"
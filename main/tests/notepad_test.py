@@ -0,0 +1,534 @@
+import json
+import random
+import re
+from pathlib import Path
+from typing import Any
+
+import pytest
+from prompt_toolkit.application import create_app_session
+from prompt_toolkit.input import create_pipe_input
+from prompt_toolkit.output import DummyOutput
+from pygments.lexers import JsonLexer, PythonLexer, find_lexer_class_for_filename
+
+from ..notepad import highlight, lexers, mapped, piece_table, search, undo
+from ..notepad.editor import Editor
+from ..notepad.highlight import Highlighter
+from ..notepad.notepad import NotepadApp
+from ..notepad.piece_table import PieceTable
+from ..notepad.save import Saver
+from ..notepad.search import Search, mark_matches
+
+
+class TestNotepad:
+    """Tests for the Notepad app"""
+
+    @pytest.fixture(autouse=True)
+    def cache_home(self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+        """
+        Fixture that keeps the lexer index out of the user's cache directory
+
+        Returns: Path
+        """
+        cache_home = tmp_path.joinpath("cache")
+        monkeypatch.setenv("XDG_CACHE_HOME", str(cache_home))
+        return cache_home
+
+    def test_piece_table(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        """
+        Unit test comparing random edits of a PieceTable with edits of a str
+
+        Args:
+            monkeypatch: used to make the newline index scan in small chunks
+        """
+        monkeypatch.setattr(piece_table, "SCAN_CHUNK", 16)
+        monkeypatch.setattr(piece_table, "COUNT_LIMIT", 3)
+        rng = random.Random(0)
+        expected = "ab\ncd\n\nefgh\nij" * 4
+        table = PieceTable(expected)
+        for step in range(500):
+            offset = rng.randint(0, len(expected))
+            if rng.random() < 0.5:
+                text = rng.choice(["x", "\n", "yz\nw", "\n\n"])
+                table.insert(offset, text)
+                expected = expected[:offset] + text + expected[offset:]
+            else:
+                end = offset + rng.randint(0, 5)
+                assert table.delete(offset, end - offset) == expected[offset:end]
+                expected = expected[:offset] + expected[end:]
+
+            lines = expected.split("\n")
+            assert len(table) == len(expected)
+            assert table.line_count == len(lines)
+            if step % 25 == 0:
+                assert table.text() == expected
+                assert [table.line(row) for row in range(len(lines))] == lines
+                for offset in range(len(expected) + 1):
+                    row = expected.count("\n", 0, offset)
+                    col = offset - expected.rfind("\n", 0, offset) - 1
+                    assert table.position(offset) == (row, col)
+                    assert table.offset(row, col) == offset
+
+    def test_edit(self, tmp_path: Path) -> None:
+        """
+        Unit test typing into the editor and saving the file
+
+        Args:
+            tmp_path: temporary directory
+        """
+        path = tmp_path.joinpath("file.py")
+        path.write_text("def f():\n    return 1\n")
+        with create_pipe_input() as pipe_input:
+            with create_app_session(input=pipe_input, output=DummyOutput()):
+                app = NotepadApp(current_path=tmp_path, file_name=path)
+                # Without a saved lexer index the lexer is looked up later
+                assert app.lexer_key is None and app.lexer_pending
+                # x, Down, End, "yz", Enter, Backspace twice, q, Ctrl+S, Ctrl+D
+                pipe_input.send_text("x\x1b[B\x1b[Fyz\r\x7f\x7fq\x13\x04")
+                app.run()
+
+        assert path.read_text() == "xdef f():\n    return 1yq\n"
+        editor = app.text_field
+        assert (editor.row, editor.col) == (1, 14)
+        # The lexer is loaded in the background after the first frame
+        assert isinstance(app.add_lexer(), PythonLexer)
+        assert app.lexer_key == ("pygments.lexers.python", "PythonLexer")
+        # Once the index is saved the lexer is looked up right away
+        with create_app_session(output=DummyOutput()):
+            reopened = NotepadApp(current_path=tmp_path, file_name=path)
+            assert reopened.lexer_key == ("pygments.lexers.python", "PythonLexer")
+
+    def test_lexers(self, cache_home: Path) -> None:
+        """
+        Unit test finding lexers in the saved index
+
+        Args:
+            cache_home: cache directory the index is saved in
+        """
+        path = cache_home.joinpath("boxos", "notepad", lexers.INDEX_NAME)
+        index = lexers.load_index(path)
+        assert path.exists()
+        names = ["a.py", "Makefile", "x.tar.gz", "rc.bash_aliases", "foo.1", "no"]
+        names += ["style.CSS", "page.php5", "Kconfig-debug", "file.h", "a.b.js"]
+        for name in names:
+            expected = find_lexer_class_for_filename(name)
+            key = lexers.find_lexer(name, index)
+            assert key == (
+                None if expected is None else (expected.__module__, expected.__name__)
+            )
+            if key is not None:
+                assert lexers.load_lexer(key) is expected
+
+        # An index of another pygments version is built again
+        index["pygments"] = "0.1"
+        index["extensions"] = {}
+        path.write_text(json.dumps(index))
+        lexers.load_index.cache_clear()
+        assert lexers.find_lexer("a.py") == ("pygments.lexers.python", "PythonLexer")
+
+    def test_highlight(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        """
+        Unit test highlighting in the background after edits
+
+        Args:
+            monkeypatch: used to count the lexed lines
+        """
+        monkeypatch.setattr(highlight, "JOB_LINES", 50)
+        table = PieceTable(
+            "x = 1\n" * 300 + 's = """\nin string\n"""\n' + "y = 2\n" * 300
+        )
+        highlighter = Highlighter(table, PythonLexer())
+        lexed = []
+
+        def lex_line(*args: Any) -> Any:
+            lexed.append(args[1])
+            return real_lex_line(*args)
+
+        real_lex_line = highlight.lex_line
+        monkeypatch.setattr(highlight, "lex_line", lex_line)
+
+        def edit(offset: int, length: int, text: str) -> None:
+            highlighter.edit(offset, table.replace(offset, length, text), text)
+
+        def highlight_lines(last_row: int) -> None:
+            while highlighter.frontier <= last_row:
+                highlighter.update(last_row)
+                highlighter.wait()
+            highlighter.update(last_row)
+
+        string = "class:pygments.literal.string.double"
+        assert highlighter.line(0) is None
+        highlight_lines(400)
+        # The same as lexing the line on its own with pygments
+        assert highlighter.line(0) == highlight.lex_line(PythonLexer(), "x = 1")[0]
+        assert highlighter.line(301) == [(string, "in string")]
+        # Lines are highlighted in jobs of JOB_LINES lines up to the window
+        assert highlighter.frontier == 450
+        assert highlighter.line(450) is None
+
+        # Only the changed line is lexed again when the state stays the same
+        lexed.clear()
+        edit(table.offset(10, 0), 0, "z")
+        assert highlighter.line(10) is None
+        highlight_lines(400)
+        assert lexed == ["zx = 1"]
+        assert highlighter.frontier == 450
+
+        # Opening a string changes the lines after it
+        lexed.clear()
+        edit(table.offset(100, 0), 0, '"""\n')
+        highlight_lines(310)
+        assert len(lexed) == 250
+        assert highlighter.line(200) == [(string, "x = 1")]
+        fragments = highlighter.line(302)
+        assert fragments is not None and fragments[0] == (
+            "class:pygments.operator.word",
+            "in",
+        )
+
+        # Lexers without states lex every line on its own
+        fragments, state = highlight.lex_line(JsonLexer(), '{"a": 1}')
+        assert state is None
+        assert "".join(fragment[1] for fragment in fragments) == '{"a": 1}'
+
+    def test_search(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        """
+        Unit test finding and replacing text with the match index
+
+        Args:
+            monkeypatch: used to search in small chunks
+        """
+        monkeypatch.setattr(search, "SCAN_LINES", 3)
+        table = PieceTable("ab ab\nxy\n\nab1 b\nab2")
+        finder = Search(table)
+        finder.set_pattern("ab")
+        assert not finder.done
+        while not finder.done:
+            finder.update()
+            finder.wait()
+            finder.update()
+        assert finder.matches == [[(0, 2), (3, 5)], [], [], [(0, 2)], [(0, 2)]]
+        assert finder.found == 4
+
+        # Only the changed lines are searched again
+        edit = table.offset(1, 1)
+        finder.edit(edit, table.replace(edit, 1, "\nab"), "\nab")
+        assert finder.matches[1:3] == [None, None]
+        assert finder.line(2) == [(0, 2)] and finder.found == 5
+        assert finder.find(1, 0) == (2, (0, 2))
+        assert finder.find(5, 1) == (0, (0, 2))
+        assert finder.find(0, 3, forward=False) == (0, (0, 2))
+        assert finder.find(0, 0, forward=False) == (5, (0, 2))
+
+        finder.set_pattern(r"ab(\d)", is_regex=True)
+        assert finder.replace_all(r"<\1>") == (12, 9, "<1> b\n<2>", 2)
+        with pytest.raises(re.error):
+            finder.set_pattern("(", is_regex=True)
+
+        fragments = [("class:a", "xab"), ("class:b", "cd")]
+        assert mark_matches(fragments, [(1, 4)], current=1) == [
+            ("class:a", "x"),
+            ("class:a class:search class:incsearch.current", "ab"),
+            ("class:b class:search class:incsearch.current", "c"),
+            ("class:b", "d"),
+        ]
+
+    def test_replace(self, tmp_path: Path) -> None:
+        """
+        Unit test finding and replacing text in the app
+
+        Args:
+            tmp_path: temporary directory
+        """
+        path = tmp_path.joinpath("file.txt")
+        path.write_text("one two\ntwo one\n" * 1000)
+        with create_pipe_input() as pipe_input:
+            with create_app_session(input=pipe_input, output=DummyOutput()):
+                app = NotepadApp(current_path=tmp_path, file_name=path)
+                edits = []
+                app.text_field.edit_handlers.append(lambda *edit: edits.append(edit))
+                # Ctrl+F "two" Enter, F3, Ctrl+R "2" Enter, Ctrl+S, Ctrl+D
+                pipe_input.send_text("\x06two\r\x1bOR\x122\r\x13\x04")
+                app.run()
+
+        assert path.read_text() == "one 2\n2 one\n" * 1000
+        assert len(edits) == 1
+        editor = app.text_field
+        assert (editor.row, editor.col) == (1, 0)
+
+    def test_undo(self) -> None:
+        """Unit test undoing and redoing edits within the budget of the history"""
+        editor = Editor("one\n", undo_budget=3 * undo.EDIT_OVERHEAD + 10)
+        history = editor.history
+        assert history is not None
+        editor.move_to(0, 3)
+        for char in "abc":
+            editor.insert_text(char)
+        editor.delete_before_cursor()
+        editor.delete_before_cursor()
+        editor.insert_text("\n")
+        # Typing and deleting are merged into one edit each
+        assert list(history.undo_stack) == [
+            (3, "", "abc"),
+            (4, "bc", ""),
+            (4, "", "\n"),
+        ]
+
+        editor.undo()
+        editor.undo()
+        assert editor.text == "oneabc\n"
+        assert (editor.row, editor.col) == (0, 6)
+        editor.redo()
+        assert editor.text == "onea\n"
+        editor.insert_text("x")
+        assert not history.redo_stack
+        editor.redo()
+        assert editor.text == "oneax\n"
+
+        # The oldest edits are dropped to stay within the budget
+        editor.insert_text("\n" + "y" * 8)
+        assert list(history.undo_stack) == [(4, "", "x"), (5, "", "\nyyyyyyyy")]
+        assert history.size <= history.budget
+        # An edit larger than the budget is kept alone, so it can be undone
+        editor.insert_text("z" * 300)
+        assert list(history.undo_stack) == [(14, "", "z" * 300)]
+        editor.undo()
+        assert editor.text == "oneax\nyyyyyyyy\n"
+        assert not history.undo_stack
+        editor.undo()
+        assert editor.text == "oneax\nyyyyyyyy\n"
+
+    def test_selection(self, tmp_path: Path) -> None:
+        """
+        Unit test selecting text, moving a word at a time and the clipboard
+
+        Args:
+            tmp_path: temporary directory
+        """
+        path = tmp_path.joinpath("file.txt")
+        path.write_text("one two\nthree\n")
+        with create_pipe_input() as pipe_input:
+            with create_app_session(input=pipe_input, output=DummyOutput()):
+                app = NotepadApp(current_path=tmp_path, file_name=path)
+                # Ctrl+Right, Shift+End, Alt+W, Home, Ctrl+V
+                pipe_input.send_text("\x1b[1;5C\x1b[1;2F\x1bw\x1b[H\x16")
+                # Ctrl+Shift+Left, Shift+Delete, Shift+Down, x, Ctrl+S, Ctrl+D
+                pipe_input.send_text("\x1b[1;6D\x1b[3;2~\x1b[1;2Bx\x13\x04")
+                app.run()
+                assert app.application.clipboard.get_data().text == "two"
+
+        assert path.read_text() == "xthree\n"
+
+        editor = Editor("one two\nthree\n")
+        editor.move_to(0, 4)
+        editor.select(lambda: editor.move_vertically(1))
+        assert editor.selected_text() == "two\nthre"
+        assert editor.line_fragments(0) == [("", "one "), (" class:selected", "two")]
+        assert editor.line_fragments(1) == [(" class:selected", "thre"), ("", "e")]
+        editor.move_word(forward=False)
+        assert (editor.row, editor.col) == (1, 0)
+        assert editor.selection() is None
+        editor.move_word(forward=False)
+        assert (editor.row, editor.col) == (0, 7)
+
+    def test_long_lines(self) -> None:
+        """Unit test scrolling horizontally through a very long line"""
+        long_line = "ab" * highlight.LONG_LINE + "c"
+        editor = Editor("short\n" * 10 + long_line + "\nend", PythonLexer())
+        content = editor.control.create_content(20, 5)
+        assert not editor.long_lines
+        assert content.get_line(0) == [("", "short")]
+
+        editor.move_to(10, len(long_line))
+        content = editor.control.create_content(20, 5)
+        assert editor.long_lines and editor.scroll_col == len(long_line) - 19
+        assert content.cursor_position.x == 19
+        # Only the shown columns are highlighted, as a name
+        assert content.get_line(10) == [("class:pygments.name", "ab" * 9 + "c")]
+        assert content.get_line(9) == []
+
+        editor.move_to(10, 3)
+        content = editor.control.create_content(20, 5)
+        assert editor.scroll_col == 3 and content.cursor_position.x == 0
+        assert (editor.row, editor.col) == (10, 3)
+        # The line may be highlighted by now
+        assert "".join(text for _, text in content.get_line(9)) == "rt"
+
+    def test_view(self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+        """
+        Unit test opening a file read-only with a memory map
+
+        Args:
+            tmp_path: temporary directory
+            monkeypatch: used to make the index sparse and read in small chunks
+        """
+        monkeypatch.setattr(mapped, "INDEX_STEP", 4)
+        monkeypatch.setattr(mapped, "READ_CHUNK", 50)
+        path = tmp_path.joinpath("file.log")
+        lines = ["line {} {}".format(row, "x" * (row % 7)) for row in range(100)]
+        path.write_text("\r\n".join(lines))
+        with create_pipe_input() as pipe_input:
+            with create_app_session(input=pipe_input, output=DummyOutput()):
+                app = NotepadApp(
+                    current_path=tmp_path, file_name=path, view_threshold=1
+                )
+                assert app.view is not None
+                app.view.thread.join()
+                view = app.view
+                assert view.done
+                assert [view.line(row) for row in range(view.line_count)] == lines
+                # Typing is ignored, Ctrl+G 42 Enter, End, Ctrl+S, Ctrl+D
+                pipe_input.send_text("abc\x0742\r\x1b[F\x13\x04")
+                app.run()
+
+        assert path.read_text() == "\n".join(lines)
+        editor = app.text_field
+        assert (editor.row, editor.col) == (41, len(lines[41]))
+        assert view.map.closed
+
+    def test_save(self, tmp_path: Path) -> None:
+        """
+        Unit test for saving in the background
+
+        Args:
+            tmp_path: temporary directory
+        """
+        path = tmp_path.joinpath("file.txt")
+        path.write_text("old")
+        path.chmod(0o640)
+        table = PieceTable("first\n")
+        saves = []
+        saver = Saver(on_change=lambda: saves.append(saver.status))
+        with saver.condition:
+            # The saving thread can only start writing once both saves are queued
+            saver.save(path, table.snapshot())
+            table.insert(0, "second ")
+            saver.save(path, table.snapshot())
+            table.insert(0, "not saved ")
+        saver.wait()
+
+        assert path.read_text() == "second first\n"
+        assert path.stat().st_mode & 0o777 == 0o640
+        assert [child.name for child in tmp_path.iterdir()] == ["file.txt"]
+        assert saves[-1].startswith("Saved") and saves.count("Saving 100%") == 1
+
+        saver.save(tmp_path.joinpath("missing", "file.txt"), table.snapshot())
+        saver.wait()
+        assert saver.status.startswith("Save failed")
+
+    def test_journal(self, tmp_path: Path) -> None:
+        """
+        Unit test recovering unsaved edits from the journal after a crash
+
+        Args:
+            tmp_path: temporary directory
+        """
+        path = tmp_path.joinpath("file.txt")
+        path.write_text("one\ntwo\n")
+        with create_app_session(output=DummyOutput()):
+            app = NotepadApp(current_path=tmp_path, file_name=path)
+            editor = app.text_field
+            editor.move_to(1, 3)
+            editor.insert_text("!")
+            editor.insert_text("?")
+            editor.move_to(0, 0)
+            editor.delete_at_cursor()
+            assert app.journal is not None
+            app.journal.flush()
+            assert app.journal.records == [(7, 0, "!?"), (0, 1, "")]
+
+            # The app crashed without saving or closing the journal
+            recovered = NotepadApp(current_path=tmp_path, file_name=path)
+            assert recovered.text_field.text == "ne\ntwo!?\n"
+            assert recovered.get_status() == "Recovered 2 unsaved edits"
+            journal = recovered.journal
+            assert journal is not None
+
+            # An edit made while the text is being saved stays in the journal
+            mark = journal.mark()
+            saved = recovered.text_field.text
+            recovered.text_field.insert_text("x")
+            path.write_text(saved)
+            journal.rebase(mark)
+            assert journal.recover() == [(0, 0, "x")]
+            journal.close()
+            assert not journal.journal_path.exists()
+
+    def test_journal_crash(
+        self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        """
+        Unit test that the journal is kept when the app stops with an exception
+
+        Args:
+            tmp_path: temporary directory
+            monkeypatch: makes the app raise
+        """
+        path = tmp_path.joinpath("file.txt")
+        path.write_text("one\n")
+        with create_app_session(output=DummyOutput()):
+            app = NotepadApp(current_path=tmp_path, file_name=path)
+            app.text_field.insert_text("x")
+            monkeypatch.setattr(app.application, "run", self.crash)
+            with pytest.raises(RuntimeError):
+                app.run()
+
+            recovered = NotepadApp(current_path=tmp_path, file_name=path)
+            assert recovered.text_field.text == "xone\n"
+            assert recovered.journal is not None
+            recovered.journal.close()
+
+    def test_journal_cut_off(self, tmp_path: Path) -> None:
+        """
+        Unit test that edits made after recovering a journal cut off by a crash
+        are recovered too
+
+        Args:
+            tmp_path: temporary directory
+        """
+        path = tmp_path.joinpath("file.txt")
+        path.write_text("one\n")
+        with create_app_session(output=DummyOutput()):
+            app = NotepadApp(current_path=tmp_path, file_name=path)
+            assert app.journal is not None
+            app.text_field.insert_text("x")
+            app.journal.flush()
+            with app.journal.journal_path.open("a") as f:
+                f.write('[1, 0, "cut')
+
+            recovered = NotepadApp(current_path=tmp_path, file_name=path)
+            assert recovered.text_field.text == "xone\n"
+            assert recovered.journal is not None
+            recovered.text_field.move_to(0, 4)
+            recovered.text_field.insert_text("!")
+            recovered.journal.flush()
+
+            again = NotepadApp(current_path=tmp_path, file_name=path)
+            assert again.text_field.text == "xone!\n"
+            assert again.journal is not None
+            again.journal.close()
+
+    @staticmethod
+    def crash() -> None:
+        """Stands in for the app, which crashes"""
+        raise RuntimeError("crash")
+
+    def test_journal_foreign(self, tmp_path: Path) -> None:
+        """
+        Unit test that a file in place of the journal that is not one is left alone
+
+        Args:
+            tmp_path: temporary directory
+        """
+        path = tmp_path.joinpath("file.txt")
+        path.write_text("one\n")
+        journal_path = tmp_path.joinpath(".file.txt.boxos-journal")
+        for content in (b"\xff\xfe not text\n", b'{"version": 1}\n'):
+            journal_path.write_bytes(content)
+            with create_app_session(output=DummyOutput()):
+                app = NotepadApp(current_path=tmp_path, file_name=path)
+                assert app.text_field.text == "one\n"
+                assert app.journal is not None
+                app.text_field.insert_text("x")
+                app.journal.flush()
+                app.journal.close()
+            assert journal_path.read_bytes() == content
@@ -0,0 +1,354 @@
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from unittest import mock
+
+import pytest
+from PIL import Image
+from prompt_toolkit import ANSI
+from prompt_toolkit.formatted_text import fragment_list_width
+from prompt_toolkit.formatted_text.utils import split_lines
+
+from ..photos import animation, benchmark, decode, palette
+from ..photos.cache import RenderCache
+from ..photos.gallery import Gallery
+from ..photos.photos import ImageViewer
+
+
+class TestImageViewer:
+    """Tests for the Photos app"""
+
+    @pytest.fixture()
+    def viewer(self) -> ImageViewer:
+        """
+        Fixture that creates an ImageViewer object
+
+        Returns: ImageViewer
+        """
+        return ImageViewer(Path("image.png"), cache=RenderCache(Path("unused")))
+
+    @staticmethod
+    def make_image(width: int, height: int) -> Image.Image:
+        """
+        Creates an RGBA image with a different color for every pixel
+
+        Args:
+            width: width of the image
+            height: height of the image
+        """
+        image = Image.new("RGBA", (width, height))
+        image.putdata(
+            [
+                (x * 7 % 256, y * 13 % 256, (x + y) % 256, 128)
+                for y in range(height)
+                for x in range(width)
+            ]
+        )
+        return image
+
+    def test_ansi_rows(self, viewer: ImageViewer) -> None:
+        """
+        Unit test comparing ansi_rows with a per-pixel reference
+
+        Args:
+            viewer: object returned by the ImageViewer class
+        """
+        image = self.make_image(9, 6)
+        expected = ""
+        for y in range(0, image.height, 2):
+            for x in range(0, image.width):
+                fg = viewer.ansi_fg(*image.getpixel((x, y + 1))[:3])
+                bg = viewer.ansi_bg(*image.getpixel((x, y))[:3])
+                expected += "{}{}▄".format(fg, bg)
+            expected += "\n"
+
+        output = "".join(row + "\n" for row in viewer.ansi_rows(image))
+        assert output == expected
+        assert viewer.ansi_size(image) == len(expected.encode())
+
+    def test_view_ansi(self, viewer: ImageViewer) -> None:
+        """
+        Unit test checking that view_ansi draws the same cells as ansi_rows
+
+        Args:
+            viewer: object returned by the ImageViewer class
+        """
+        image = self.make_image(5, 8).resize((20, 7), Image.NEAREST)
+        full = "".join(row + "\n" for row in viewer.ansi_rows(image))
+
+        viewer.view_ansi(image)
+        assert ANSI(viewer.image_string).__pt_formatted_text__() == (
+            ANSI(full).__pt_formatted_text__()
+        )
+        assert len(viewer.image_string) < len(full)
+
+    def test_view_ansi_odd_height(self, viewer: ImageViewer) -> None:
+        """
+        Unit test for the last row of an image with an odd height
+
+        Args:
+            viewer: object returned by the ImageViewer class
+        """
+        image = self.make_image(4, 3)
+        rows = viewer.ansi_rows(image)
+        assert len(rows) == 2
+        assert rows[1] == "\x1b[49m" + "".join(
+            viewer.ansi_fg(*image.getpixel((x, 2))[:3]) + "▀" for x in range(4)
+        )
+
+    def test_coalesced_ansi_rows_tolerance(self, viewer: ImageViewer) -> None:
+        """
+        Unit test for snapping nearly identical colors into one run
+
+        Args:
+            viewer: object returned by the ImageViewer class
+        """
+        image = Image.new("RGB", (4, 2))
+        image.putdata([(100, 100, 100), (101, 100, 99)] * 4)
+        assert viewer.coalesced_ansi_rows(image, tolerance=5) == [
+            "\x1b[38;2;100;100;100;48;2;100;100;100m▄▄▄▄"
+        ]
+        assert len(viewer.coalesced_ansi_rows(image)[0]) > 40
+
+    def test_render_cache(self, tmp_path: Path) -> None:
+        """
+        Unit test for reusing and invalidating cached renders
+
+        Args:
+            tmp_path: temporary directory for the image and the cache
+        """
+        path = tmp_path.joinpath("image.png")
+        self.make_image(6, 4).save(path)
+        cache = RenderCache(tmp_path.joinpath("cache"))
+        viewer = ImageViewer(path, cache=cache)
+        params = viewer.render_params(viewer.window_box((80, 20)))
+
+        viewer.render((80, 20))
+        first = viewer.image_string
+        assert cache.load(path, params) is not None
+        viewer.render((80, 20))
+        assert viewer.image_string == first
+
+        Image.new("RGB", (6, 4), (255, 0, 0)).save(path)
+        os.utime(path, ns=(0, 0))
+        assert cache.load(path, params) is None
+        viewer.source = None
+        viewer.render((80, 20))
+        assert viewer.image_string != first
+        assert len(list(cache.cache_dir.glob("*.json"))) == 1
+
+    def test_render_cache_eviction(self, tmp_path: Path) -> None:
+        """
+        Unit test for removing the least recently used entries
+
+        Args:
+            tmp_path: temporary directory for the images and the cache
+        """
+        cache = RenderCache(tmp_path.joinpath("cache"))
+        paths = [tmp_path.joinpath("{}.png".format(i)) for i in range(3)]
+        for i, path in enumerate(paths):
+            path.touch()
+            cache.store(path, {}, {"image_string": "x" * 100})
+            os.utime(cache.entry_path(path, {}), ns=(i, i))
+
+        cache.load(paths[0], {})
+        cache.max_size = 250
+        cache.evict()
+        assert cache.load(paths[0], {}) is not None
+        assert cache.load(paths[1], {}) is None
+        assert cache.load(paths[2], {}) is not None
+
+        # The size is kept up to date by the stores without listing the cache
+        assert cache.size == 240
+        cache.max_size = 1000
+        cache.store(paths[1], {}, {"image_string": "x" * 100})
+        assert cache.size == 360
+        cache.store(paths[1], {}, {"image_string": "x" * 10})
+        assert cache.size == 270
+        # A store that makes the cache too large evicts
+        cache.max_size = 200
+        cache.store(paths[1], {}, {"image_string": "x" * 10})
+        sizes = [entry.stat().st_size for entry in cache.cache_dir.glob("*.json")]
+        assert cache.size == sum(sizes) <= 200
+
+    def test_open_thumbnail_strips(self, tmp_path: Path) -> None:
+        """
+        Unit test for shrinking an uncompressed image while reading it in strips
+
+        Args:
+            tmp_path: temporary directory for the image
+        """
+        path = tmp_path.joinpath("image.bmp")
+        image = self.make_image(301, 203).convert("RGB")
+        image.save(path)
+
+        tiles = decode.split_tiles(Image.open(path))
+        assert tiles is not None and len(tiles) == 1
+        decode.STRIP_BYTES, strip_bytes = 7000, decode.STRIP_BYTES
+        try:
+            tiles = decode.split_tiles(Image.open(path))
+            bands = decode.load_bands(path, tiles or [], image.width, "RGB", "RGB")
+            reduced = decode.reduce_bands(bands, image.size, 3, "RGB")
+        finally:
+            decode.STRIP_BYTES = strip_bytes
+        assert tiles is not None and len(tiles) > 1
+        assert reduced.tobytes() == image.reduce(3).tobytes()
+        assert decode.open_thumbnail(path, (20, 20)).width == 20
+
+    def test_gallery(self, tmp_path: Path) -> None:
+        """
+        Unit test for rendering the thumbnails of a directory in worker processes
+
+        Args:
+            tmp_path: temporary directory for the images and the cache
+        """
+        for i in range(3):
+            self.make_image(40 + i, 30).save(tmp_path.joinpath("{}.png".format(i)))
+        tmp_path.joinpath("broken.png").write_text("not an image")
+        tmp_path.joinpath("notes.txt").write_text("not an image either")
+
+        gallery = Gallery(
+            tmp_path, cell_size=(8, 4), cache=RenderCache(tmp_path / "cache")
+        )
+        assert [path.name for path in gallery.paths] == [
+            "0.png",
+            "1.png",
+            "2.png",
+            "broken.png",
+        ]
+        with ProcessPoolExecutor(max_workers=2) as executor:
+            gallery.feed(executor)
+        assert gallery.failed == {3}
+        assert sorted(gallery.cells) == [0, 1, 2]
+        assert len(gallery.cells[0]) == 3
+        assert fragment_list_width(gallery.cell_line(0, 0)) == 8
+
+        # Three thumbnails per page, the last page only has one
+        gallery.page = 1
+        gallery.update_page_range(3 * 8 + 2 * 2, 3 + 4 + 1)
+        assert list(gallery.page_range) == [3]
+        assert gallery.get_status().startswith("Page 2/2 |")
+
+    def test_frame_styles(self, viewer: ImageViewer) -> None:
+        """
+        Unit test checking that frame_styles matches the parsed ANSI output
+
+        Args:
+            viewer: object returned by the ImageViewer class
+        """
+        image = self.make_image(6, 5)
+        output = "".join(row + "\n" for row in viewer.ansi_rows(image))
+        parsed = ANSI(output).__pt_formatted_text__()
+        styles = [fragment[0] for fragment in parsed if fragment[1] in ("▄", "▀")]
+        assert sum(animation.frame_styles(image), []) == styles
+
+    def test_animation(self, tmp_path: Path) -> None:
+        """
+        Unit test for replaying an animation from the changes between frames
+
+        Args:
+            tmp_path: temporary directory for the image
+        """
+        path = tmp_path.joinpath("image.gif")
+        frames = [Image.new("RGB", (8, 5), (i * 60, 0, 0)) for i in range(4)]
+        for i, frame in enumerate(frames):
+            frame.putpixel((i, 0), (0, 255, 0))
+        frames[0].save(
+            path, save_all=True, append_images=frames[1:], duration=[50, 10, 70, 80]
+        )
+        assert animation.is_animated(path)
+
+        player = animation.Animation(path)
+        player.load_frames()
+        assert player.durations == [0.05, 0.1, 0.07, 0.08]
+        assert player.control is not None
+        for i in [1, 2, 3, 0, 1]:
+            player.control.apply(player.changes[i])
+            expected = animation.frame_styles(frames[i])
+            assert [
+                [fragment[0] for fragment in line] for line in player.control.lines
+            ] == expected
+        assert player.control.lines[-1][0][1] == "▀"
+
+    def test_show_resized(self, tmp_path: Path) -> None:
+        """
+        Unit test for rendering once per window size from the decoded source
+
+        Args:
+            tmp_path: temporary directory for the image and the cache
+        """
+        path = tmp_path.joinpath("image.png")
+        self.make_image(200, 100).save(path)
+        viewer = ImageViewer(path, cache=RenderCache(tmp_path.joinpath("cache")))
+        with mock.patch.object(viewer, "render", wraps=viewer.render) as render:
+            viewer.show((40, 10))
+            small = viewer.fragments
+            assert fragment_list_width(list(split_lines(small))[0]) == 40
+            viewer.show((80, 30))
+            assert fragment_list_width(list(split_lines(viewer.fragments))[0]) == 80
+            source = viewer.source
+            viewer.show((40, 10))
+        assert viewer.fragments is small
+        assert render.call_args_list == [mock.call((40, 10)), mock.call((80, 30))]
+        assert viewer.source is source
+
+    def test_indexed_ansi_rows(self, viewer: ImageViewer) -> None:
+        """
+        Unit test for the 256 and 16 color modes
+
+        Args:
+            viewer: object returned by the ImageViewer class
+        """
+        image = self.make_image(12, 7)
+        full = "".join(row + "\n" for row in viewer.ansi_rows(image))
+
+        quantized = palette.quantize(image, "ANSI256")
+        output = "".join(
+            row + "\n" for row in viewer.indexed_ansi_rows(quantized, "ANSI256")
+        )
+        styles = [
+            fragment[0]
+            for fragment in ANSI(output).__pt_formatted_text__()
+            if fragment[1] in ("▄", "▀")
+        ]
+        assert styles == sum(animation.frame_styles(quantized.convert("RGB")), [])
+        assert len(output) < len(full)
+
+        quantized = palette.quantize(image, "ANSI16", dither=True)
+        assert max(quantized.tobytes()) < 16
+        output = "".join(
+            row + "\n" for row in viewer.indexed_ansi_rows(quantized, "ANSI16")
+        )
+        assert "\x1b[38" not in output
+        assert all(
+            fragment[0].startswith("ansi")
+            for fragment in ANSI(output).__pt_formatted_text__()
+        )
+
+    def test_benchmark(self) -> None:
+        """Unit test running the benchmark suite on small images"""
+        results = benchmark.run_benchmarks(
+            sizes=[(64, 48)], formats=["PNG", "BMP"], window_size=(20, 10), repeat=1
+        )
+        json.dumps(results)
+        assert [image["name"] for image in results["images"]] == [
+            "64x48.png",
+            "64x48.bmp",
+        ]
+        stages = {stage["stage"]: stage for stage in results["images"][0]["stages"]}
+        assert list(stages) == [
+            "decode",
+            "thumbnail",
+            "view_ansi_ANSI",
+            "fragments_ANSI",
+            "view_ansi_ANSI256",
+            "fragments_ANSI256",
+            "view_ansi_ANSI16",
+            "fragments_ANSI16",
+            "view_ascii",
+        ]
+        assert stages["view_ansi_ANSI16"]["output_bytes"] < (
+            stages["view_ansi_ANSI"]["output_bytes"]
+        )
+        assert len(benchmark.compare(results, results)) == 18